@@ -1,15 +1,30 @@
 from django.contrib import admin
-from .models import Blog, BlogView
+from .models import Blog, BlogView, Country
+
+@admin.register(Country)
+class CountryAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+
+    # Every process caches name <-> id pairs (analytics.countries); a rename
+    # or delete here would leave the other workers mislabelling views.
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 @admin.register(Blog)
 class BlogAdmin(admin.ModelAdmin):
     list_display = ('title', 'author', 'country', 'created_at')
     list_filter = ('country', 'created_at')
+    list_select_related = ('author', 'country')
     search_fields = ('title', 'content', 'author__username')
 
 @admin.register(BlogView)
 class BlogViewAdmin(admin.ModelAdmin):
     list_display = ('blog', 'viewer', 'viewer_country', 'viewed_at')
     list_filter = ('viewer_country', 'viewed_at')
+    list_select_related = ('blog', 'viewer', 'viewer_country')
     search_fields = ('blog__title', 'viewer__username', 'ip_address')
-    date_hierarchy = 'viewed_at'
\ No newline at end of file
+    date_hierarchy = 'viewed_at'
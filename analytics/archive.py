@@ -0,0 +1,162 @@
+import os
+import re
+from datetime import date, datetime, time, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from analytics import countries
+from .models import BlogView
+
+SEGMENT_NAME = re.compile(r'^views-(\d{4})-(\d{2})\.seg$')
+
+
+def archive_dir():
+    return str(getattr(settings, 'ANALYTICS_ARCHIVE_DIR', settings.BASE_DIR / 'archive'))
+
+
+def segment_path(month):
+    return os.path.join(archive_dir(), f"views-{month:%Y-%m}.seg")
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def archived_months():
+    """First days of the months that have a cold segment, oldest first"""
+    try:
+        names = os.listdir(archive_dir())
+    except FileNotFoundError:
+        return []
+    months = []
+    for name in names:
+        match = SEGMENT_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def version():
+    """Changes whenever a segment is written or replaced"""
+    return tuple(
+        (month, os.stat(segment_path(month)).st_mtime_ns) for month in archived_months()
+    )
+
+
+def first_hot_day():
+    """First day after the newest archived month, or None when nothing is archived"""
+    months = archived_months()
+    return next_month(months[-1]) if months else None
+
+
+def reaches(start_date):
+    """True when a query from ``start_date`` (None for unbounded) needs archived views"""
+    first_hot = first_hot_day()
+    return first_hot is not None and (start_date is None or start_date < first_hot)
+
+
+def hot_range(start_date=None, end_date=None):
+    """Clamp a day range to the days still held in BlogView; None when it is entirely archived"""
+    first_hot = first_hot_day()
+    if first_hot is None or (start_date is not None and start_date >= first_hot):
+        return start_date, end_date
+    if end_date is not None and end_date < first_hot:
+        return None
+    return first_hot, end_date
+
+
+def open_segments():
+    from analytics.columnar import Segment
+    return [Segment(segment_path(month)) for month in archived_months()]
+
+
+def horizon(retention_days):
+    """First day of the oldest month that stays hot: the month containing today - retention_days"""
+    return month_start(timezone.localdate() - timedelta(days=retention_days))
+
+
+def archive_month(month, chunk_size=100000):
+    """Move the views of one month from BlogView into its segment and return how many moved
+
+    The segment is written to a temporary file and renamed into place inside
+    the transaction that deletes the rows, so a failure leaves the views in
+    the table. A month that already has a segment is merged with it into a
+    new file.
+    """
+    from analytics import columnar
+    import numpy as np
+
+    start, end = local_midnight(month), local_midnight(next_month(month))
+    blog = columnar.GrowableColumn(np.int64)
+    viewer = columnar.GrowableColumn(np.int64)
+    country = columnar.GrowableColumn(np.int32)
+    viewed_at = columnar.GrowableColumn(np.int64)
+    country_names = columnar.Dictionary()
+
+    path = segment_path(month)
+    if os.path.exists(path):
+        existing = columnar.Segment(path)
+        codes = country_names.encode(existing.countries)
+        blog.extend(existing.blog)
+        viewer.extend(existing.viewer)
+        country.extend(codes[existing.country])
+        viewed_at.extend(existing.viewed_at)
+
+    with transaction.atomic():
+        rows = (
+            BlogView.objects.filter(viewed_at__gte=start, viewed_at__lt=end).order_by('id')
+            .values_list('id', 'blog_id', 'viewer_id', 'viewer_country', 'viewed_at')
+        )
+        moved, last_id = 0, 0
+        while True:
+            chunk = list(rows.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            ids, blogs, viewers, country_ids, times = zip(*chunk)
+            names = countries.get_names(country_ids)
+            blog.extend(blogs)
+            viewer.extend([viewer_id or 0 for viewer_id in viewers])
+            country.extend(country_names.encode([names[country_id] for country_id in country_ids]))
+            viewed_at.extend([columnar.to_epoch_us(value) for value in times])
+            # Deleted a chunk at a time, since the delete signals load every row.
+            BlogView.objects.filter(viewed_at__gte=start, viewed_at__lt=end, id__gt=last_id, id__lte=ids[-1]).delete()
+            moved += len(chunk)
+            last_id = ids[-1]
+        if not moved:
+            return 0
+
+        os.makedirs(archive_dir(), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        try:
+            columnar.write_segment(temporary, month, blog.view(), viewer.view(), country_names.values,
+                                   country.view(), viewed_at.view())
+            os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+    return moved
+
+
+def archive_before(before, chunk_size=100000, log=None):
+    """Archive every month that ends on or before ``before`` (a first of the month); returns views moved"""
+    oldest = BlogView.objects.filter(viewed_at__lt=local_midnight(before)).aggregate(oldest=Min('viewed_at'))['oldest']
+    if oldest is None:
+        return 0
+    moved = 0
+    month = month_start(timezone.localdate(oldest))
+    while month < before:
+        count = archive_month(month, chunk_size)
+        if log:
+            log(month, count)
+        moved += count
+        month = next_month(month)
+    return moved
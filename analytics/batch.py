@@ -0,0 +1,146 @@
+import json
+from collections import defaultdict
+from datetime import timedelta
+from django.db.models import F
+from django.db.models.functions import TruncDate
+from analytics import countries, encoding
+from analytics.cache import canonical_filters
+from analytics.utils import parse_date
+from .models import Blog
+
+ENDPOINTS = ['blog-views', 'top', 'performance']
+
+# Parameter values a spec may use to be answered from a shared scan. Specs
+# with anything else (approx, engine=columnar, mode=realtime, limit, cursor,
+# explain, ...) are run through their endpoint on their own.
+SHARED_CHOICES = {
+    'blog-views': {
+        'object_type': {'country', 'user'},
+        'range': {'day', 'week', 'month', 'year'},
+        'engine': {'orm'},
+    },
+    'top': {
+        'top': {'blog', 'user', 'country'},
+        'mode': {'exact'},
+        'engine': {'orm'},
+    },
+}
+
+GROUP_PARAMS = {'start_date', 'end_date', 'filters', 'logic'}
+
+PERIOD_STARTS = {
+    'day': lambda day: day,
+    'week': lambda day: day - timedelta(days=day.weekday()),
+    'month': lambda day: day.replace(day=1),
+    'year': lambda day: day.replace(month=1, day=1),
+}
+
+
+def query_params(spec):
+    """String query parameters for a spec given as JSON; filters may be a list instead of a JSON string"""
+    params = {}
+    for name, value in spec.items():
+        if name == 'endpoint' or value is None:
+            continue
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif isinstance(value, (list, dict)):
+            value = json.dumps(value)
+        params[name] = str(value)
+    return params
+
+
+def scan_key(endpoint, params):
+    """Key shared by every spec that reads the same views, or None when the spec must run on its own"""
+    choices = SHARED_CHOICES.get(endpoint)
+    if choices is None:
+        return None
+    for name, value in params.items():
+        if name not in GROUP_PARAMS and value not in choices.get(name, ()):
+            return None
+    start_date, end_date = parse_date(params.get('start_date')), parse_date(params.get('end_date'))
+    if 'invalid' in (start_date, end_date):
+        return None
+    logic = 'or' if params.get('logic', 'and').lower() == 'or' else 'and'
+    return start_date, end_date, tuple(canonical_filters(params.get('filters'))), logic
+
+
+class SharedScan:
+    """Views of one date range and filter set, read once at day x blog x country x viewer grain
+
+    Every blog-views and top result for that range and filter set is
+    aggregated from these rows in Python, ordered as the endpoints order
+    them, so a dashboard's calls cost one scan instead of one each.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def load(cls, blog_views, date_field, views_agg, max_rows):
+        """Read ``blog_views`` (the endpoints' source queryset) grouped down to the shared grain
+
+        Returns None when there are more than ``max_rows`` rows at that
+        grain; the specs are then cheaper to aggregate in the database one by one.
+        """
+        day = F(date_field) if date_field == 'day' else TruncDate(date_field)
+        rows = list(
+            blog_views.annotate(scan_day=day)
+            .values_list('scan_day', 'blog_id', 'viewer_country', 'viewer_id', 'viewer__username')
+            .annotate(scan_views=views_agg)
+            .order_by()[:max_rows + 1]
+        )
+        if len(rows) > max_rows:
+            return None
+        return cls(rows)
+
+    def blog_views_rows(self, object_type, range_type):
+        """{x, y, z} rows for /analytics/blog-views/"""
+        period_start = PERIOD_STARTS[range_type]
+        groups = defaultdict(lambda: [set(), 0])
+        for day, blog_id, country_id, _, username, views in self.rows:
+            group = groups[period_start(day), country_id if object_type == 'country' else username]
+            group[0].add(blog_id)
+            group[1] += views
+
+        if object_type == 'country':
+            names = countries.get_names(key for _, key in groups)
+            labelled = [(period, names[key], group) for (period, key), group in groups.items()]
+        else:
+            labelled = [(period, key, group) for (period, key), group in groups.items()]
+        labelled.sort(key=lambda item: (item[0], countries.sort_key(item[1])))
+        return encoding.blog_views_rows((period, label, len(blogs), views) for period, label, (blogs, views) in labelled)
+
+    def top_rows(self, top_type, limit=10):
+        """Ranked {rank, x, y, z} rows for /analytics/top/"""
+        totals = defaultdict(int)
+        distinct = defaultdict(set)
+        for _, blog_id, country_id, viewer_id, username, views in self.rows:
+            if top_type == 'blog':
+                key, other = blog_id, viewer_id
+            elif top_type == 'user':
+                key, other = username, blog_id
+            else:
+                key, other = country_id, viewer_id
+            if key is None and top_type != 'blog':
+                continue
+            totals[key] += views
+            if other is not None:
+                distinct[key].add(other)
+
+        if top_type == 'user':
+            order = lambda key: (-totals[key], countries.sort_key(key))
+        else:
+            order = lambda key: (-totals[key], key)
+        keys = sorted(totals, key=order)[:limit]
+
+        if top_type == 'blog':
+            titles = dict(Blog.objects.filter(id__in=keys).values_list('id', 'title'))
+            labels = {key: titles.get(key) or f"Blog {key}" for key in keys}
+        elif top_type == 'user':
+            labels = {key: key or "Anonymous" for key in keys}
+        else:
+            names = countries.get_names(keys)
+            labels = {key: names[key] or "Unknown" for key in keys}
+        return [{"rank": i+1, "x": labels[key], "y": totals[key], "z": len(distinct[key])}
+                for i, key in enumerate(keys)]
@@ -0,0 +1,314 @@
+import asyncio
+import json
+import platform
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django import get_version
+from django.conf import settings
+from django.db import connection
+from django.test import AsyncClient, Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings, setup_databases, teardown_databases
+from django.urls import resolve
+from django.utils import timezone
+from analytics import counters, countries, profiling, rollups, sketches, synthetic
+from analytics.utils import AnalyticsQueryBuilder
+from .models import Blog
+
+RANGES = ['day', 'week', 'month', 'year']
+
+# Filter sets for the BlogView-based endpoints: no filter, ones the rollups can
+# answer, one that forces the raw table, and OR logic.
+VIEW_FILTERS = {
+    'none': {},
+    'country': {'filters': [{'field': 'viewer_country', 'operator': 'eq', 'value': 'USA'}]},
+    'blog-country': {'filters': [{'field': 'blog__country', 'operator': 'eq', 'value': 'India'}]},
+    'raw-viewed-at': {'filters': [{'field': 'viewed_at', 'operator': 'gte', 'value': '2000-01-01'}]},
+    'or-countries': {'filters': [{'field': 'viewer_country', 'operator': 'eq', 'value': 'USA'},
+                                 {'field': 'viewer_country', 'operator': 'eq', 'value': 'UK'}], 'logic': 'or'},
+    'window-90d': {'window': 90},
+}
+
+# PerformanceAnalyticsAPI filters select blogs, so it gets its own variants.
+PERFORMANCE_VARIANTS = {
+    'none': {},
+    'author': {'author': True},
+    'window-90d': {'window': 90},
+}
+
+SCAN_NODES = {'Seq Scan', 'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan'}
+
+
+def build_cases():
+    """[(case id, path, params, variant)] for every endpoint and parameter combination"""
+    cases = []
+    for object_type in ['country', 'user']:
+        for range_type in RANGES:
+            for name, variant in VIEW_FILTERS.items():
+                params = {'object_type': object_type, 'range': range_type}
+                cases.append((f"blog-views/{object_type}/{range_type}/{name}", '/analytics/blog-views/', params, variant))
+    for top_type in ['blog', 'user', 'country']:
+        for name, variant in VIEW_FILTERS.items():
+            cases.append((f"top/{top_type}/{name}", '/analytics/top/', {'top': top_type}, variant))
+    for top_type in ['blog', 'country']:
+        cases.append((f"top/{top_type}/approx", '/analytics/top/', {'top': top_type, 'approx': 'true'}, {}))
+    for compare_type in RANGES:
+        for name, variant in PERFORMANCE_VARIANTS.items():
+            cases.append((f"performance/{compare_type}/{name}", '/analytics/performance/',
+                          {'compare': compare_type}, variant))
+    return cases
+
+
+def resolve_params(params, variant, context):
+    params = dict(params)
+    if 'filters' in variant:
+        params['filters'] = json.dumps(variant['filters'])
+    if 'logic' in variant:
+        params['logic'] = variant['logic']
+    if 'window' in variant:
+        today = timezone.localdate()
+        params['start_date'] = (today - timedelta(days=variant['window'])).isoformat()
+        params['end_date'] = today.isoformat()
+    if variant.get('author'):
+        params['user_id'] = context['author_id']
+    return params
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def rows_scanned(queries):
+    """Rows read by table and index scans, from EXPLAIN ANALYZE on PostgreSQL; None elsewhere"""
+    if connection.vendor != 'postgresql':
+        return None
+
+    def walk(node):
+        rows = node.get('Actual Rows', 0) * node.get('Actual Loops', 1) if node.get('Node Type') in SCAN_NODES else 0
+        return rows + sum(walk(child) for child in node.get('Plans', []))
+
+    total = 0
+    with connection.cursor() as cursor:
+        for query in queries:
+            if not query['sql'].lstrip().upper().startswith('SELECT'):
+                continue
+            cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {query['sql']}")
+            plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            total += walk(plan[0]['Plan'])
+    return total
+
+
+def profile_case(path, params):
+    """(status code, query report) for one GET to an analytics endpoint"""
+    view = resolve(path).func
+    with profiling.capture() as profile:
+        response = view(RequestFactory().get(path, params))
+        response.render()
+    return response.status_code, profile.report()
+
+
+def run_case(path, params, repeat, warmup):
+    view = resolve(path).func
+    factory = RequestFactory()
+
+    def call():
+        response = view(factory.get(path, params))
+        response.render()
+        return response
+
+    for _ in range(warmup):
+        call()
+    with CaptureQueriesContext(connection) as captured:
+        response = call()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    data = json.loads(response.content)
+    return {
+        'path': path,
+        'params': params,
+        'status': response.status_code,
+        'rows': len(data) if isinstance(data, list) else None,
+        'queries': len(captured.captured_queries),
+        'rows_scanned': rows_scanned(captured.captured_queries),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p90_ms': round(percentile(timings, 90), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def run_dataset(views, seed, repeat, warmup, cases, log=None):
+    """Benchmark every case against a fresh test database holding ``views`` synthetic views"""
+    old_config = setup_databases(verbosity=0, interactive=False)
+    countries.clear_cache()
+    AnalyticsQueryBuilder.clear_plan_cache()
+    try:
+        started = time.monotonic()
+        synthetic.generate(users=max(10, views // 1000), blogs=max(10, views // 5000), views=views, seed=seed)
+        rollups.rebuild()
+        sketches.rebuild()
+        counters.repair()
+        setup_seconds = time.monotonic() - started
+
+        context = {'author_id': Blog.objects.order_by('id').values_list('author_id', flat=True).first()}
+        results = {}
+        with override_settings(ANALYTICS_CACHE_ENABLED=False):
+            for case_id, path, params, variant in cases:
+                results[case_id] = run_case(path, resolve_params(params, variant, context), repeat, warmup)
+                if log:
+                    log(views, case_id, results[case_id])
+        return {'views': views, 'setup_seconds': round(setup_seconds, 3), 'cases': results}
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+def run(sizes, seed=1, repeat=10, warmup=1, case_filter=None, log=None):
+    cases = [case for case in build_cases() if not case_filter or case_filter in case[0]]
+    return {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'vendor': connection.vendor,
+            'django': get_version(),
+            'python': platform.python_version(),
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'datasets': {str(views): run_dataset(views, seed, repeat, warmup, cases, log) for views in sizes},
+    }
+
+
+def compare(current, baseline, tolerance=0.25, min_delta_ms=2.0):
+    """Regressions of ``current`` against ``baseline`` as human-readable strings
+
+    A case regresses when it issues more queries or scans more rows, or when
+    its p50 is more than ``tolerance`` slower and at least ``min_delta_ms``
+    slower, which keeps timer noise on fast cases from failing a run.
+    """
+    regressions = []
+    for size, dataset in current['datasets'].items():
+        base_cases = baseline.get('datasets', {}).get(size, {}).get('cases', {})
+        for case_id, result in dataset['cases'].items():
+            base = base_cases.get(case_id)
+            if base is None:
+                continue
+            label = f"{size} views {case_id}"
+            if result['queries'] > base['queries']:
+                regressions.append(f"{label}: queries {base['queries']} -> {result['queries']}")
+            if result['rows_scanned'] is not None and base.get('rows_scanned') is not None \
+                    and result['rows_scanned'] > base['rows_scanned'] * (1 + tolerance):
+                regressions.append(f"{label}: rows scanned {base['rows_scanned']} -> {result['rows_scanned']}")
+            slower = result['p50_ms'] - base['p50_ms']
+            if slower >= min_delta_ms and result['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+                regressions.append(f"{label}: p50 {base['p50_ms']}ms -> {result['p50_ms']}ms")
+    return regressions
+
+
+def async_path(path):
+    return path.replace('/analytics/', '/analytics/async/', 1)
+
+
+def load_summary(latencies, failures, seconds):
+    return {
+        'requests': len(latencies),
+        'failures': failures,
+        'seconds': round(seconds, 3),
+        'throughput': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+    }
+
+
+def run_wsgi_load(requests, concurrency):
+    """Throughput of the sync views with ``concurrency`` threads, as under a threaded WSGI server"""
+    local = threading.local()
+
+    def call(request):
+        path, params = request
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        started = time.perf_counter()
+        response = local.client.get(path, params)
+        return (time.perf_counter() - started) * 1000, response.status_code != 200
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(call, requests))
+    seconds = time.perf_counter() - started
+    return load_summary([latency for latency, _ in outcomes], sum(failed for _, failed in outcomes), seconds)
+
+
+def run_asgi_load(requests, concurrency, async_views=True):
+    """Throughput under ASGI with ``concurrency`` requests in flight on one event loop
+
+    With ``async_views`` unset the sync views are served, which Django runs
+    on a single thread.
+    """
+    async def load():
+        client = AsyncClient()
+        pending = iter(requests)
+        outcomes = []
+
+        async def worker():
+            for path, params in pending:
+                started = time.perf_counter()
+                response = await client.get(async_path(path) if async_views else path, params)
+                outcomes.append(((time.perf_counter() - started) * 1000, response.status_code != 200))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return outcomes
+
+    started = time.perf_counter()
+    outcomes = asyncio.run(load())
+    seconds = time.perf_counter() - started
+    return load_summary([latency for latency, _ in outcomes], sum(failed for _, failed in outcomes), seconds)
+
+
+def run_load(views, seed, levels, requests, cases, log=None):
+    """WSGI vs ASGI throughput at each concurrency level, cycling through ``cases`` on a fresh test database"""
+    old_config = setup_databases(verbosity=0, interactive=False)
+    countries.clear_cache()
+    AnalyticsQueryBuilder.clear_plan_cache()
+    try:
+        synthetic.generate(users=max(10, views // 1000), blogs=max(10, views // 5000), views=views, seed=seed)
+        rollups.rebuild()
+        sketches.rebuild()
+        counters.repair()
+
+        context = {'author_id': Blog.objects.order_by('id').values_list('author_id', flat=True).first()}
+        catalogue = [(path, resolve_params(params, variant, context)) for _, path, params, variant in cases]
+        batch = [catalogue[i % len(catalogue)] for i in range(requests)]
+        results = {}
+        with override_settings(ANALYTICS_CACHE_ENABLED=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            # One untimed pass so that plan caches, checkpoints and pools are warm on both paths.
+            run_wsgi_load(catalogue, 1)
+            run_asgi_load(catalogue, 1)
+            for concurrency in levels:
+                results[str(concurrency)] = {
+                    'wsgi': run_wsgi_load(batch, concurrency),
+                    'asgi': run_asgi_load(batch, concurrency),
+                    'asgi_sync_views': run_asgi_load(batch, concurrency, async_views=False),
+                }
+                if log:
+                    log(concurrency, results[str(concurrency)])
+        return {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'vendor': connection.vendor,
+                'views': views,
+                'seed': seed,
+                'requests': requests,
+            },
+            'levels': results,
+        }
+    finally:
+        teardown_databases(old_config, verbosity=0)
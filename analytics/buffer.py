@@ -0,0 +1,167 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.db import close_old_connections
+from . import ingestion
+
+logger = logging.getLogger(__name__)
+
+
+class BufferFull(Exception):
+    """Raised when the buffer stays at capacity for longer than the put timeout"""
+
+
+class IngestionBuffer:
+    """Bounded in-process write-behind queue for single view events
+
+    ``put`` only appends to memory; a background thread drains the queue
+    through ``ingestion.store_parsed_events`` whenever ``flush_size`` events
+    are waiting or the oldest one is ``flush_interval`` seconds old. Events
+    still queued when the process dies without ``shutdown`` are lost.
+    """
+
+    def __init__(self, max_size=100000, flush_size=5000, flush_interval=1.0, put_timeout=0.05):
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._reset()
+
+    def _reset(self):
+        self._events = deque()
+        self._oldest_at = None
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._has_work = threading.Condition(self._lock)
+        self._closed = False
+        self._thread = None
+        self._pid = os.getpid()
+        self.counters = {'enqueued': 0, 'stored': 0, 'rejected': 0, 'duplicates': 0, 'failed': 0, 'refused': 0, 'flushes': 0}
+
+    def put(self, fields, timeout=None):
+        """Queue parsed BlogView fields, blocking up to ``timeout`` seconds while the buffer is full"""
+        if self._pid != os.getpid():
+            # Forked worker: the parent's thread and queue did not come along.
+            self._reset()
+
+        timeout = self.put_timeout if timeout is None else timeout
+        with self._lock:
+            if self._closed:
+                self.counters['refused'] += 1
+                raise BufferFull("Ingestion buffer is shut down")
+            if self._thread is None:
+                self._start()
+            if len(self._events) >= self.max_size:
+                deadline = time.monotonic() + timeout
+                while len(self._events) >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._closed:
+                        self.counters['refused'] += 1
+                        raise BufferFull("Ingestion buffer is full")
+                    self._not_full.wait(remaining)
+
+            if not self._events:
+                self._oldest_at = time.monotonic()
+            self._events.append(fields)
+            self.counters['enqueued'] += 1
+            # The flusher sleeps without a deadline while the queue is empty, so
+            # the first event wakes it to start the flush_interval clock.
+            if len(self._events) == 1 or len(self._events) >= self.flush_size:
+                self._has_work.notify()
+
+    def __len__(self):
+        return len(self._events)
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='analytics-ingestion-buffer', daemon=True)
+        self._thread.start()
+
+    def _take_batch(self):
+        batch = [self._events.popleft() for _ in range(min(self.flush_size, len(self._events)))]
+        self._oldest_at = time.monotonic() if self._events else None
+        self._not_full.notify_all()
+        return batch
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._closed:
+                    if len(self._events) >= self.flush_size:
+                        break
+                    if self._events:
+                        wait = self._oldest_at + self.flush_interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._has_work.wait(wait)
+                if self._closed:
+                    return
+                batch = self._take_batch()
+            self._write(batch)
+
+    def _write(self, batch):
+        close_old_connections()
+        stored = rejected = duplicates = failed = 0
+        try:
+            report = ingestion.store_parsed_events(list(enumerate(batch)))
+            stored, rejected, duplicates = report.accepted, report.rejected, report.duplicates
+        except Exception:
+            logger.exception("Failed to flush %d buffered views", len(batch))
+            failed = len(batch)
+        finally:
+            close_old_connections()
+
+        with self._lock:
+            self.counters['stored'] += stored
+            self.counters['rejected'] += rejected
+            self.counters['duplicates'] += duplicates
+            self.counters['failed'] += failed
+            self.counters['flushes'] += 1
+
+    def flush(self):
+        """Synchronously write everything currently queued"""
+        while True:
+            with self._lock:
+                if not self._events:
+                    return
+                batch = self._take_batch()
+            self._write(batch)
+
+    def shutdown(self, timeout=10):
+        """Stop the flusher thread and write whatever is left"""
+        with self._lock:
+            self._closed = True
+            self._has_work.notify_all()
+            self._not_full.notify_all()
+            thread = self._thread
+        if thread is not None and self._pid == os.getpid():
+            thread.join(timeout)
+        self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = IngestionBuffer(
+                    max_size=getattr(settings, 'ANALYTICS_BUFFER_MAX_EVENTS', 100000),
+                    flush_size=getattr(settings, 'ANALYTICS_BUFFER_FLUSH_EVENTS', 5000),
+                    flush_interval=getattr(settings, 'ANALYTICS_BUFFER_FLUSH_INTERVAL', 1.0),
+                    put_timeout=getattr(settings, 'ANALYTICS_BUFFER_PUT_TIMEOUT', 0.05),
+                )
+    return _buffer
+
+
+def shutdown_buffer():
+    if _buffer is not None:
+        _buffer.shutdown()
+
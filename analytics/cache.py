@@ -0,0 +1,204 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.response import Response
+from analytics.utils import AnalyticsQueryBuilder, parse_bool, parse_date
+
+# Parameter defaults per endpoint, so "?range=month" and "" share an entry.
+ENDPOINT_DEFAULTS = {
+    'blog-views': {'object_type': 'country', 'range': 'month', 'logic': 'and'},
+    'top': {'top': 'blog', 'logic': 'and'},
+    'performance': {'compare': 'month', 'logic': 'and'},
+}
+
+# The parameter whose value selects a per-range TTL for each endpoint.
+RANGE_PARAMS = {'blog-views': 'range', 'performance': 'compare'}
+
+DATE_PARAMS = ('start_date', 'end_date')
+
+
+def canonical_filters(filters_json):
+    """Filters as an order-independent list of JSON strings with explicit default operators"""
+    canonical = []
+    for filter_item in AnalyticsQueryBuilder.parse_filters_string(filters_json):
+        if isinstance(filter_item, dict) and filter_item.get('field'):
+            filter_item = {'operator': 'eq', **filter_item}
+            canonical.append(json.dumps(filter_item, sort_keys=True, default=str))
+    return sorted(canonical)
+
+
+def normalize_query(endpoint, query_params):
+    """Return (params, start_date, end_date) in canonical form for an analytics request"""
+    params = dict(ENDPOINT_DEFAULTS.get(endpoint, {}))
+    for name, value in query_params.items():
+        if name not in DATE_PARAMS and name != 'filters' and value != '':
+            params[name] = value
+    if 'logic' in params:
+        params['logic'] = params['logic'].lower()
+    filters = canonical_filters(query_params.get('filters'))
+    if filters:
+        params['filters'] = filters
+    return params, parse_date(query_params.get('start_date')), parse_date(query_params.get('end_date'))
+
+
+def cache_key(endpoint, params, start_date, end_date):
+    raw = json.dumps([endpoint, sorted(params.items()), str(start_date), str(end_date)], default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class CacheEntry:
+    __slots__ = ('payload', 'size', 'expires_at', 'start_date', 'end_date')
+
+    def __init__(self, payload, size, expires_at, start_date, end_date):
+        self.payload = payload
+        self.size = size
+        self.expires_at = expires_at
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def covers(self, first_day, last_day):
+        return ((self.start_date is None or self.start_date <= last_day)
+                and (self.end_date is None or self.end_date >= first_day))
+
+
+class ResponseCache:
+    """In-process LRU cache of analytics payloads, bounded by their JSON size
+
+    ``generation`` moves on every invalidation; a payload computed before an
+    invalidation is not stored, so a slow request cannot resurrect stale data.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.payload
+
+    def set(self, key, payload, ttl, start_date, end_date, generation):
+        size = len(json.dumps(payload, default=str))
+        if size > self.max_bytes:
+            return
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CacheEntry(payload, size, expires_at, start_date, end_date)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.bytes -= self._entries.pop(key).size
+
+    def invalidate_days(self, first_day, last_day):
+        """Drop every entry whose date range overlaps [first_day, last_day]"""
+        with self._lock:
+            self.generation += 1
+            stale = [key for key, entry in self._entries.items() if entry.covers(first_day, last_day)]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(getattr(settings, 'ANALYTICS_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    return _cache
+
+
+def get_ttl(endpoint, params, end_date):
+    """Seconds to keep a payload
+
+    Closed periods still change through other processes (other workers,
+    generate_analytics_data, rebuild_rollups, archive_views) whose writes
+    this process never sees, so they get a longer but finite TTL.
+    """
+    if end_date and end_date < timezone.localdate():
+        return getattr(settings, 'ANALYTICS_CACHE_CLOSED_TTL', 3600)
+    ttl = getattr(settings, 'ANALYTICS_CACHE_TTLS', {}).get(endpoint, 60)
+    if isinstance(ttl, dict):
+        ttl = ttl.get(params.get(RANGE_PARAMS.get(endpoint)), ttl.get('default', 60))
+    return ttl
+
+
+def cached_response(endpoint):
+    """Serve an APIView.get from the response cache, keyed on the normalized query"""
+    def decorator(get):
+        @wraps(get)
+        def wrapper(self, request, *args, **kwargs):
+            if not getattr(settings, 'ANALYTICS_CACHE_ENABLED', True) or parse_bool(request.GET.get('explain')):
+                return get(self, request, *args, **kwargs)
+
+            params, start_date, end_date = normalize_query(endpoint, request.GET)
+            if 'invalid' in (start_date, end_date):
+                return get(self, request, *args, **kwargs)
+
+            cache = get_response_cache()
+            key = cache_key(endpoint, params, start_date, end_date)
+            payload = cache.get(key)
+            if payload is not None:
+                return Response(payload, headers={'X-Cache': 'HIT'})
+
+            generation = cache.generation
+            response = get(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                payload = list(response.data) if isinstance(response.data, list) else response.data
+                cache.set(key, payload, get_ttl(endpoint, params, end_date), start_date, end_date, generation)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,547 @@
+import json
+import os
+import threading
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from analytics import archive, countries
+from analytics.utils import AnalyticsCalculator, FilterError
+from .models import Blog, BlogView
+
+User = get_user_model()
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+# Above this many group x value cells distinct counts sort instead of using a bitmap.
+BITMAP_CELLS = 1 << 25
+# Above this many possible groups, only the groups that occur are numbered.
+DENSE_GROUPS = 1 << 22
+
+
+def to_epoch_us(value):
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return (value - EPOCH) // MICROSECOND
+
+
+def from_epoch_us(epoch_us):
+    return EPOCH + timedelta(microseconds=int(epoch_us))
+
+
+def local_date(epoch_us):
+    return timezone.localtime(from_epoch_us(epoch_us)).date()
+
+
+def day_start_us(day):
+    return to_epoch_us(datetime.combine(day, time.min))
+
+
+def period_start(day, period):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    if period == 'year':
+        return day.replace(month=1, day=1)
+    return day
+
+
+def next_period(day, period):
+    if period == 'week':
+        return day + timedelta(days=7)
+    if period == 'month':
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    if period == 'year':
+        return date(day.year + 1, 1, 1)
+    return day + timedelta(days=1)
+
+
+def calendar(first_day, last_day, period):
+    """Period start dates from the period containing first_day to the one containing last_day"""
+    days = []
+    day, last = period_start(first_day, period), period_start(last_day, period)
+    while day <= last:
+        days.append(day)
+        day = next_period(day, period)
+    return days
+
+
+def period_index(timestamps, days):
+    """Index into ``days`` (period starts) of the period each timestamp falls in"""
+    bounds = np.array([day_start_us(day) for day in days], dtype=np.int64)
+    return np.searchsorted(bounds, timestamps, side='right') - 1
+
+
+def distinct_counts(groups, values, n_groups, n_values):
+    """Distinct values per group, for dense integer group and value codes"""
+    if not len(groups):
+        return np.zeros(n_groups, dtype=np.int64)
+    pairs = groups.astype(np.int64) * n_values + values
+    if n_groups * n_values <= BITMAP_CELLS:
+        seen = np.zeros(n_groups * n_values, dtype=bool)
+        seen[pairs] = True
+        return seen.reshape(n_groups, n_values).sum(axis=1)
+    return np.bincount(np.unique(pairs) // n_values, minlength=n_groups)
+
+
+class GrowableColumn:
+    """A NumPy array with amortised O(1) appends"""
+
+    def __init__(self, dtype):
+        self.data = np.empty(1024, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            grown = np.empty(max(needed, 2 * len(self.data)), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+    def view(self):
+        return self.data[:self.size]
+
+
+class Dictionary:
+    """Dense integer codes for the values of one column; code 0 is NULL"""
+
+    def __init__(self):
+        self.values = [None]
+        self.codes = {None: 0}
+
+    def encode(self, values):
+        return np.fromiter((self._code(value) for value in values), dtype=np.int32, count=len(values))
+
+    def encode_array(self, values, null=0):
+        """Codes for an integer array in which ``null`` stands for NULL, one dictionary lookup per distinct value"""
+        uniques, inverse = np.unique(values, return_inverse=True)
+        codes = np.fromiter((self._code(None if value == null else value) for value in uniques.tolist()),
+                            dtype=np.int32, count=len(uniques))
+        return codes[inverse]
+
+    def _code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+SEGMENT_MAGIC = b'BVSEG1\0\0'
+SEGMENT_ALIGN = 8
+
+
+def narrow_dtype(values):
+    """Smallest unsigned dtype that holds every value of a non-negative integer array"""
+    return np.min_scalar_type(int(values.max()) if len(values) else 0)
+
+
+def write_segment(path, month, blog, viewer, countries, country, viewed_at):
+    """Write one immutable cold segment file
+
+    ``blog`` and ``viewer`` are raw ids (viewer 0 for anonymous), ``country``
+    indexes into ``countries`` (0 is NULL) and ``viewed_at`` is epoch
+    microseconds. Rows are stored sorted by time, ids and country codes in the
+    narrowest dtype that fits, and every column 8-byte aligned so that
+    Segment can memory-map it.
+    """
+    order = np.argsort(viewed_at, kind='stable')
+    columns = {
+        'blog': blog[order].astype(narrow_dtype(blog)),
+        'viewer': viewer[order].astype(narrow_dtype(viewer)),
+        'country': country[order].astype(np.min_scalar_type(len(countries))),
+        'viewed_at': viewed_at[order].astype('<i8'),
+    }
+    header = {'month': month.isoformat(), 'rows': len(order), 'countries': list(countries), 'columns': []}
+    offset = 0
+    for name, values in columns.items():
+        header['columns'].append({'name': name, 'dtype': values.dtype.str, 'offset': offset})
+        offset += -(-values.nbytes // SEGMENT_ALIGN) * SEGMENT_ALIGN
+    encoded = json.dumps(header).encode()
+    encoded += b' ' * (-len(encoded) % SEGMENT_ALIGN)
+
+    with open(path, 'wb') as f:
+        f.write(SEGMENT_MAGIC)
+        f.write(np.uint64(len(encoded)).tobytes())
+        f.write(encoded)
+        for values in columns.values():
+            f.write(values.tobytes())
+            f.write(b'\0' * (-values.nbytes % SEGMENT_ALIGN))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class Segment:
+    """A cold segment file with its columns memory-mapped read-only"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+                raise ValueError(f"{path} is not a view segment")
+            length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            header = json.loads(f.read(length))
+        data_start = len(SEGMENT_MAGIC) + 8 + length
+        self.path = path
+        self.month = date.fromisoformat(header['month'])
+        self.rows = header['rows']
+        self.countries = header['countries']
+        for column in header['columns']:
+            values = np.empty(0, dtype=column['dtype'])
+            if self.rows:
+                values = np.memmap(path, dtype=column['dtype'], mode='r',
+                                   offset=data_start + column['offset'], shape=(self.rows,))
+            setattr(self, column['name'], values)
+
+    def __len__(self):
+        return self.rows
+
+
+class Frame:
+    """A consistent read-only view of the store's columns"""
+
+    def __init__(self, store):
+        self.blog = store.blog.view()
+        self.viewer = store.viewer.view()
+        self.country = store.country.view()
+        self.viewed_at = store.viewed_at.view()
+        self.blog_ids = list(store.blogs.values)
+        self.viewer_ids = list(store.viewers.values)
+        self.countries = list(store.countries.values)
+
+    def __len__(self):
+        return len(self.blog)
+
+
+class ColumnarStore:
+    """BlogView, hot and archived, held as NumPy columns and refreshed incrementally by id
+
+    Columns are dictionary-encoded blog, viewer and country codes plus
+    viewed_at as int64 epoch microseconds. Rows are appended for ids above
+    the highest one loaded; updates and deletes of loaded rows are not seen.
+    """
+
+    def __init__(self, chunk_size=100000):
+        self.chunk_size = chunk_size
+        self.usernames = {}
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.max_id = 0
+        self.archive_version = None
+        self.blog = GrowableColumn(np.int32)
+        self.viewer = GrowableColumn(np.int32)
+        self.country = GrowableColumn(np.int32)
+        self.viewed_at = GrowableColumn(np.int64)
+        self.blogs = Dictionary()
+        self.viewers = Dictionary()
+        self.countries = Dictionary()
+
+    def refresh(self):
+        """Load rows added since the last refresh and return a Frame
+
+        Archived months are read from their cold segments. When the set of
+        segments changes, rows have moved out of the table, so the store is
+        rebuilt from the segments and the remaining hot rows.
+        """
+        with self.lock:
+            while True:
+                version = archive.version()
+                if version != self.archive_version:
+                    self._reset()
+                    for segment in archive.open_segments():
+                        self._load_segment(segment)
+                    self.archive_version = version
+                self._load_hot_rows()
+                if archive.version() == version:
+                    return Frame(self)
+
+    def _load_segment(self, segment):
+        # Segments name their countries, so they stay readable whatever ids the table assigns.
+        ids = countries.get_ids(segment.countries, create=True)
+        country_codes = np.fromiter((self.countries._code(ids.get(name)) for name in segment.countries),
+                                    dtype=np.int32, count=len(segment.countries))
+        self.blog.extend(self.blogs.encode_array(segment.blog))
+        self.viewer.extend(self.viewers.encode_array(segment.viewer))
+        self.country.extend(country_codes[segment.country])
+        self.viewed_at.extend(segment.viewed_at)
+
+    def _load_hot_rows(self):
+        rows = (
+            BlogView.objects.order_by('id')
+            .values_list('id', 'blog_id', 'viewer_id', 'viewer_country', 'viewed_at')
+        )
+        while True:
+            chunk = list(rows.filter(id__gt=self.max_id)[:self.chunk_size])
+            if not chunk:
+                break
+            ids, blogs, viewers, countries, viewed_at = zip(*chunk)
+            self.blog.extend(self.blogs.encode(blogs))
+            self.viewer.extend(self.viewers.encode(viewers))
+            self.country.extend(self.countries.encode(countries))
+            self.viewed_at.extend(np.fromiter((to_epoch_us(value) for value in viewed_at),
+                                              dtype=np.int64, count=len(viewed_at)))
+            self.max_id = ids[-1]
+
+    def username_labels(self, frame):
+        """Username per viewer code, looked up once per user"""
+        missing = [viewer_id for viewer_id in frame.viewer_ids[1:] if viewer_id not in self.usernames]
+        batch_size = connection.features.max_query_params or len(missing) or 1
+        for start in range(0, len(missing), batch_size):
+            self.usernames.update(
+                User.objects.filter(id__in=missing[start:start + batch_size]).values_list('id', 'username')
+            )
+        return [self.usernames.get(viewer_id) for viewer_id in frame.viewer_ids]
+
+    # Filtering
+
+    def _code_mask(self, frame, predicate):
+        """Boolean per dictionary code for predicates on blog, viewer or country attributes"""
+        field, operator, value = predicate.field, predicate.operator, predicate.value
+        root, _, rest = field.partition('__')
+        if root in ('blog', 'blog_id'):
+            attrs = frame.blog_ids
+            if rest:
+                by_id = dict(Blog.objects.values_list('id', rest))
+                attrs = [by_id.get(blog_id) for blog_id in attrs]
+            column = frame.blog
+        elif root in ('viewer', 'viewer_id'):
+            attrs = frame.viewer_ids
+            if rest:
+                attrs = self.username_labels(frame)
+            column = frame.viewer
+        else:
+            attrs = frame.countries
+            if rest:
+                attrs = country_labels(frame)
+            column = frame.country
+
+        if value is not None and root != 'viewer_country' and rest in ('', 'author', 'author_id'):
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise FilterError(f'"{field}" must be compared with an integer')
+        matches = np.fromiter((_matches(attr, operator, value) for attr in attrs), dtype=bool, count=len(attrs))
+        return matches[column]
+
+    def _time_mask(self, frame, predicate):
+        value = predicate.value
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+        if parsed is None:
+            day = parse_date(value) if isinstance(value, str) else None
+            if day is None:
+                raise FilterError('"viewed_at" must be compared with a date or datetime')
+            parsed = datetime.combine(day, time.min)
+        bound = to_epoch_us(parsed)
+        ts = frame.viewed_at
+        return {
+            'eq': ts == bound, 'ne': ts != bound, 'gt': ts > bound,
+            'lt': ts < bound, 'gte': ts >= bound, 'lte': ts <= bound,
+        }[predicate.operator]
+
+    def mask(self, frame, plan, start_date=None, end_date=None):
+        """Rows matching a compiled BlogView filter plan and date range, or None for all rows"""
+        combined = None
+        for predicate in plan.predicates:
+            if predicate.field == 'viewed_at':
+                matched = self._time_mask(frame, predicate)
+            else:
+                matched = self._code_mask(frame, predicate)
+            if combined is None:
+                combined = matched
+            elif plan.logic == 'or':
+                combined = combined | matched
+            else:
+                combined = combined & matched
+
+        if start_date:
+            matched = frame.viewed_at >= day_start_us(start_date)
+            combined = matched if combined is None else combined & matched
+        if end_date:
+            matched = frame.viewed_at < day_start_us(end_date + timedelta(days=1))
+            combined = matched if combined is None else combined & matched
+        return combined
+
+    # Queries
+
+    def blog_views_rows(self, plan, object_type, range_type, start_date=None, end_date=None):
+        """(period date, grouping key, number_of_blogs, total_views) in the order of BlogViewsAnalyticsAPI"""
+        frame = self.refresh()
+        selected = self.mask(frame, plan, start_date, end_date)
+        pick = (lambda column: column) if selected is None else (lambda column: column[selected])
+        timestamps = pick(frame.viewed_at)
+        if not len(timestamps):
+            return []
+
+        days = calendar(local_date(timestamps.min()), local_date(timestamps.max()), range_type)
+        periods = period_index(timestamps, days)
+        if object_type == 'country':
+            keys, labels = pick(frame.country), country_labels(frame)
+        else:
+            keys, labels = pick(frame.viewer), self.username_labels(frame)
+
+        n_keys = len(labels)
+        groups = periods.astype(np.int64) * n_keys + keys
+        n_groups = len(days) * n_keys
+        group_ids = None
+        if n_groups > DENSE_GROUPS:
+            # Too many possible (period, key) pairs to count densely; number the ones present.
+            group_ids, groups = np.unique(groups, return_inverse=True)
+            n_groups = len(group_ids)
+        views = np.bincount(groups, minlength=n_groups)
+        blogs = distinct_counts(groups, pick(frame.blog), n_groups, len(frame.blog_ids))
+
+        # Order like ORDER BY period, grouping_key, with the backend's NULL placement.
+        present = np.flatnonzero(views)
+        pairs = present if group_ids is None else group_ids[present]
+        codes = pairs % n_keys
+        nulls_first = connection.vendor != 'postgresql'
+        used = sorted(np.unique(codes).tolist(), key=lambda code: (
+            (labels[code] is not None) == nulls_first, labels[code] or ''
+        ))
+        rank = np.zeros(n_keys, dtype=np.int64)
+        rank[used] = np.arange(len(used))
+        order = np.lexsort((rank[codes], pairs // n_keys))
+        return [
+            (days[pair // n_keys], labels[pair % n_keys], int(blogs[group]), int(views[group]))
+            for pair, group in zip(pairs[order].tolist(), present[order].tolist())
+        ]
+
+    def top_rows(self, top_type, plan, start_date=None, end_date=None, limit=10):
+        """Ranked {rank, x, y, z} rows matching get_top_rows"""
+        frame = self.refresh()
+        selected = self.mask(frame, plan, start_date, end_date)
+        pick = (lambda column: column) if selected is None else (lambda column: column[selected])
+
+        if top_type == 'blog':
+            keys, n_keys = pick(frame.blog), len(frame.blog_ids)
+            viewers = pick(frame.viewer)
+            # Count("viewer", distinct=True) does not count anonymous views.
+            distinct = distinct_counts(keys, viewers, n_keys, len(frame.viewer_ids)) - _null_groups(keys, viewers, n_keys)
+            ids = frame.blog_ids
+        elif top_type == 'user':
+            viewer = pick(frame.viewer)
+            keys, n_keys = viewer[viewer != 0], len(frame.viewer_ids)
+            distinct = distinct_counts(keys, pick(frame.blog)[viewer != 0], n_keys, len(frame.blog_ids))
+            ids = frame.viewer_ids
+        else:
+            country = pick(frame.country)
+            keys, n_keys = country[country != 0], len(frame.countries)
+            viewers = pick(frame.viewer)[country != 0]
+            distinct = distinct_counts(keys, viewers, n_keys, len(frame.viewer_ids)) \
+                - _null_groups(keys, viewers, n_keys)
+            ids = frame.countries
+
+        # Ties are broken on the grouping key, like the ORM's ORDER BY.
+        if top_type == 'user':
+            tiebreak = _label_rank(self.username_labels(frame))
+        else:
+            tiebreak = _label_rank(ids)
+        views = np.bincount(keys, minlength=n_keys)
+        codes = [code for code in np.lexsort((tiebreak, -views)) if views[code]][:limit]
+
+        if top_type == 'blog':
+            titles = dict(Blog.objects.filter(id__in=[ids[code] for code in codes]).values_list('id', 'title'))
+            labels = {code: titles.get(ids[code]) or f"Blog {ids[code]}" for code in codes}
+        elif top_type == 'user':
+            names = dict(User.objects.filter(id__in=[ids[code] for code in codes]).values_list('id', 'username'))
+            labels = {code: names.get(ids[code]) or "Anonymous" for code in codes}
+        else:
+            names = country_labels(frame)
+            labels = {code: names[code] or "Unknown" for code in codes}
+        return [
+            {"rank": i + 1, "x": labels[code], "y": int(views[code]), "z": int(distinct[code])}
+            for i, code in enumerate(codes)
+        ]
+
+    def performance_rows(self, blogs, compare_type, start_date=None, end_date=None):
+        """Same rows as performance.performance_rows, with views counted from the columns"""
+        frame = self.refresh()
+        created = list(blogs.values_list('id', 'created_at'))
+        wanted = {blog_id for blog_id, _ in created}
+        blog_mask = np.fromiter((blog_id in wanted for blog_id in frame.blog_ids), dtype=bool,
+                                count=len(frame.blog_ids))
+        selected = blog_mask[frame.blog]
+        if start_date:
+            selected &= frame.viewed_at >= day_start_us(start_date)
+        if end_date:
+            selected &= frame.viewed_at < day_start_us(end_date + timedelta(days=1))
+        timestamps = frame.viewed_at[selected]
+        created_us = np.array([to_epoch_us(value) for _, value in created], dtype=np.int64)
+
+        both = np.concatenate([timestamps, created_us])
+        if not len(both) and not (start_date and end_date):
+            return []
+        first = start_date or local_date(both.min())
+        last = end_date or local_date(both.max())
+        if period_start(first, compare_type) > period_start(last, compare_type):
+            return []
+
+        days = calendar(first, last, compare_type)
+        views = _period_counts(timestamps, days, compare_type)
+        created_counts = _period_counts(created_us, days, compare_type)
+        rows = []
+        for i, day in enumerate(days):
+            growth = None
+            if i:
+                growth = AnalyticsCalculator.calculate_growth(int(views[i]), int(views[i - 1]))
+            rows.append((day, int(created_counts[i]), int(views[i]), growth))
+        return rows
+
+
+def country_labels(frame):
+    """Country name per country code"""
+    names = countries.get_names(frame.countries)
+    return [names[country_id] for country_id in frame.countries]
+
+
+def _matches(attr, operator, value):
+    if operator in ('eq', 'ne'):
+        equal = attr is None if value is None else attr is not None and attr == value
+        return equal if operator == 'eq' else not equal
+    if attr is None or value is None:
+        return False
+    return {'gt': attr > value, 'lt': attr < value, 'gte': attr >= value, 'lte': attr <= value}[operator]
+
+
+def _null_groups(keys, values, n_groups):
+    """1 for each group that contains a NULL (code 0) value, else 0"""
+    return np.bincount(keys[values == 0], minlength=n_groups).astype(bool).astype(np.int64)
+
+
+def _label_rank(labels):
+    """Position of each code when its labels are sorted, NULL first"""
+    order = sorted(range(len(labels)), key=lambda code: (labels[code] is not None, labels[code] or ''))
+    rank = np.zeros(len(labels), dtype=np.int64)
+    rank[order] = np.arange(len(labels))
+    return rank
+
+
+def _period_counts(timestamps, days, period):
+    """Counts per calendar period, ignoring timestamps outside the calendar"""
+    index = period_index(timestamps, days)
+    index = index[(index >= 0) & (timestamps < day_start_us(next_period(days[-1], period)))]
+    return np.bincount(index, minlength=len(days))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ColumnarStore(chunk_size=getattr(settings, 'ANALYTICS_COLUMNAR_CHUNK_SIZE', 100000))
+    return _store
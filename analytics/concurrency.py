@@ -0,0 +1,107 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar, copy_context
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+# Pool sizes: requests served by the async views at once, and sub-queries run
+# at once by gather().
+DEFAULT_WORKERS = {'views': 16, 'queries': 8}
+
+# Execute wrappers (metrics, explain) of the current request. Work handed to a
+# pool runs on another thread with its own connections and installs them there.
+_query_wrappers = ContextVar('analytics_query_wrappers', default=())
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name):
+    """The shared 'views' or 'queries' thread pool
+
+    They are separate so that a view waiting on its sub-queries can never
+    hold the threads those sub-queries need.
+    """
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                workers = getattr(settings, f'ANALYTICS_ASYNC_{name.upper()}_WORKERS', DEFAULT_WORKERS[name])
+                executor = _executors[name] = ThreadPoolExecutor(max_workers=workers,
+                                                                 thread_name_prefix=f'analytics-{name}')
+    return executor
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """Install an execute wrapper on this thread's connections and on those used by pool work started in the block"""
+    token = _query_wrappers.set((*_query_wrappers.get(), wrapper))
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper))
+            yield wrapper
+    finally:
+        _query_wrappers.reset(token)
+
+
+def run_pooled(func, *args, **kwargs):
+    """Call ``func`` on a pool thread with the caller's execute wrappers
+
+    Pool threads keep their connections between jobs, so they are closed
+    or kept here as request_started/request_finished would for CONN_MAX_AGE.
+    """
+    close_old_connections()
+    try:
+        with ExitStack() as stack:
+            for wrapper in _query_wrappers.get():
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(wrapper))
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def gather(*calls):
+    """Results of the zero-argument callables, run concurrently; the first runs on the calling thread
+
+    Inside a transaction they all run in order on the calling thread, since
+    pool threads use other connections and would not see its writes.
+    """
+    if any(connection.in_atomic_block for connection in connections.all(initialized_only=True)):
+        return [call() for call in calls]
+    executor = get_executor('queries')
+    futures = [executor.submit(copy_context().run, run_pooled, call) for call in calls[1:]]
+    try:
+        first = calls[0]()
+    finally:
+        wait(futures)
+    return [first, *(future.result() for future in futures)]
+
+
+async def run_in_pool(func, *args, **kwargs):
+    """Await ``func`` run on the view pool, leaving the event loop free"""
+    return await sync_to_async(run_pooled, thread_sensitive=False, executor=get_executor('views'))(func, *args, **kwargs)
+
+
+def async_view(view):
+    """Async version of a sync view, for ASGI servers
+
+    Django runs sync views on a single shared thread under ASGI, so one slow
+    query holds up every other request. This runs the view, and renders its
+    response, on the view pool instead.
+    """
+    def render(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run_in_pool(render, request, *args, **kwargs)
+    return wrapper
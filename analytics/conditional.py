@@ -0,0 +1,103 @@
+import hashlib
+import json
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from analytics import archive
+from analytics.cache import cache_key, normalize_query
+from analytics.utils import parse_bool
+from .models import Blog, BlogView, DataVersion
+
+DATA_VERSION_NAME = 'analytics_data'
+
+# Both maxima are read from the end of an index: the BlogView primary key and
+# the Blog.updated_at index. The data version is one row found by its unique name.
+WATERMARK_SQL = (
+    "SELECT (SELECT MAX({view_id}) FROM {views}), (SELECT MAX({updated_at}) FROM {blogs}),"
+    " (SELECT {version} FROM {versions} WHERE {name} = %s)"
+)
+
+
+def data_watermark():
+    """(last view id, last blog change, data version): moves whenever views or blogs change"""
+    alias = BlogView.objects.all().db
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    sql = WATERMARK_SQL.format(
+        view_id=quote(BlogView._meta.pk.column), views=quote(BlogView._meta.db_table),
+        updated_at=quote(Blog._meta.get_field('updated_at').column), blogs=quote(Blog._meta.db_table),
+        version=quote('version'), versions=quote(DataVersion._meta.db_table), name=quote('name'),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [DATA_VERSION_NAME])
+        return cursor.fetchone()
+
+
+def bump_data_version(using=None):
+    """Move the watermark for a change that leaves both maxima alone"""
+    versions = DataVersion.objects.using(using)
+    if not versions.filter(name=DATA_VERSION_NAME).update(version=F('version') + 1):
+        try:
+            with transaction.atomic(using=using):
+                versions.create(name=DATA_VERSION_NAME, version=1)
+        except IntegrityError:
+            versions.filter(name=DATA_VERSION_NAME).update(version=F('version') + 1)
+
+
+def bump_data_version_on_commit(using):
+    """bump_data_version once when the current transaction commits, however many rows it deletes"""
+    connection = connections[using]
+    if not any(getattr(func, 'bumps_data_version', False) for _, func, _ in connection.run_on_commit):
+        def bump():
+            bump_data_version(using)
+        bump.bumps_data_version = True
+        transaction.on_commit(bump, using=using)
+
+
+def compute_etag(endpoint, query_params):
+    """Strong ETag of a query's answer: its normalized parameters plus the data watermark"""
+    params, start_date, end_date = normalize_query(endpoint, query_params)
+    raw = json.dumps([cache_key(endpoint, params, start_date, end_date), data_watermark(), archive.version()],
+                     default=str)
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags or f'W/{etag}' in etags
+
+
+def conditional_response(endpoint):
+    """Answer If-None-Match with 304 before the aggregation runs when the watermark has not moved
+
+    The ETag is only set on freshly computed responses: a cache hit may
+    predate views stored by another process, and tagging it with the current
+    watermark would let the client keep it.
+    """
+    def decorator(get):
+        @wraps(get)
+        def wrapper(self, request, *args, **kwargs):
+            # Real-time rankings come from in-process counters that the watermark does not describe.
+            if (not getattr(settings, 'ANALYTICS_ETAGS_ENABLED', True) or parse_bool(request.GET.get('explain'))
+                    or request.GET.get('mode') == 'realtime'):
+                return get(self, request, *args, **kwargs)
+
+            etag = compute_etag(endpoint, request.GET)
+            if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+            else:
+                response = get(self, request, *args, **kwargs)
+                if response.status_code != 200 or response.get('X-Cache') == 'HIT':
+                    return response
+                response['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
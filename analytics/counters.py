@@ -0,0 +1,174 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+from analytics import archive
+from analytics.hll import HyperLogLog
+from .models import BlogView, BlogViewCounter, RollupCheckpoint
+
+CHECKPOINT_NAME = 'blog_view_counters'
+
+_ready = False
+
+
+def counters_ready():
+    """True once the counters have been reconciled by repair_view_counters or rebuild_rollups"""
+    global _ready
+    if not _ready:
+        _ready = RollupCheckpoint.objects.filter(name=CHECKPOINT_NAME).exists()
+    return _ready
+
+
+def can_answer(plan, start_date=None, end_date=None):
+    """Check whether a blog ranking is all-time and unfiltered, so the counters hold its answer"""
+    return not plan and start_date is None and end_date is None and counters_ready()
+
+
+def aware(value):
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+
+def apply_views(views, batch_size=500):
+    """Add newly stored views to the per-blog counters"""
+    groups = {}
+    for view in views:
+        viewed_at = aware(view.viewed_at)
+        group = groups.get(view.blog_id)
+        if group is None:
+            group = groups[view.blog_id] = [0, set(), viewed_at]
+        group[0] += 1
+        if view.viewer_id is not None:
+            group[1].add(view.viewer_id)
+        group[2] = max(group[2], viewed_at)
+
+    blog_ids = list(groups)
+    with transaction.atomic():
+        for start in range(0, len(blog_ids), batch_size):
+            _apply_groups({blog_id: groups[blog_id] for blog_id in blog_ids[start:start + batch_size]}, batch_size)
+
+
+def _locked_counters(blog_ids):
+    return {row.blog_id: row for row in BlogViewCounter.objects.select_for_update().filter(blog_id__in=blog_ids)}
+
+
+def _apply_groups(groups, batch_size):
+    # Rows that do not exist yet cannot be locked, and two batches may both
+    # see a blog's counter missing. So missing counters are inserted empty,
+    # ignoring the ones another batch inserted first, then locked and
+    # incremented like the rest.
+    existing = _locked_counters(groups)
+    missing = [blog_id for blog_id in groups if blog_id not in existing]
+    if missing:
+        empty = HyperLogLog().to_bytes()
+        BlogViewCounter.objects.bulk_create(
+            [BlogViewCounter(blog_id=blog_id, viewer_sketch=empty) for blog_id in missing],
+            batch_size=batch_size, ignore_conflicts=True,
+        )
+        existing.update(_locked_counters(missing))
+
+    to_update = []
+    for blog_id, (views, viewers, last_viewed_at) in groups.items():
+        row = existing[blog_id]
+        row.total_views = F('total_views') + views
+        if viewers:
+            sketch = HyperLogLog.from_bytes(row.viewer_sketch).update(viewers)
+            row.viewer_sketch = sketch.to_bytes()
+            row.unique_viewers = sketch.count()
+        if row.last_viewed_at is None or row.last_viewed_at < last_viewed_at:
+            row.last_viewed_at = last_viewed_at
+        to_update.append(row)
+
+    BlogViewCounter.objects.bulk_update(
+        to_update, ['total_views', 'viewer_sketch', 'unique_viewers', 'last_viewed_at'], batch_size=batch_size
+    )
+
+
+def expected_counters():
+    """{blog_id: (total views, viewer sketch, last viewed at)} recomputed from BlogView and the archived segments"""
+    totals = defaultdict(int)
+    last_seen = {}
+    sketches = defaultdict(HyperLogLog)
+
+    for blog_id, views, last_viewed_at in (
+        BlogView.objects.values('blog_id').annotate(views=Count('id'), last=Max('viewed_at'))
+        .values_list('blog_id', 'views', 'last').order_by()
+    ):
+        totals[blog_id] += views
+        last_seen[blog_id] = last_viewed_at
+    pairs = (
+        BlogView.objects.filter(viewer__isnull=False).values_list('blog_id', 'viewer_id')
+        .distinct().order_by().iterator(chunk_size=10000)
+    )
+    for blog_id, viewer_id in pairs:
+        sketches[blog_id].add(viewer_id)
+
+    for segment in archive.open_segments():
+        for blog_id, views, last_viewed_at, viewers in segment_counters(segment):
+            totals[blog_id] += views
+            if blog_id not in last_seen or last_seen[blog_id] < last_viewed_at:
+                last_seen[blog_id] = last_viewed_at
+            sketches[blog_id].update(viewers)
+
+    return {blog_id: (views, sketches[blog_id].to_bytes(), last_seen[blog_id]) for blog_id, views in totals.items()}
+
+
+def segment_counters(segment):
+    """(blog_id, views, last viewed at, distinct viewer ids) for every blog in an archived segment"""
+    from analytics import columnar
+    import numpy as np
+
+    if not len(segment):
+        return []
+    blog = np.asarray(segment.blog, dtype=np.int64)
+    viewer = np.asarray(segment.viewer, dtype=np.int64)
+    blog_ids, inverse, counts = np.unique(blog, return_inverse=True, return_counts=True)
+    last = np.full(len(blog_ids), np.iinfo(np.int64).min)
+    np.maximum.at(last, inverse, np.asarray(segment.viewed_at, dtype=np.int64))
+    known = viewer != 0
+    pairs = np.unique(np.stack([inverse[known], viewer[known]]), axis=1)
+    viewers = np.split(pairs[1], np.searchsorted(pairs[0], np.arange(1, len(blog_ids))))
+    return [
+        (int(blog_id), int(count), columnar.from_epoch_us(last_us), viewers[i].tolist())
+        for i, (blog_id, count, last_us) in enumerate(zip(blog_ids, counts, last))
+    ]
+
+
+def repair(dry_run=False, batch_size=1000):
+    """Reconcile every counter with the raw views; returns (blogs with views, counters that were wrong)
+
+    Run it while ingestion is quiet: views stored during the recount can be
+    counted twice or missed until the next repair.
+    """
+    expected = expected_counters()
+    current = {row.blog_id: row for row in BlogViewCounter.objects.all()}
+
+    to_update = []
+    to_create = []
+    for blog_id, (views, sketch, last_viewed_at) in expected.items():
+        row = current.pop(blog_id, None)
+        if row is None:
+            to_create.append(BlogViewCounter(blog_id=blog_id, total_views=views, viewer_sketch=sketch,
+                                             unique_viewers=HyperLogLog.from_bytes(sketch).count(),
+                                             last_viewed_at=last_viewed_at))
+        elif (row.total_views, bytes(row.viewer_sketch), row.last_viewed_at) != (views, sketch, last_viewed_at):
+            row.total_views = views
+            row.viewer_sketch = sketch
+            row.unique_viewers = HyperLogLog.from_bytes(sketch).count()
+            row.last_viewed_at = last_viewed_at
+            to_update.append(row)
+    fixed = len(to_update) + len(to_create) + len(current)
+    if dry_run:
+        return len(expected), fixed
+
+    with transaction.atomic():
+        BlogViewCounter.objects.bulk_update(
+            to_update, ['total_views', 'viewer_sketch', 'unique_viewers', 'last_viewed_at'], batch_size=batch_size
+        )
+        BlogViewCounter.objects.bulk_create(to_create, batch_size=batch_size)
+        BlogViewCounter.objects.filter(blog_id__in=list(current)).delete()
+        RollupCheckpoint.objects.update_or_create(
+            name=CHECKPOINT_NAME,
+            defaults={'last_view_id': BlogView.objects.aggregate(last=Max('id'))['last'] or 0,
+                      'built_at': timezone.now()},
+        )
+    return len(expected), fixed
@@ -0,0 +1,57 @@
+import threading
+from django.db import connection
+from .models import Country
+
+# Country rows are never renamed or deleted (the admin is read-only for
+# them), so name <-> id pairs can be cached for the life of the process.
+# Changes made through the ORM in this process clear the cache (signals.py).
+_ids = {}
+_names = {}
+_lock = threading.Lock()
+
+
+def _remember(pairs):
+    for country_id, name in pairs:
+        _ids[name] = country_id
+        _names[country_id] = name
+
+
+def get_ids(names, create=False):
+    """{name: id} for the given country names, creating missing countries when ``create`` is set"""
+    names = {name for name in names if name is not None}
+    missing = names - _ids.keys()
+    if missing:
+        with _lock:
+            if create:
+                Country.objects.bulk_create([Country(name=name) for name in missing], ignore_conflicts=True)
+            _remember(Country.objects.filter(name__in=missing).values_list('id', 'name'))
+    return {name: _ids[name] for name in names if name in _ids}
+
+
+def get_id(name, create=False):
+    return get_ids([name], create).get(name)
+
+
+def get_names(ids):
+    """{id: name} for the given country ids; None maps to None"""
+    ids = set(ids)
+    missing = ids - _names.keys() - {None}
+    if missing:
+        with _lock:
+            _remember(Country.objects.filter(id__in=missing).values_list('id', 'name'))
+    return {country_id: _names.get(country_id) for country_id in ids}
+
+
+def sort_key(name):
+    """Order country names as ORDER BY on a name column would, including where the backend puts NULL"""
+    nulls_first = connection.vendor != 'postgresql'
+    return (name is not None) == nulls_first, name or ''
+
+
+def clear_cache():
+    """Forget cached ids, and the compiled filter plans that hold them, e.g. after switching to another database"""
+    from analytics.utils import AnalyticsQueryBuilder
+    with _lock:
+        _ids.clear()
+        _names.clear()
+    AnalyticsQueryBuilder.clear_plan_cache()
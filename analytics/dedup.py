@@ -0,0 +1,196 @@
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+POLICIES = ['off', 'lru', 'bloom']
+
+
+def view_key(fields):
+    """Who viewed which blog: the viewer when known, else the IP address; None when neither is set"""
+    if fields['viewer_id'] is not None:
+        return f"{fields['blog_id']}:u{fields['viewer_id']}"
+    if fields['ip_address'] is not None:
+        return f"{fields['blog_id']}:ip{fields['ip_address']}"
+    return None
+
+
+class Deduplicator:
+    """Drops repeated views of a blog by the same viewer (or IP) within ``window`` seconds
+
+    Repeats are judged on ``viewed_at``, so backfilled events are compared
+    with each other rather than with the clock. ``filter`` only checks;
+    views are remembered by ``record`` once they are committed, so a batch
+    whose insert fails can be retried. Subclasses keep memory bounded by
+    ``max_keys``. State is per process.
+    """
+    policy = 'off'
+
+    def __init__(self, window=30, max_keys=100000):
+        self.window = window
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self.counters = {'checked': 0, 'dropped': 0}
+
+    def filter(self, parsed):
+        """The (index, fields) pairs that are not repeats of recorded views or of each other, and the number dropped"""
+        if self.policy == 'off':
+            return parsed, 0
+        kept = []
+        batch = {}
+        with self._lock:
+            for item in parsed:
+                key = view_key(item[1])
+                if key is not None:
+                    timestamp = item[1]['viewed_at'].timestamp()
+                    earlier = batch.setdefault(key, [])
+                    if self.repeats(key, timestamp) or any(abs(timestamp - other) < self.window for other in earlier):
+                        continue
+                    earlier.append(timestamp)
+                kept.append(item)
+            self.counters['checked'] += len(parsed)
+            self.counters['dropped'] += len(parsed) - len(kept)
+        return kept, len(parsed) - len(kept)
+
+    def record(self, parsed):
+        """Remember stored (index, fields) pairs, so that later repeats of them are dropped"""
+        if self.policy == 'off':
+            return
+        with self._lock:
+            for _, fields in parsed:
+                key = view_key(fields)
+                if key is not None:
+                    self.add(key, fields['viewed_at'].timestamp())
+
+    def repeats(self, key, timestamp):
+        """True when a recorded view of ``key`` is inside the window"""
+        return False
+
+    def add(self, key, timestamp):
+        """Record a view of ``key``"""
+
+    def render(self):
+        lines = [
+            '# HELP analytics_ingest_dedup_events_total Ingested views checked for repeats, by outcome',
+            '# TYPE analytics_ingest_dedup_events_total counter',
+        ]
+        with self._lock:
+            dropped, checked = self.counters['dropped'], self.counters['checked']
+        lines.append(f'analytics_ingest_dedup_events_total{{policy="{self.policy}",result="dropped"}} {dropped}')
+        lines.append(f'analytics_ingest_dedup_events_total{{policy="{self.policy}",result="kept"}} {checked - dropped}')
+        return '\n'.join(lines) + '\n'
+
+
+class LRUDeduplicator(Deduplicator):
+    """Exact: the last stored view time of the ``max_keys`` most recently seen keys
+
+    A key evicted before its window ends lets its next repeat through.
+    """
+    policy = 'lru'
+
+    def __init__(self, window=30, max_keys=100000):
+        super().__init__(window, max_keys)
+        self._last = OrderedDict()
+        self.counters['evicted'] = 0
+
+    def repeats(self, key, timestamp):
+        last = self._last.get(key)
+        if last is not None and abs(timestamp - last) < self.window:
+            self._last.move_to_end(key)
+            return True
+        return False
+
+    def add(self, key, timestamp):
+        last = self._last.get(key)
+        self._last[key] = timestamp if last is None else max(last, timestamp)
+        self._last.move_to_end(key)
+        if len(self._last) > self.max_keys:
+            self._last.popitem(last=False)
+            self.counters['evicted'] += 1
+
+
+class BloomFilter:
+    __slots__ = ('bits', 'size', 'hashes')
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, positions):
+        for position in positions:
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, positions):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in positions)
+
+
+class BloomDeduplicator(Deduplicator):
+    """Approximate: one Bloom filter per ``window``-long slice of viewed_at, keeping the newest two
+
+    Memory is fixed (about 1.8 bytes per key at a 0.1% error rate). Repeats
+    less than ``window`` apart are always dropped and some up to twice that
+    apart are too; a false positive drops a first view at ``error_rate``.
+    Views older than the two kept slices are not checked.
+    """
+    policy = 'bloom'
+
+    def __init__(self, window=30, max_keys=100000, error_rate=0.001):
+        super().__init__(window, max_keys)
+        self.error_rate = error_rate
+        self._filters = {}
+
+    def repeats(self, key, timestamp):
+        slot = int(timestamp // self.window)
+        if slot < max(self._filters, default=slot) - 1:
+            return False
+        positions = None
+        for candidate in (slot, slot - 1):
+            bloom = self._filters.get(candidate)
+            if bloom is not None:
+                positions = positions or bloom.positions(key)
+                if positions in bloom:
+                    return True
+        return False
+
+    def add(self, key, timestamp):
+        slot = int(timestamp // self.window)
+        if slot < max(self._filters, default=slot) - 1:
+            return
+        bloom = self._filters.get(slot)
+        if bloom is None:
+            bloom = self._filters[slot] = BloomFilter(self.max_keys, self.error_rate)
+            for old in [old for old in self._filters if old < slot - 1]:
+                del self._filters[old]
+        bloom.add(bloom.positions(key))
+
+
+_deduplicator = None
+_deduplicator_lock = threading.Lock()
+
+
+def get_deduplicator():
+    global _deduplicator
+    if _deduplicator is None:
+        with _deduplicator_lock:
+            if _deduplicator is None:
+                policy = getattr(settings, 'ANALYTICS_DEDUP_POLICY', 'lru')
+                window = getattr(settings, 'ANALYTICS_DEDUP_WINDOW', 30)
+                max_keys = getattr(settings, 'ANALYTICS_DEDUP_MAX_KEYS', 100000)
+                if policy == 'lru':
+                    _deduplicator = LRUDeduplicator(window, max_keys)
+                elif policy == 'bloom':
+                    _deduplicator = BloomDeduplicator(window, max_keys,
+                                                      getattr(settings, 'ANALYTICS_DEDUP_BLOOM_ERROR', 0.001))
+                elif policy == 'off':
+                    _deduplicator = Deduplicator(window, max_keys)
+                else:
+                    raise ImproperlyConfigured(f"ANALYTICS_DEDUP_POLICY must be one of: {', '.join(POLICIES)}")
+    return _deduplicator
@@ -0,0 +1,53 @@
+from datetime import datetime
+from functools import lru_cache
+from rest_framework.renderers import JSONRenderer
+
+# Response rows are built directly as plain dicts; running tens of thousands
+# of rows through Serializer(many=True) converted every field of every row
+# for no change.
+
+
+@lru_cache(maxsize=4096)
+def day_label(period):
+    """'YYYY-MM-DD' of a date or datetime period, built once per period rather than once per row"""
+    return (period.date() if isinstance(period, datetime) else period).isoformat()
+
+
+def blog_views_rows(rows):
+    """{x, y, z} rows for /analytics/blog-views/ from (period, label, number_of_blogs, total_views) tuples"""
+    return [
+        {"x": f"{label or 'Unknown'} - {day_label(period) if period else 'Unknown'}", "y": blogs, "z": views}
+        for period, label, blogs, views in rows
+    ]
+
+
+def performance_rows(rows):
+    """{period, x, y, z} rows for /analytics/performance/ from (period, blogs, views, growth) tuples"""
+    result = []
+    for period, blogs, views, growth in rows:
+        label = day_label(period)
+        result.append({"period": label, "x": f"{label} - {blogs} blogs", "y": views, "z": growth})
+    return result
+
+
+def as_columns(rows, columns=None):
+    """{column: [value per row]} for a list of row dicts"""
+    columns = columns or (list(rows[0]) if rows else [])
+    return {column: [row[column] for row in rows] for column in columns}
+
+
+class ColumnsRenderer(JSONRenderer):
+    """?format=columns: list payloads as {column: [values]}, so keys are not repeated on every row
+
+    The view's ``columns`` attribute names the columns, so empty results
+    keep their shape. Other payloads (errors, explain) are rendered as JSON.
+    """
+    format = 'columns'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        columns = getattr((renderer_context or {}).get('view'), 'columns', None)
+        if isinstance(data, list):
+            data = as_columns(data, columns)
+        elif isinstance(data, dict) and isinstance(data.get('results'), list):
+            data = {**data, 'results': as_columns(data['results'], columns)}
+        return super().render(data, accepted_media_type, renderer_context)
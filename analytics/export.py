@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+import zlib
+
+COLUMNS = ['id', 'blog_id', 'viewer_id', 'viewer_country', 'viewed_at', 'ip_address']
+
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+# Encoded rows are collected into chunks of about this size before being sent.
+CHUNK_BYTES = 64 * 1024
+
+
+def export_rows(views, after_id=None, chunk_size=2000):
+    """Raw view tuples in id order from a BlogView queryset, fetched ``chunk_size`` at a time
+
+    ``iterator`` streams from the database (a server-side cursor on
+    PostgreSQL), so only one chunk is held in memory.
+    """
+    if after_id is not None:
+        views = views.filter(id__gt=after_id)
+    return (
+        views.order_by('id')
+        .values_list('id', 'blog_id', 'viewer_id', 'viewer_country__name', 'viewed_at', 'ip_address')
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def as_record(row):
+    view_id, blog_id, viewer_id, country, viewed_at, ip_address = row
+    return view_id, blog_id, viewer_id, country, viewed_at.isoformat(), ip_address
+
+
+def encode_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for row in rows:
+        writer.writerow(as_record(row))
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def encode_ndjson(rows):
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(COLUMNS, as_record(row)))) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield ''.join(lines)
+            lines = []
+            size = 0
+    yield ''.join(lines)
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(rows, output, compress=False):
+    """Byte chunks of ``rows`` encoded as CSV or NDJSON, optionally gzip-compressed"""
+    chunks = encode_csv(rows) if output == 'csv' else encode_ndjson(rows)
+    if compress:
+        return gzip_chunks(chunks)
+    return (chunk.encode() for chunk in chunks)
@@ -0,0 +1,327 @@
+import heapq
+import logging
+import threading
+import time
+from collections import Counter, deque
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from .models import BlogView, HeavyHitterSnapshot
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_NAME = 'top_views'
+
+# Dimension name -> how to read its key from a BlogView (None keys are skipped,
+# matching the exact top endpoint which ignores anonymous viewers and unknown countries).
+DIMENSIONS = {
+    'blog': lambda view: view.blog_id,
+    'user': lambda view: view.viewer_id,
+    'country': lambda view: view.viewer_country_id,
+}
+DIMENSION_FIELDS = {'blog': 'blog_id', 'user': 'viewer_id', 'country': 'viewer_country'}
+
+
+class SpaceSaving:
+    """Space-Saving top-k summary over a weighted stream
+
+    Keeps at most ``capacity`` counters. A tracked item's count overestimates
+    its true count by at most its ``error``, and any item whose true count
+    exceeds ``total / capacity`` is guaranteed to be tracked.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._heap = []
+
+    def add(self, item, count=1):
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            floor = self._pop_min()
+            self.counts[item] = floor + count
+            self.errors[item] = floor
+        heapq.heappush(self._heap, (self.counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, i) for i, c in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        # Heap entries go stale when counts grow; skip until one matches.
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                del self.counts[item]
+                del self.errors[item]
+                return count
+
+    def update(self, counter):
+        for item, count in counter.items():
+            self.add(item, count)
+
+    def merge(self, other):
+        for item, count in other.counts.items():
+            self.add(item, count)
+            self.errors[item] += other.errors.get(item, 0)
+        return self
+
+    def top(self, n):
+        """[(item, count, error)] for the n largest counters"""
+        items = heapq.nlargest(n, self.counts.items(), key=lambda pair: pair[1])
+        return [(item, count, self.errors[item]) for item, count in items]
+
+    def to_list(self):
+        return [[item, count, self.errors[item]] for item, count in self.counts.items()]
+
+    @classmethod
+    def from_list(cls, capacity, rows, total=0):
+        summary = cls(capacity)
+        for item, count, error in rows[:capacity]:
+            summary.counts[item] = count
+            summary.errors[item] = error
+        summary.total = total
+        summary._heap = [(c, i) for i, c in summary.counts.items()]
+        heapq.heapify(summary._heap)
+        return summary
+
+
+class HeavyHitterTracker:
+    """All-time and rolling-window Space-Saving summaries for blogs, users and countries
+
+    The rolling window is a ring of ``buckets`` summaries, each covering
+    ``window / buckets`` seconds, merged when queried.
+
+    Views counted since the last snapshot are also kept in ``pending``
+    summaries, which ``save_snapshot`` merges into the shared snapshot.
+    """
+
+    def __init__(self, capacity=1000, window=3600, buckets=12):
+        self.capacity = capacity
+        self.window = window
+        self.buckets = buckets
+        self.bucket_seconds = window / buckets
+        self.all_time = {name: SpaceSaving(capacity) for name in DIMENSIONS}
+        self.recent = {name: deque(maxlen=buckets) for name in DIMENSIONS}
+        self.pending = self._new_pending()
+        self.seeded_through = 0
+        self.lock = threading.Lock()
+
+    def _new_pending(self):
+        """{name: (all-time summary, {bucket start: summary})} of views not yet in the snapshot"""
+        return {name: (SpaceSaving(self.capacity), {}) for name in DIMENSIONS}
+
+    def _bucket_start(self, now):
+        return now - now % self.bucket_seconds
+
+    def _current_bucket(self, name, now):
+        start = self._bucket_start(now)
+        buckets = self.recent[name]
+        if not buckets or buckets[-1][0] != start:
+            buckets.append((start, SpaceSaving(self.capacity)))
+        return buckets[-1][1]
+
+    def update(self, views, now=None):
+        now = time.time() if now is None else now
+        counters = {name: Counter() for name in DIMENSIONS}
+        for view in views:
+            if view.pk is not None and view.pk <= self.seeded_through:
+                continue
+            for name, key in DIMENSIONS.items():
+                item = key(view)
+                if item is not None:
+                    counters[name][item] += 1
+
+        with self.lock:
+            for name, counter in counters.items():
+                self.all_time[name].update(counter)
+                self._current_bucket(name, now).update(counter)
+                all_time, recent = self.pending[name]
+                all_time.update(counter)
+                recent.setdefault(self._bucket_start(now), SpaceSaving(self.capacity)).update(counter)
+
+    def top(self, name, n=10, rolling=False, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            if not rolling:
+                return self.all_time[name].top(n)
+            merged = SpaceSaving(self.capacity)
+            for start, summary in self.recent[name]:
+                if start > now - self.window:
+                    merged.merge(summary)
+            return merged.top(n)
+
+    def to_payload(self):
+        with self.lock:
+            return self._payload()
+
+    def _payload(self):
+        return {
+            name: {
+                'total': self.all_time[name].total,
+                'all': self.all_time[name].to_list(),
+                'recent': [[start, summary.total, summary.to_list()] for start, summary in self.recent[name]],
+            }
+            for name in DIMENSIONS
+        }
+
+    def load_payload(self, payload):
+        with self.lock:
+            self._load(payload)
+
+    def _load(self, payload):
+        for name in DIMENSIONS:
+            data = payload.get(name)
+            if not data:
+                continue
+            self.all_time[name] = SpaceSaving.from_list(self.capacity, data['all'], data['total'])
+            self.recent[name].clear()
+            for start, total, rows in data['recent']:
+                self.recent[name].append((start, SpaceSaving.from_list(self.capacity, rows, total)))
+
+    def take_pending(self):
+        """(views counted since the last snapshot, current payload); counting since then starts afresh"""
+        with self.lock:
+            pending, self.pending = self.pending, self._new_pending()
+            return pending, self._payload()
+
+    def restore_pending(self, pending):
+        """Put back counts taken by ``take_pending`` that did not reach the snapshot"""
+        with self.lock:
+            self.pending = self._merge_pending(pending, self.pending)
+
+    def _merge_pending(self, pending, other):
+        merged = {}
+        for name in DIMENSIONS:
+            all_time, recent = pending[name]
+            other_all_time, other_recent = other[name]
+            for start, summary in other_recent.items():
+                recent[start] = recent[start].merge(summary) if start in recent else summary
+            merged[name] = (all_time.merge(other_all_time), recent)
+        return merged
+
+    def merged_payload(self, stored, pending):
+        """Payload of the ``stored`` snapshot with ``pending`` counts added"""
+        payload = {}
+        for name in DIMENSIONS:
+            data = stored.get(name) or {'total': 0, 'all': [], 'recent': []}
+            all_time, recent = pending[name]
+            summary = SpaceSaving.from_list(self.capacity, data['all'], data['total']).merge(all_time)
+            buckets = {start: SpaceSaving.from_list(self.capacity, rows, total) for start, total, rows in data['recent']}
+            for start, bucket in recent.items():
+                buckets[start] = buckets[start].merge(bucket) if start in buckets else bucket
+            payload[name] = {
+                'total': summary.total,
+                'all': summary.to_list(),
+                'recent': [[start, bucket.total, bucket.to_list()] for start, bucket in sorted(buckets.items())[-self.buckets:]],
+            }
+        return payload
+
+    def adopt(self, payload):
+        """Replace the counts with a merged snapshot, keeping the views counted since it was taken"""
+        with self.lock:
+            self._load(payload)
+            for name in DIMENSIONS:
+                all_time, recent = self.pending[name]
+                self.all_time[name].merge(all_time)
+                for start, summary in sorted(recent.items()):
+                    buckets = self.recent[name]
+                    match = next((bucket for bucket_start, bucket in buckets if bucket_start == start), None)
+                    if match is not None:
+                        match.merge(summary)
+                    elif not buckets or buckets[-1][0] < start:
+                        buckets.append((start, SpaceSaving.from_list(self.capacity, summary.to_list(), summary.total)))
+
+    def seed_from_database(self):
+        """Initialise all-time counters from the stored views when no snapshot exists"""
+        with self.lock:
+            self.seeded_through = BlogView.objects.aggregate(last=Max('id'))['last'] or 0
+            for name, field in DIMENSION_FIELDS.items():
+                rows = (
+                    BlogView.objects.filter(id__lte=self.seeded_through).exclude(**{f"{field}__isnull": True})
+                    .values(field).annotate(total_views=Count('id'))
+                    .order_by('-total_views')[:self.capacity]
+                )
+                summary = SpaceSaving(self.capacity)
+                for row in rows:
+                    summary.add(row[field], row['total_views'])
+                self.all_time[name] = summary
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+_last_snapshot = 0.0
+
+
+def get_tracker():
+    """Process-wide tracker, restored from the latest snapshot on first use"""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                tracker = HeavyHitterTracker(
+                    capacity=getattr(settings, 'ANALYTICS_HEAVY_HITTERS_CAPACITY', 1000),
+                    window=getattr(settings, 'ANALYTICS_HEAVY_HITTERS_WINDOW', 3600),
+                )
+                snapshot = HeavyHitterSnapshot.objects.filter(name=SNAPSHOT_NAME).first()
+                if snapshot is not None and snapshot.payload:
+                    tracker.load_payload(snapshot.payload)
+                else:
+                    tracker.seed_from_database()
+                _tracker = tracker
+    return _tracker
+
+
+def save_snapshot():
+    """Merge this process's counts since its last save into the shared snapshot and adopt the result
+
+    Each process only counts the views it stores itself. Space-Saving
+    summaries merge, so the snapshot accumulates every process's views, and
+    each save picks up what the others saved in the meantime.
+    """
+    global _last_snapshot
+    _last_snapshot = time.monotonic()
+    tracker = get_tracker()
+    pending, current = tracker.take_pending()
+    try:
+        HeavyHitterSnapshot.objects.get_or_create(name=SNAPSHOT_NAME)
+        with transaction.atomic():
+            # Writing the row first locks it, so concurrent saves merge one after another.
+            HeavyHitterSnapshot.objects.filter(name=SNAPSHOT_NAME).update(updated_at=timezone.now())
+            snapshot = HeavyHitterSnapshot.objects.get(name=SNAPSHOT_NAME)
+            if snapshot.payload:
+                payload = tracker.merged_payload(snapshot.payload, pending)
+            else:
+                # First save: the seeded counts are not in the snapshot yet either.
+                payload = current
+            snapshot.payload = payload
+            snapshot.save(update_fields=['payload'])
+    except Exception:
+        tracker.restore_pending(pending)
+        raise
+    tracker.adopt(payload)
+
+
+def record_views(views):
+    """Count newly stored views and snapshot the tracker when the interval has passed"""
+    # Runs after the views are committed; a failure here must not fail ingestion.
+    try:
+        get_tracker().update(views)
+        interval = getattr(settings, 'ANALYTICS_HEAVY_HITTERS_SNAPSHOT_INTERVAL', 60)
+        if time.monotonic() - _last_snapshot >= interval:
+            save_snapshot()
+    except Exception:
+        logger.exception("Failed to update heavy hitters")
+
+
+def save_loaded_snapshot():
+    """Snapshot on shutdown, but only if this process ever used the tracker"""
+    if _tracker is not None:
+        save_snapshot()
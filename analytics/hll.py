@@ -0,0 +1,86 @@
+import hashlib
+import math
+
+DENSE = 0
+SPARSE = 1
+
+
+def hash64(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with ``2 ** p`` six-bit registers
+
+    The relative standard error of ``count()`` is about ``1.04 / sqrt(2 ** p)``:
+    1.6% at the default p=12, so roughly 95% of estimates are within 3.3% of
+    the true value. Small cardinalities use linear counting and are close to
+    exact. Sketches merge losslessly with ``merge``, which is what lets
+    per-day/blog/country sketches be combined at query time.
+
+    Sketches with few non-zero registers serialize as (index, rank) pairs.
+    """
+
+    def __init__(self, p=12):
+        if not 4 <= p <= 16:
+            raise ValueError("p must be between 4 and 16")
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, value):
+        h = hash64(value)
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Cannot merge sketches with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def merge_bytes(self, data):
+        """Merge a serialized sketch without building an intermediate object"""
+        fmt, p = data[0], data[1]
+        if p != self.p:
+            raise ValueError("Cannot merge sketches with different precision")
+        if fmt == DENSE:
+            self.registers = bytearray(map(max, self.registers, data[2:]))
+        else:
+            registers = self.registers
+            for offset in range(2, len(data), 3):
+                index = (data[offset] << 8) | data[offset + 1]
+                if data[offset + 2] > registers[index]:
+                    registers[index] = data[offset + 2]
+        return self
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m) if m >= 128 else {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        pairs = [(index, rank) for index, rank in enumerate(self.registers) if rank]
+        if len(pairs) * 3 < self.m:
+            data = bytearray((SPARSE, self.p))
+            for index, rank in pairs:
+                data += bytes((index >> 8, index & 0xFF, rank))
+            return bytes(data)
+        return bytes((DENSE, self.p)) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        sketch = cls(p=data[1])
+        return sketch.merge_bytes(bytes(data))
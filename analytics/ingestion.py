@@ -0,0 +1,188 @@
+import ipaddress
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import countries, dedup
+from .models import Blog, BlogView
+from .signals import views_ingested
+
+User = get_user_model()
+
+MAX_REPORTED_ERRORS = 100
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+
+class InvalidEvent(ValueError):
+    pass
+
+
+def get_chunk_size():
+    return getattr(settings, 'ANALYTICS_INGEST_CHUNK_SIZE', 1000)
+
+
+def existing_ids(model_cls, ids):
+    """Return the subset of ids present in the table, in as few queries as the backend allows"""
+    ids = list(ids)
+    if not ids:
+        return set()
+    batch_size = connection.features.max_query_params or len(ids)
+    found = set()
+    for start in range(0, len(ids), batch_size):
+        found.update(
+            model_cls.objects.filter(pk__in=ids[start:start + batch_size]).values_list('pk', flat=True)
+        )
+    return found
+
+
+def _parse_id(value, name, required=False):
+    if value is None or value == '':
+        if required:
+            raise InvalidEvent(f"{name} is required")
+        return None
+    if isinstance(value, bool):
+        raise InvalidEvent(f"{name} must be an integer")
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise InvalidEvent(f"{name} must be an integer")
+    if not 0 < value < 2 ** 63:
+        raise InvalidEvent(f"{name} must be a positive integer")
+    return value
+
+
+def _parse_viewed_at(value, now):
+    if value is None or value == '':
+        return now
+    try:
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise InvalidEvent("viewed_at must be an ISO 8601 datetime")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    if parsed > now + MAX_CLOCK_SKEW:
+        raise InvalidEvent("viewed_at is in the future")
+    return parsed
+
+
+def _parse_country(value):
+    if value is None or value == '':
+        return None
+    if not isinstance(value, str) or len(value) > 100:
+        raise InvalidEvent("viewer_country must be a string of at most 100 characters")
+    return value
+
+
+def _parse_ip(value):
+    if value is None or value == '':
+        return None
+    try:
+        return str(ipaddress.ip_address(value))
+    except ValueError:
+        raise InvalidEvent("ip_address is not a valid IPv4 or IPv6 address")
+
+
+def parse_event(event, now):
+    """Turn one raw event dict into BlogView field values, raising InvalidEvent if malformed"""
+    if not isinstance(event, dict):
+        raise InvalidEvent("Event must be a JSON object")
+    return {
+        'blog_id': _parse_id(event.get('blog_id', event.get('blog')), 'blog_id', required=True),
+        'viewer_id': _parse_id(event.get('viewer_id', event.get('viewer')), 'viewer_id'),
+        'viewer_country': _parse_country(event.get('viewer_country')),
+        'viewed_at': _parse_viewed_at(event.get('viewed_at'), now),
+        'ip_address': _parse_ip(event.get('ip_address')),
+    }
+
+
+class IngestReport:
+    """Accepted/rejected counts for one ingested batch"""
+
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.unknown_countries = 0
+        self.errors = []
+
+    def reject(self, index, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'index': index, 'error': message})
+
+    def as_dict(self):
+        errors = sorted(self.errors, key=lambda error: error['index'])
+        return {'accepted': self.accepted, 'rejected': self.rejected, 'duplicates': self.duplicates,
+                'unknown_countries': self.unknown_countries, 'errors': errors}
+
+
+def ingest_view_events(events, chunk_size=None):
+    """Validate a batch of raw view events and store the valid ones with bulk_create
+
+    Blog and viewer ids are resolved with one lookup per batch. Returns a report
+    with accepted/rejected counts and the first MAX_REPORTED_ERRORS errors.
+    """
+    now = timezone.now()
+    report = IngestReport()
+    parsed = []
+    for index, event in enumerate(events):
+        try:
+            parsed.append((index, parse_event(event, now)))
+        except InvalidEvent as exc:
+            report.reject(index, str(exc))
+
+    return store_parsed_events(parsed, chunk_size, report).as_dict()
+
+
+def store_parsed_events(parsed, chunk_size=None, report=None):
+    """Resolve blog/viewer ids and country keys for (index, fields) pairs from parse_event and store the valid ones
+
+    Valid views that repeat one seen within the deduplication window are
+    counted as duplicates and not stored. Country names that are not in the
+    Country table are stored as NULL and counted: the endpoints are open, and
+    the table's small key would run out if any string could add a row.
+    """
+    report = report or IngestReport()
+    blog_ids = existing_ids(Blog, {fields['blog_id'] for _, fields in parsed})
+    viewer_ids = existing_ids(User, {fields['viewer_id'] for _, fields in parsed if fields['viewer_id'] is not None})
+    country_ids = countries.get_ids({fields['viewer_country'] for _, fields in parsed})
+
+    valid = []
+    for index, fields in parsed:
+        if fields['blog_id'] not in blog_ids:
+            report.reject(index, f"Blog {fields['blog_id']} does not exist")
+        elif fields['viewer_id'] is not None and fields['viewer_id'] not in viewer_ids:
+            report.reject(index, f"User {fields['viewer_id']} does not exist")
+        else:
+            valid.append((index, fields))
+    deduplicator = dedup.get_deduplicator()
+    valid, report.duplicates = deduplicator.filter(valid)
+
+    views = []
+    for _, fields in valid:
+        fields = dict(fields)
+        country = fields.pop('viewer_country')
+        fields['viewer_country_id'] = country_ids.get(country)
+        if country is not None and fields['viewer_country_id'] is None:
+            report.unknown_countries += 1
+        views.append(BlogView(**fields))
+
+    store_views(views, chunk_size)
+    # Only committed views count as seen, so a batch whose insert fails can be retried.
+    transaction.on_commit(lambda: deduplicator.record(valid))
+    report.accepted += len(views)
+    return report
+
+
+def store_views(views, chunk_size=None):
+    """Bulk insert already validated BlogView instances and notify listeners"""
+    if not views:
+        return views
+    with transaction.atomic():
+        views = BlogView.objects.bulk_create(views, batch_size=chunk_size or get_chunk_size())
+        views_ingested.send(sender=BlogView, views=views)
+    return views
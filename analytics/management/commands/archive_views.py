@@ -0,0 +1,34 @@
+import importlib.util
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from analytics import archive
+
+
+class Command(BaseCommand):
+    help = "Move BlogViews older than the retention horizon into monthly memory-mapped columnar segments"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--retention-days", type=int,
+                            default=getattr(settings, "ANALYTICS_ARCHIVE_RETENTION_DAYS", 365),
+                            help="Keep at least this many days of views in the database")
+        parser.add_argument("--chunk-size", type=int, default=100000, help="Rows read from the database per query")
+        parser.add_argument("--dry-run", action="store_true", help="Only print the horizon")
+
+    def handle(self, *args, **options):
+        if options["retention_days"] < 0:
+            raise CommandError("--retention-days must not be negative")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        if importlib.util.find_spec("numpy") is None:
+            raise CommandError("Archived views are read through the columnar engine, which requires numpy")
+
+        before = archive.horizon(options["retention_days"])
+        self.stdout.write(f"Archiving views before {before} into {archive.archive_dir()}")
+        if options["dry_run"]:
+            return
+
+        def log(month, count):
+            self.stdout.write(f"{month:%Y-%m}: {count} views")
+
+        moved = archive.archive_before(before, options["chunk_size"], log=log)
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} views"))
@@ -0,0 +1,61 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from analytics import benchmark
+
+
+def sizes(value):
+    try:
+        parsed = [int(size) for size in value.split(",")]
+    except ValueError:
+        raise CommandError("--sizes must be a comma-separated list of view counts")
+    if any(size < 1 for size in parsed):
+        raise CommandError("--sizes must be positive")
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Benchmark the analytics endpoints on synthetic datasets and optionally compare against a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10000,100000", help="Comma-separated dataset sizes in views")
+        parser.add_argument("--seed", type=int, default=1, help="Seed for the synthetic datasets")
+        parser.add_argument("--repeat", type=int, default=10, help="Timed requests per case")
+        parser.add_argument("--warmup", type=int, default=1, help="Untimed requests per case")
+        parser.add_argument("--case", help="Only run cases whose id contains this text, e.g. top/blog")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+        parser.add_argument("--baseline", help="Results JSON to compare against; exits non-zero on regressions")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Allowed relative slowdown of p50 and rows scanned")
+        parser.add_argument("--min-delta-ms", type=float, default=2.0,
+                            help="Ignore p50 slowdowns smaller than this many milliseconds")
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+
+        def log(views, case_id, result):
+            if options["verbosity"] >= 1:
+                self.stdout.write(
+                    f"{views:>10} {case_id:<45} p50 {result['p50_ms']:>9.2f}ms  p99 {result['p99_ms']:>9.2f}ms  "
+                    f"queries {result['queries']}"
+                )
+
+        results = benchmark.run(sizes(options["sizes"]), seed=options["seed"], repeat=options["repeat"],
+                                warmup=options["warmup"], case_filter=options["case"], log=log)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if baseline is not None:
+            regressions = benchmark.compare(results, baseline, options["tolerance"], options["min_delta_ms"])
+            if regressions:
+                for line in regressions:
+                    self.stderr.write(line)
+                raise CommandError(f"{len(regressions)} regressions against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
@@ -0,0 +1,48 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from analytics import benchmark
+
+
+def levels(value):
+    try:
+        parsed = [int(level) for level in value.split(",")]
+    except ValueError:
+        raise CommandError("--concurrency must be a comma-separated list of request counts")
+    if any(level < 1 for level in parsed):
+        raise CommandError("--concurrency must be positive")
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Compare the throughput of the sync (WSGI) and async (ASGI) analytics views under concurrent load"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--views", type=int, default=100000, help="Size of the synthetic dataset in views")
+        parser.add_argument("--seed", type=int, default=1, help="Seed for the synthetic dataset")
+        parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated numbers of requests in flight")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per server and concurrency level")
+        parser.add_argument("--case", help="Only use cases whose id contains this text, e.g. top/blog")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options["views"] < 1 or options["requests"] < 1:
+            raise CommandError("--views and --requests must be positive")
+        cases = [case for case in benchmark.build_cases() if not options["case"] or options["case"] in case[0]]
+        if not cases:
+            raise CommandError(f"No cases match {options['case']}")
+
+        def log(concurrency, result):
+            for server in ["wsgi", "asgi", "asgi_sync_views"]:
+                run = result[server]
+                self.stdout.write(
+                    f"{concurrency:>5} in flight  {server:<15}  {run['throughput']:>8.1f} req/s  "
+                    f"p50 {run['p50_ms']:>9.2f}ms  p99 {run['p99_ms']:>9.2f}ms  failures {run['failures']}"
+                )
+
+        results = benchmark.run_load(options["views"], options["seed"], levels(options["concurrency"]),
+                                     options["requests"], cases, log=log)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
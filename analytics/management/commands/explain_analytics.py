@@ -0,0 +1,50 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from analytics import benchmark
+from analytics.models import Blog
+
+
+class Command(BaseCommand):
+    help = "Explain the queries behind a catalogue of representative analytics requests and flag full table scans"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--case", help="Only run cases whose id contains this text, e.g. top/blog")
+        parser.add_argument("--output", help="Write every query report as JSON to this file")
+        parser.add_argument("--fail-on-full-scan", action="store_true",
+                            help="Exit non-zero if any case does a full scan of one of --tables")
+        parser.add_argument("--tables", default="analytics_blogview,analytics_dailyblogviewrollup,analytics_dailyviewersketch",
+                            help="Comma-separated large tables whose full scans are flagged")
+
+    def handle(self, *args, **options):
+        large_tables = {table for table in options["tables"].split(",") if table}
+        context = {"author_id": Blog.objects.order_by("id").values_list("author_id", flat=True).first()}
+        cases = [case for case in benchmark.build_cases() if not options["case"] or options["case"] in case[0]]
+
+        reports = {}
+        flagged = []
+        with override_settings(ANALYTICS_CACHE_ENABLED=False):
+            for case_id, path, params, variant in cases:
+                params = benchmark.resolve_params(params, variant, context)
+                status_code, report = benchmark.profile_case(path, params)
+                reports[case_id] = {"path": path, "params": params, "status": status_code, **report}
+                scans = sorted(set(report["full_scans"]) & large_tables)
+                line = f"{case_id:<45} {report['query_count']:>3} queries {report['total_ms']:>9.2f}ms"
+                if scans:
+                    flagged.append(case_id)
+                    self.stdout.write(self.style.WARNING(f"{line}  FULL SCAN {', '.join(scans)}"))
+                else:
+                    self.stdout.write(line)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(reports, f, indent=2, default=str)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if flagged:
+            message = f"{len(flagged)} of {len(cases)} cases do full table scans"
+            if options["fail_on_full_scan"]:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"No full table scans in {len(cases)} cases"))
@@ -0,0 +1,61 @@
+from datetime import datetime, time, timedelta
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from analytics import synthetic
+from analytics.models import HeavyHitterSnapshot
+from analytics.heavy_hitters import SNAPSHOT_NAME
+
+
+def date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+class Command(BaseCommand):
+    help = "Generate a reproducible synthetic dataset of users, blogs and BlogViews for load and capacity testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="Synthetic users to ensure exist")
+        parser.add_argument("--blogs", type=int, default=200, help="Blogs to create")
+        parser.add_argument("--views", type=int, default=100000, help="BlogView rows to insert")
+        parser.add_argument("--days", type=int, default=365, help="Days that views are spread over")
+        parser.add_argument("--end-date", type=date,
+                            help="Last day with views (YYYY-MM-DD); defaults to up to now. Fix it for repeatable data")
+        parser.add_argument("--blog-skew", type=float, default=1.1,
+                            help="Zipf exponent of blog popularity (0 = uniform)")
+        parser.add_argument("--country-skew", type=float, default=1.0,
+                            help="Zipf exponent of viewer countries (0 = uniform)")
+        parser.add_argument("--anonymous-ratio", type=float, default=0.2, help="Share of views without a viewer")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed; the same seed gives the same rows")
+        parser.add_argument("--batch-size", type=int, default=50000, help="Rows generated and committed per batch")
+        parser.add_argument("--skip-rollups", action="store_true",
+                            help="Do not rebuild rollups and sketches afterwards")
+
+    def handle(self, *args, **options):
+        for name in ("users", "blogs", "days", "batch_size"):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1")
+        if options["views"] < 0:
+            raise CommandError("--views must not be negative")
+        if not 0 <= options["anonymous_ratio"] <= 1:
+            raise CommandError("--anonymous-ratio must be between 0 and 1")
+
+        def progress(written, elapsed):
+            self.stdout.write(f"{written}/{options['views']} views ({written / max(elapsed, 1e-9):.0f} rows/s)")
+
+        end = None
+        if options["end_date"]:
+            end = timezone.make_aware(datetime.combine(options["end_date"] + timedelta(days=1), time.min))
+
+        written = synthetic.generate(
+            users=options["users"], blogs=options["blogs"], views=options["views"], days=options["days"], end=end,
+            blog_skew=options["blog_skew"], country_skew=options["country_skew"],
+            anonymous_ratio=options["anonymous_ratio"], seed=options["seed"],
+            batch_size=options["batch_size"], progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Inserted {written} views"))
+
+        # Views were inserted without views_ingested; let real-time rankings reseed from the table.
+        HeavyHitterSnapshot.objects.filter(name=SNAPSHOT_NAME).delete()
+        if not options["skip_rollups"]:
+            call_command("rebuild_rollups", stdout=self.stdout)
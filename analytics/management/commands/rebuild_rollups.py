@@ -0,0 +1,31 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from analytics import counters, rollups, sketches
+from analytics.conditional import bump_data_version
+
+
+def date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+class Command(BaseCommand):
+    help = "Backfill or rebuild the daily BlogView rollups, viewer sketches and per-blog counters from raw views"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start-date", type=date, help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--end-date", type=date, help="Last day to rebuild (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        start_date, end_date = options["start_date"], options["end_date"]
+        if start_date and end_date and start_date > end_date:
+            raise CommandError("--start-date must not be after --end-date")
+
+        inserted = rollups.rebuild(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt daily rollups: {inserted} rows"))
+        inserted = sketches.rebuild(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt daily viewer sketches: {inserted} rows"))
+        if start_date is None and end_date is None:
+            blogs, fixed = counters.repair()
+            self.stdout.write(self.style.SUCCESS(f"Reconciled per-blog view counters: {fixed} of {blogs} blogs fixed"))
+        # Rebuilt rows can change answers without a new view or blog change, so ETags issued before are stale.
+        bump_data_version()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from analytics import counters
+from analytics.conditional import bump_data_version
+
+
+class Command(BaseCommand):
+    help = "Reconcile the per-blog view counters with the raw views and archived segments"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report how many counters are wrong")
+
+    def handle(self, *args, **options):
+        blogs, fixed = counters.repair(dry_run=options["dry_run"])
+        if options["dry_run"]:
+            self.stdout.write(f"{fixed} of {blogs} blog counters are out of date")
+        else:
+            if fixed:
+                bump_data_version()
+            self.stdout.write(self.style.SUCCESS(f"Reconciled per-blog view counters: {fixed} of {blogs} blogs fixed"))
@@ -0,0 +1,202 @@
+import threading
+import time
+from bisect import bisect_left
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from analytics.concurrency import wrap_queries
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Query parameters that split an endpoint's series, with the values that get
+# their own label; anything else is reported as "other" to bound cardinality.
+PARAM_CLASSES = {
+    'range': {'day', 'week', 'month', 'year'},
+    'top': {'user', 'country', 'blog'},
+    'compare': {'day', 'week', 'month', 'year'},
+}
+
+COUNTERS = [
+    ('db_queries', 'analytics_db_queries_total', 'SQL queries run'),
+    ('db_seconds', 'analytics_db_query_seconds_total', 'Time spent in SQL queries'),
+    ('rows', 'analytics_result_rows_total', 'Result rows returned'),
+    ('bytes', 'analytics_response_bytes_total', 'Response payload bytes'),
+]
+
+
+def get_buckets():
+    return tuple(getattr(settings, 'ANALYTICS_METRICS_LATENCY_BUCKETS', DEFAULT_BUCKETS))
+
+
+class Series:
+    """Latency histogram and totals for one endpoint x parameter class x status"""
+    __slots__ = ('buckets', 'sum', 'count', 'db_queries', 'db_seconds', 'rows', 'bytes')
+
+    def __init__(self, n_buckets):
+        self.buckets = [0] * (n_buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+
+
+class Registry:
+    """In-process request metrics, rendered in the Prometheus text format"""
+
+    def __init__(self, buckets):
+        self.bucket_bounds = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds, db_queries, db_seconds, rows, size):
+        index = bisect_left(self.bucket_bounds, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = Series(len(self.bucket_bounds))
+            series.buckets[index] += 1
+            series.sum += seconds
+            series.count += 1
+            series.db_queries += db_queries
+            series.db_seconds += db_seconds
+            series.rows += rows
+            series.bytes += size
+
+    def render(self):
+        with self._lock:
+            snapshot = [
+                (labels, list(series.buckets), series.sum, series.count,
+                 {attr: getattr(series, attr) for attr, _, _ in COUNTERS})
+                for labels, series in sorted(self._series.items())
+            ]
+
+        lines = [
+            '# HELP analytics_request_duration_seconds Analytics request latency',
+            '# TYPE analytics_request_duration_seconds histogram',
+        ]
+        for labels, buckets, total, count, _ in snapshot:
+            label_text = format_labels(labels)
+            cumulative = 0
+            for bound, observed in zip([*map(repr, self.bucket_bounds), '+Inf'], buckets):
+                cumulative += observed
+                lines.append(f'analytics_request_duration_seconds_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'analytics_request_duration_seconds_sum{{{label_text}}} {total!r}')
+            lines.append(f'analytics_request_duration_seconds_count{{{label_text}}} {count}')
+        for attr, name, help_text in COUNTERS:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for labels, _, _, _, counters in snapshot:
+                lines.append(f'{name}{{{format_labels(labels)}}} {counters[attr]!r}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+def format_labels(labels):
+    endpoint, params, status_code = labels
+    return f'endpoint="{escape(endpoint)}",params="{escape(params)}",status="{status_code}"'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def param_class(query_params):
+    """'range=month', 'top=blog', ... from the request, or 'none'"""
+    classes = []
+    for name, allowed in PARAM_CLASSES.items():
+        value = query_params.get(name)
+        if value is not None:
+            classes.append(f"{name}={value if value in allowed else 'other'}")
+    return ','.join(classes) or 'none'
+
+
+def result_rows(data):
+    if isinstance(data, dict):
+        data = data.get('results', data.get('data'))
+    return len(data) if isinstance(data, list) else 0
+
+
+class QueryTimer:
+    """Counts queries and their time on every connection it is installed on"""
+    __slots__ = ('count', 'seconds', '_lock')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.seconds += elapsed
+                self.count += 1
+
+
+class MetricsMiddleware:
+    """Record latency, SQL and payload size of analytics requests and add a Server-Timing header
+
+    Only requests that resolve to a URL in the analytics app are recorded.
+    The per-request cost is one execute wrapper per database connection and
+    a short critical section to update the series. It runs natively in both
+    sync and async stacks, so it does not force the async views back onto a
+    single thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with wrap_queries(QueryTimer()) as timer:
+            response = self.get_response(request)
+        return self.record(request, response, timer, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with wrap_queries(QueryTimer()) as timer:
+            response = await self.get_response(request)
+        return self.record(request, response, timer, time.perf_counter() - started)
+
+    def record(self, request, response, timer, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        if match is None or not match.func.__module__.startswith('analytics.'):
+            return response
+
+        size = 0 if getattr(response, 'streaming', False) else len(response.content)
+        rows = result_rows(getattr(response, 'data', None))
+        get_registry().observe(
+            (match.url_name or match.view_name, param_class(request.GET), str(response.status_code)),
+            elapsed, timer.count, timer.seconds, rows, size,
+        )
+        response['Server-Timing'] = (
+            f'db;dur={timer.seconds * 1000:.2f};desc="{timer.count} queries", '
+            f'app;dur={(elapsed - timer.seconds) * 1000:.2f}, total;dur={elapsed * 1000:.2f}'
+        )
+        return response
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = Registry(get_buckets())
+    return _registry
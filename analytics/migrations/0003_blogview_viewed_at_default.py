@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-16 21:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blogview',
+            name='viewed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.9 on 2026-10-16 21:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_blogview_viewed_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyViewerSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('viewer_country', models.CharField(blank=True, max_length=100, null=True)),
+                ('sketch', models.BinaryField()),
+                ('blog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_viewer_sketches', to='analytics.blog')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'viewer_country'], name='analytics_d_day_6cbe88_idx'), models.Index(fields=['blog', 'day'], name='analytics_d_blog_id_d36b95_idx')],
+            },
+        ),
+    ]
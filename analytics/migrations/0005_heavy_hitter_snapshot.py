@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-16 21:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_daily_viewer_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeavyHitterSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('payload', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.9 on 2026-10-16 21:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_heavy_hitter_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopRankingSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query_key', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['query_key', 'created_at'], name='analytics_t_query_k_5226e0_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TopRankingEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField()),
+                ('label', models.CharField(max_length=255)),
+                ('total_views', models.BigIntegerField()),
+                ('secondary', models.BigIntegerField()),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='analytics.toprankingsnapshot')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['snapshot', '-total_views', 'id'], name='analytics_t_snapsho_e2fcf3_idx')],
+            },
+        ),
+    ]
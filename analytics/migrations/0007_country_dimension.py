@@ -0,0 +1,90 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# (model, old CharField, new foreign key) for every country column.
+COUNTRY_COLUMNS = [
+    ('blog', 'country_name', 'country'),
+    ('blogview', 'viewer_country_name', 'viewer_country'),
+    ('dailyblogviewrollup', 'viewer_country_name', 'viewer_country'),
+    ('dailyviewersketch', 'viewer_country_name', 'viewer_country'),
+]
+
+
+def country_key():
+    return models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT,
+                             related_name='+', to='analytics.country')
+
+
+def encode_countries(apps, schema_editor):
+    Country = apps.get_model('analytics', 'Country')
+    names = set()
+    for model_name, name_field, _ in COUNTRY_COLUMNS:
+        model = apps.get_model('analytics', model_name)
+        names.update(model.objects.exclude(**{f'{name_field}__isnull': True}).values_list(name_field, flat=True).distinct())
+    Country.objects.bulk_create([Country(name=name) for name in sorted(names)])
+    # One UPDATE per table, looking each name up through the unique index on Country.name;
+    # the old name indexes are already gone, so per-country UPDATEs would scan the table each time.
+    for model_name, name_field, key_field in COUNTRY_COLUMNS:
+        model = apps.get_model('analytics', model_name)
+        country_id = Country.objects.filter(name=OuterRef(name_field)).values('id')
+        model.objects.exclude(**{f'{name_field}__isnull': True}).update(**{f'{key_field}_id': Subquery(country_id)})
+    # Real-time counters were keyed on country names; they reseed from the table.
+    apps.get_model('analytics', 'HeavyHitterSnapshot').objects.all().delete()
+
+
+def decode_countries(apps, schema_editor):
+    Country = apps.get_model('analytics', 'Country')
+    for model_name, name_field, key_field in COUNTRY_COLUMNS:
+        model = apps.get_model('analytics', model_name)
+        name = Country.objects.filter(id=OuterRef(f'{key_field}_id')).values('name')
+        model.objects.exclude(**{f'{key_field}__isnull': True}).update(**{name_field: Subquery(name)})
+    apps.get_model('analytics', 'HeavyHitterSnapshot').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_top_ranking_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Country',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'countries',
+            },
+        ),
+        migrations.RemoveIndex(model_name='blogview', name='analytics_b_viewer__9267b9_idx'),
+        migrations.RemoveIndex(model_name='dailyblogviewrollup', name='analytics_d_day_afb99a_idx'),
+        migrations.RemoveIndex(model_name='dailyviewersketch', name='analytics_d_day_6cbe88_idx'),
+        *[
+            migrations.RenameField(model_name=model_name, old_name=key_field, new_name=name_field)
+            for model_name, name_field, key_field in COUNTRY_COLUMNS
+        ],
+        *[
+            migrations.AddField(model_name=model_name, name=key_field, field=country_key())
+            for model_name, _, key_field in COUNTRY_COLUMNS
+        ],
+        migrations.RunPython(encode_countries, decode_countries),
+        *[
+            migrations.RemoveField(model_name=model_name, name=name_field)
+            for model_name, name_field, _ in COUNTRY_COLUMNS
+        ],
+        migrations.AddIndex(
+            model_name='blogview',
+            index=models.Index(fields=['viewer_country'], name='analytics_b_viewer__59ad37_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyblogviewrollup',
+            index=models.Index(fields=['day', 'viewer_country'], name='analytics_d_day_982c76_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyviewersketch',
+            index=models.Index(fields=['day', 'viewer_country'], name='analytics_d_day_b598b6_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.9 on 2026-10-16 22:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_country_dimension'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogViewCounter',
+            fields=[
+                ('blog', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='view_counter', serialize=False, to='analytics.blog')),
+                ('total_views', models.BigIntegerField(default=0)),
+                ('viewer_sketch', models.BinaryField()),
+                ('unique_viewers', models.BigIntegerField(default=0)),
+                ('last_viewed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-total_views', 'blog'], name='analytics_b_total_v_36f6c8_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-16 22:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0008_blog_view_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['updated_at'], name='analytics_b_updated_a2d69d_idx'),
+        ),
+    ]
@@ -4,22 +4,40 @@ from django.utils import timezone
 
 User = get_user_model()
 
+class Country(models.Model):
+    """Country dimension; views, blogs, rollups and sketches store its small integer key"""
+    id = models.SmallAutoField(primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        verbose_name_plural = 'countries'
+
+    def __str__(self):
+        return self.name
+
 class Blog(models.Model):
     title = models.CharField(max_length=255)
     content = models.TextField()
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blogs')
-    country = models.CharField(max_length=100, blank=True, null=True)
+    country = models.ForeignKey(Country, on_delete=models.PROTECT, null=True, blank=True, db_index=False,
+                                related_name='+')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
+
     def __str__(self):
         return self.title
 
 class BlogView(models.Model):
     blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='views')
     viewer = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='blog_views')
-    viewer_country = models.CharField(max_length=100, blank=True, null=True)
-    viewed_at = models.DateTimeField(auto_now_add=True)
+    viewer_country = models.ForeignKey(Country, on_delete=models.PROTECT, null=True, blank=True, db_index=False,
+                                       related_name='+')
+    viewed_at = models.DateTimeField(default=timezone.now)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     
     class Meta:
@@ -30,4 +48,117 @@ class BlogView(models.Model):
         ]
 
     def __str__(self):
-        return f"View of {self.blog.title} at {self.viewed_at}"
\ No newline at end of file
+        return f"View of {self.blog.title} at {self.viewed_at}"
+
+class DailyBlogViewRollup(models.Model):
+    """Views per day x blog x viewer_country x viewer, maintained as views arrive"""
+    day = models.DateField()
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='daily_rollups')
+    viewer = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    viewer_country = models.ForeignKey(Country, on_delete=models.PROTECT, null=True, blank=True, db_index=False,
+                                       related_name='+')
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day', 'viewer_country']),
+            models.Index(fields=['blog', 'day']),
+            models.Index(fields=['viewer', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.views} views of blog {self.blog_id} on {self.day}"
+
+
+class BlogViewCounter(models.Model):
+    """All-time views, distinct viewer sketch and last view of one blog, maintained as views arrive"""
+    blog = models.OneToOneField(Blog, on_delete=models.CASCADE, primary_key=True, related_name='view_counter')
+    total_views = models.BigIntegerField(default=0)
+    viewer_sketch = models.BinaryField()
+    unique_viewers = models.BigIntegerField(default=0)
+    last_viewed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-total_views', 'blog']),
+        ]
+
+    def __str__(self):
+        return f"{self.total_views} views of blog {self.blog_id}"
+
+
+class RollupCheckpoint(models.Model):
+    """Marks a rollup table as fully backfilled so endpoints may read from it"""
+    name = models.CharField(max_length=100, unique=True)
+    last_view_id = models.BigIntegerField(default=0)
+    built_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} (through view {self.last_view_id})"
+
+
+class DataVersion(models.Model):
+    """Counter bumped by changes the conditional-request watermark cannot see: deletes and rebuilds"""
+    name = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+class DailyViewerSketch(models.Model):
+    """HyperLogLog sketch of distinct viewers per day x blog x viewer_country"""
+    day = models.DateField()
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='daily_viewer_sketches')
+    viewer_country = models.ForeignKey(Country, on_delete=models.PROTECT, null=True, blank=True, db_index=False,
+                                       related_name='+')
+    sketch = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day', 'viewer_country']),
+            models.Index(fields=['blog', 'day']),
+        ]
+
+    def __str__(self):
+        return f"Viewer sketch of blog {self.blog_id} on {self.day}"
+
+
+class HeavyHitterSnapshot(models.Model):
+    """Serialized streaming top-K counters, restored when a process starts"""
+    name = models.CharField(max_length=100, unique=True)
+    payload = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} at {self.updated_at}"
+
+
+class TopRankingSnapshot(models.Model):
+    """Ranking for one normalized /analytics/top/ query, materialized for keyset paging"""
+    query_key = models.CharField(max_length=64)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['query_key', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Ranking {self.query_key} at {self.created_at}"
+
+
+class TopRankingEntry(models.Model):
+    snapshot = models.ForeignKey(TopRankingSnapshot, on_delete=models.CASCADE, related_name='entries')
+    rank = models.PositiveIntegerField()
+    label = models.CharField(max_length=255)
+    total_views = models.BigIntegerField()
+    secondary = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['snapshot', '-total_views', 'id']),
+        ]
+
+    def __str__(self):
+        return f"#{self.rank} {self.label}"
@@ -0,0 +1,185 @@
+from datetime import date, datetime, time, timedelta
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count
+from django.utils import timezone
+from analytics.utils import AnalyticsCalculator, AnalyticsQueryBuilder
+from .models import BlogView
+
+# How each backend moves a truncated period to the start of the next one.
+PERIOD_STEPS = {
+    'sqlite': {
+        'day': "datetime({period}, '+1 day')",
+        'week': "datetime({period}, '+7 days')",
+        'month': "datetime({period}, '+1 month')",
+        'year': "datetime({period}, '+1 year')",
+    },
+    'postgresql': {
+        'day': "{period} + INTERVAL '1 day'",
+        'week': "{period} + INTERVAL '1 week'",
+        'month': "{period} + INTERVAL '1 month'",
+        'year': "{period} + INTERVAL '1 year'",
+    },
+    'mysql': {
+        'day': "DATE_ADD({period}, INTERVAL 1 DAY)",
+        'week': "DATE_ADD({period}, INTERVAL 1 WEEK)",
+        'month': "DATE_ADD({period}, INTERVAL 1 MONTH)",
+        'year': "DATE_ADD({period}, INTERVAL 1 YEAR)",
+    },
+}
+
+FLOAT_TYPES = {'sqlite': 'REAL', 'postgresql': 'DOUBLE PRECISION', 'mysql': 'DOUBLE'}
+
+
+def trunc_sql(connection, compare_type, sql, params=()):
+    tzname = timezone.get_current_timezone_name() if settings.USE_TZ else None
+    return connection.ops.datetime_trunc_sql(compare_type, sql, tuple(params), tzname)
+
+
+def bound_sql(connection, day, compare_type):
+    """SQL for the period containing ``day``, or NULL to take the bound from the data"""
+    if day is None:
+        return "NULL", ()
+    value = datetime.combine(day, time.min)
+    if settings.USE_TZ:
+        value = timezone.make_aware(value)
+    return trunc_sql(connection, compare_type, "%s", [connection.ops.adapt_datetimefield_value(value)])
+
+
+def as_period_date(period):
+    if isinstance(period, str):
+        return datetime.strptime(period[:10], "%Y-%m-%d").date()
+    return period.date() if isinstance(period, datetime) else period
+
+
+def performance_rows(blogs, compare_type, start_date=None, end_date=None):
+    """[(period date, blogs created, views, growth)] for every period in range, from one SQL statement
+
+    ``blogs`` is the filtered Blog queryset; views are counted for those blogs
+    by joining it, not by collecting ids. A calendar CTE generates every
+    period between the bounds (the date range, or the data when a bound is
+    missing), so periods without blogs or views appear with zeros. Growth is
+    computed with LAG over the calendar and matches
+    ``AnalyticsCalculator.calculate_growth``. Backends without a
+    PERIOD_STEPS entry get the same rows from ``orm_performance_rows``.
+    """
+    # Raw SQL bypasses the database routers, so it runs where the blogs queryset reads.
+    connection = connections[blogs.db]
+    vendor = connection.vendor
+    if vendor not in PERIOD_STEPS:
+        return orm_performance_rows(blogs, compare_type, start_date, end_date)
+    qn = connection.ops.quote_name
+    float_type = FLOAT_TYPES[vendor]
+
+    blog_sql, blog_params = blogs.values('id', 'created_at').query.sql_with_params()
+    views = BlogView.objects.all()
+    if start_date:
+        views = views.filter(viewed_at__gte=start_date)
+    if end_date:
+        views = views.filter(viewed_at__lt=end_date + timedelta(days=1))
+    view_sql, view_params = views.values('blog_id', 'viewed_at').query.sql_with_params()
+
+    blog_period, blog_period_params = trunc_sql(connection, compare_type, f"fb.{qn('created_at')}")
+    view_period, view_period_params = trunc_sql(connection, compare_type, f"v.{qn('viewed_at')}")
+    first_sql, first_params = bound_sql(connection, start_date, compare_type)
+    last_sql, last_params = bound_sql(connection, end_date, compare_type)
+    step = PERIOD_STEPS[vendor][compare_type]
+
+    sql = f"""
+        WITH RECURSIVE
+        filtered_blogs AS ({blog_sql}),
+        blog_counts AS (
+            SELECT {blog_period} AS period, COUNT(*) AS blogs
+            FROM filtered_blogs fb GROUP BY 1
+        ),
+        view_counts AS (
+            SELECT {view_period} AS period, COUNT(*) AS views
+            FROM ({view_sql}) v INNER JOIN filtered_blogs fb ON v.{qn('blog_id')} = fb.{qn('id')}
+            GROUP BY 1
+        ),
+        bounds AS (
+            SELECT COALESCE({first_sql}, MIN(period)) AS first_period, COALESCE({last_sql}, MAX(period)) AS last_period
+            FROM (SELECT period FROM blog_counts UNION ALL SELECT period FROM view_counts) data_periods
+        ),
+        calendar(period) AS (
+            SELECT first_period FROM bounds WHERE first_period <= last_period
+            UNION ALL
+            SELECT {step.format(period='calendar.period')} FROM calendar, bounds
+            WHERE {step.format(period='calendar.period')} <= bounds.last_period
+        ),
+        series AS (
+            SELECT calendar.period, COALESCE(blog_counts.blogs, 0) AS blogs, COALESCE(view_counts.views, 0) AS views,
+                   LAG(COALESCE(view_counts.views, 0)) OVER (ORDER BY calendar.period) AS previous_views
+            FROM calendar
+            LEFT JOIN blog_counts ON blog_counts.period = calendar.period
+            LEFT JOIN view_counts ON view_counts.period = calendar.period
+        )
+        SELECT period, blogs, views,
+               CASE
+                   WHEN previous_views IS NULL THEN NULL
+                   WHEN previous_views = 0 THEN CASE WHEN views > 0 THEN 100.0 ELSE 0.0 END
+                   ELSE (CAST(views - previous_views AS {float_type}) / previous_views) * 100
+               END AS growth
+        FROM series
+        ORDER BY period
+    """
+    params = (
+        *blog_params, *blog_period_params, *view_period_params, *view_params,
+        *first_params, *last_params,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            (as_period_date(period), blogs, views, None if growth is None else float(growth))
+            for period, blogs, views, growth in cursor.fetchall()
+        ]
+
+
+def period_start(day, compare_type):
+    """First day of the period containing ``day``, as the Trunc functions compute it"""
+    if compare_type == 'week':
+        return day - timedelta(days=day.weekday())
+    if compare_type == 'month':
+        return day.replace(day=1)
+    if compare_type == 'year':
+        return day.replace(month=1, day=1)
+    return day
+
+
+def next_period(day, compare_type):
+    if compare_type == 'day':
+        return day + timedelta(days=1)
+    if compare_type == 'week':
+        return day + timedelta(days=7)
+    if compare_type == 'month':
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return date(day.year + 1, 1, 1)
+
+
+def orm_performance_rows(blogs, compare_type, start_date=None, end_date=None):
+    """performance_rows from one grouped ORM query per table, with the calendar filled in here"""
+    trunc_func = AnalyticsQueryBuilder.get_time_trunc_func(compare_type)
+    views = BlogView.objects.using(blogs.db).filter(blog__in=blogs.values('id'))
+    views = AnalyticsQueryBuilder.apply_date_range(views, start_date, end_date, 'viewed_at')
+    blog_counts = dict(
+        blogs.annotate(period=trunc_func('created_at')).values_list('period').annotate(count=Count('id')).order_by()
+    )
+    view_counts = dict(
+        views.annotate(period=trunc_func('viewed_at')).values_list('period').annotate(count=Count('id')).order_by()
+    )
+    blog_counts = {as_period_date(period): count for period, count in blog_counts.items()}
+    view_counts = {as_period_date(period): count for period, count in view_counts.items()}
+
+    periods = blog_counts.keys() | view_counts.keys()
+    first = period_start(start_date, compare_type) if start_date else min(periods, default=None)
+    last = period_start(end_date, compare_type) if end_date else max(periods, default=None)
+    if first is None or last is None:
+        return []
+    rows = []
+    period, previous = first, None
+    while period <= last:
+        views_in_period = view_counts.get(period, 0)
+        growth = None if previous is None else AnalyticsCalculator.calculate_growth(views_in_period, previous)
+        rows.append((period, blog_counts.get(period, 0), views_in_period, growth))
+        period, previous = next_period(period, compare_type), views_in_period
+    return rows
@@ -0,0 +1,149 @@
+import json
+import re
+import time
+from contextlib import contextmanager
+from functools import wraps
+from django.db import connections
+from rest_framework import status
+from rest_framework.response import Response
+from analytics.concurrency import wrap_queries
+from analytics.utils import parse_bool
+
+SQLITE_INDEX = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+SQLITE_SCAN = re.compile(r'^(SCAN|SEARCH) (\w+)(?: AS \w+)?(.*)$')
+PG_INDEX_NODES = {'Index Scan', 'Index Only Scan', 'Bitmap Index Scan'}
+
+
+class QueryProfile:
+    """SQL, parameters, time, result size and database alias of every query run while capturing"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            connection = context['connection']
+            self.queries.append({
+                'sql': connection.ops.last_executed_query(context['cursor'], sql, params),
+                'raw_sql': sql,
+                'params': params,
+                'alias': connection.alias,
+                'time_ms': round(elapsed, 3),
+            })
+
+    def report(self):
+        """Per-query SQL, timing, row count, plan, indexes and full scans, plus totals
+
+        Plans and row counts are fetched after the request has finished, with
+        extra EXPLAIN and COUNT(*) queries that are not part of the report.
+        They run on the database alias (primary or replica) that served the query.
+        """
+        tables = {}
+        queries = []
+        for query in self.queries:
+            connection = connections[query['alias']]
+            entry = {'sql': query['sql'], 'database': query['alias'], 'time_ms': query['time_ms'], 'rows': None,
+                     'plan': None, 'indexes': [], 'full_scans': []}
+            if is_select(query['raw_sql']):
+                if query['alias'] not in tables:
+                    tables[query['alias']] = set(connection.introspection.table_names())
+                entry['rows'] = count_rows(connection, query['raw_sql'], query['params'])
+                entry['plan'], entry['indexes'], entry['full_scans'] = explain(
+                    connection, query['raw_sql'], query['params'], tables[query['alias']])
+            queries.append(entry)
+        return {
+            'vendor': connections['default'].vendor,
+            'queries': queries,
+            'query_count': len(queries),
+            'total_ms': round(sum(query['time_ms'] for query in queries), 3),
+            'full_scans': sorted({table for query in queries for table in query['full_scans']}),
+        }
+
+
+@contextmanager
+def capture():
+    """Record every query run inside the block, on any database alias and on pool threads"""
+    with wrap_queries(QueryProfile()) as profile:
+        yield profile
+
+
+def is_select(sql):
+    return sql.lstrip().upper().startswith(('SELECT', 'WITH'))
+
+
+def count_rows(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM ({sql}) profiled_rows", params)
+        return cursor.fetchone()[0]
+
+
+def explain(connection, sql, params, tables):
+    """(plan, indexes used, tables read by a full scan) from the backend's EXPLAIN on ``connection``"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = [row[-1] for row in cursor.fetchall()]
+            return (plan, *sqlite_access(plan, tables))
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            return (plan, *postgresql_access(plan[0]['Plan']))
+        if connection.vendor == 'mysql':
+            cursor.execute(f"EXPLAIN {sql}", params)
+            columns = [column[0] for column in cursor.description]
+            plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            indexes = [row['key'] for row in plan if row.get('key')]
+            full_scans = [row['table'] for row in plan if row.get('type') == 'ALL' and row.get('table') in tables]
+            return plan, indexes, full_scans
+    return None, [], []
+
+
+def sqlite_access(plan, tables):
+    indexes, full_scans = [], []
+    for detail in plan:
+        match = SQLITE_SCAN.match(detail)
+        if not match or match.group(2) not in tables:
+            continue
+        kind, table, rest = match.groups()
+        index = SQLITE_INDEX.search(rest)
+        if index:
+            indexes.append(index.group(1))
+        elif 'PRIMARY KEY' in rest:
+            indexes.append(f"{table} primary key")
+        elif 'AUTOMATIC' in rest:
+            indexes.append(f"{table} automatic index")
+        elif kind == 'SCAN':
+            full_scans.append(table)
+    return indexes, full_scans
+
+
+def postgresql_access(node):
+    indexes, full_scans = [], []
+    if node.get('Node Type') in PG_INDEX_NODES:
+        indexes.append(node['Index Name'])
+    elif node.get('Node Type') == 'Seq Scan':
+        full_scans.append(node['Relation Name'])
+    for child in node.get('Plans', []):
+        child_indexes, child_scans = postgresql_access(child)
+        indexes += child_indexes
+        full_scans += child_scans
+    return indexes, full_scans
+
+
+def explain_response(get):
+    """Serve ?explain=1 on an APIView.get: the payload next to a query report, for staff only"""
+    @wraps(get)
+    def wrapper(self, request, *args, **kwargs):
+        if not parse_bool(request.GET.get('explain')):
+            return get(self, request, *args, **kwargs)
+        if not request.user.is_staff:
+            return Response({'error': 'explain is only available to staff users'}, status=status.HTTP_403_FORBIDDEN)
+        with capture() as profile:
+            response = get(self, request, *args, **kwargs)
+        return Response({'data': response.data, 'explain': profile.report()}, status=response.status_code)
+    return wrapper
@@ -0,0 +1,86 @@
+import base64
+import binascii
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import TopRankingEntry, TopRankingSnapshot
+
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(Exception):
+    """Raised for a cursor that cannot be decoded or whose snapshot is gone"""
+
+
+def get_max_rows():
+    return getattr(settings, 'ANALYTICS_TOP_SNAPSHOT_MAX_ROWS', 10000)
+
+
+def get_fresh_snapshot(query_key):
+    """Newest snapshot for this query that is still within ANALYTICS_TOP_SNAPSHOT_TTL"""
+    ttl = getattr(settings, 'ANALYTICS_TOP_SNAPSHOT_TTL', 300)
+    return (
+        TopRankingSnapshot.objects
+        .filter(query_key=query_key, created_at__gte=timezone.now() - timedelta(seconds=ttl))
+        .order_by('-created_at').first()
+    )
+
+
+def materialize(query_key, rows, batch_size=1000):
+    """Store ranked {"rank","x","y","z"} rows as a new snapshot and prune expired ones"""
+    retention = getattr(settings, 'ANALYTICS_TOP_SNAPSHOT_RETENTION', 3600)
+    with transaction.atomic():
+        snapshot = TopRankingSnapshot.objects.create(query_key=query_key)
+        TopRankingEntry.objects.bulk_create(
+            [TopRankingEntry(snapshot=snapshot, rank=row['rank'], label=str(row['x'])[:255],
+                             total_views=row['y'], secondary=row['z']) for row in rows],
+            batch_size=batch_size,
+        )
+    # Cursors into a pruned snapshot become invalid, so keep them well past the TTL.
+    TopRankingSnapshot.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=retention)).delete()
+    return snapshot
+
+
+def get_page(snapshot, limit, after=None):
+    """Return (rows, next_cursor) for up to ``limit`` entries following ``after``
+
+    Entries are created in rank order, so (total_views desc, id asc) is the
+    ranking order and the page after a (total_views, id) position is a range
+    read on the snapshot index, whatever the depth.
+    """
+    entries = snapshot.entries.order_by('-total_views', 'id')
+    if after is not None:
+        total_views, entry_id = after
+        entries = entries.filter(Q(total_views__lt=total_views) | Q(total_views=total_views, id__gt=entry_id))
+    page = list(entries.values('id', 'rank', 'label', 'total_views', 'secondary')[:limit + 1])
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(snapshot.id, page[-1]['total_views'], page[-1]['id'])
+    rows = [{"rank": e['rank'], "x": e['label'], "y": e['total_views'], "z": e['secondary']} for e in page]
+    return rows, next_cursor
+
+
+def encode_cursor(snapshot_id, total_views, entry_id):
+    raw = json.dumps([snapshot_id, total_views, entry_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (snapshot, (total_views, entry_id)) for a cursor from ``get_page``"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        snapshot_id, total_views, entry_id = json.loads(raw)
+        if not all(isinstance(value, int) for value in (snapshot_id, total_views, entry_id)):
+            raise ValueError
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+    snapshot = TopRankingSnapshot.objects.filter(id=snapshot_id).first()
+    if snapshot is None:
+        raise InvalidCursor(cursor)
+    return snapshot, (total_views, entry_id)
@@ -0,0 +1,128 @@
+from collections import Counter
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from analytics import archive
+from analytics.utils import AnalyticsQueryBuilder
+from .models import BlogView, DailyBlogViewRollup, RollupCheckpoint
+
+CHECKPOINT_NAME = 'daily_blog_views'
+
+# BlogView fields that exist on the rollup with the same meaning, so filters
+# on them (and on anything reached through them) give identical answers.
+ROLLUP_FILTER_FIELDS = {'blog', 'blog_id', 'viewer', 'viewer_id', 'viewer_country'}
+
+_ready = False
+
+
+def rollups_enabled():
+    return getattr(settings, 'ANALYTICS_USE_ROLLUPS', True)
+
+
+def rollups_ready():
+    """True once the rollup table has been backfilled by rebuild_rollups"""
+    global _ready
+    if not _ready:
+        _ready = RollupCheckpoint.objects.filter(name=CHECKPOINT_NAME).exists()
+    return _ready
+
+
+def can_answer(plan):
+    """Check whether a compiled BlogView filter plan can be evaluated on the rollup table"""
+    if not rollups_enabled() or not rollups_ready():
+        return False
+    return plan.roots <= ROLLUP_FILTER_FIELDS
+
+
+def view_day(viewed_at):
+    """Day bucket of a view, matching TruncDate in the current time zone"""
+    if timezone.is_naive(viewed_at):
+        viewed_at = timezone.make_aware(viewed_at)
+    return timezone.localdate(viewed_at)
+
+
+def apply_views(views, batch_size=1000):
+    """Fold newly stored views into the daily rollup"""
+    counts = Counter(
+        (view_day(view.viewed_at), view.blog_id, view.viewer_id, view.viewer_country_id)
+        for view in views
+    )
+    keys = list(counts)
+    with transaction.atomic():
+        for start in range(0, len(keys), batch_size):
+            _apply_counts({key: counts[key] for key in keys[start:start + batch_size]}, batch_size)
+
+
+def _apply_counts(counts, batch_size):
+    days = {key[0] for key in counts}
+    blog_ids = {key[1] for key in counts}
+    viewer_ids = {key[2] for key in counts if key[2] is not None}
+
+    candidates = DailyBlogViewRollup.objects.filter(day__in=days, blog_id__in=blog_ids)
+    if len(viewer_ids) < len({key[2] for key in counts}):
+        candidates = candidates.filter(Q(viewer_id__in=viewer_ids) | Q(viewer__isnull=True))
+    else:
+        candidates = candidates.filter(viewer_id__in=viewer_ids)
+
+    existing = {}
+    for pk, day, blog_id, viewer_id, country in candidates.values_list(
+        'id', 'day', 'blog_id', 'viewer_id', 'viewer_country_id'
+    ):
+        existing.setdefault((day, blog_id, viewer_id, country), pk)
+
+    to_update = []
+    to_create = []
+    for key, views_count in counts.items():
+        if key in existing:
+            to_update.append(DailyBlogViewRollup(id=existing[key], views=F('views') + views_count))
+        else:
+            day, blog_id, viewer_id, country = key
+            to_create.append(DailyBlogViewRollup(
+                day=day, blog_id=blog_id, viewer_id=viewer_id, viewer_country_id=country, views=views_count
+            ))
+
+    if to_update:
+        DailyBlogViewRollup.objects.bulk_update(to_update, ['views'], batch_size=batch_size)
+    if to_create:
+        DailyBlogViewRollup.objects.bulk_create(to_create, batch_size=batch_size)
+
+
+def rebuild(start_date=None, end_date=None):
+    """Recompute rollup rows for a day range (everything by default) from the raw table
+
+    Archived months are skipped: their views are no longer in the raw table,
+    so the rollups are the only aggregate of them left.
+    """
+    hot = archive.hot_range(start_date, end_date)
+    if hot is None:
+        return 0
+    start_date, end_date = hot
+    views = AnalyticsQueryBuilder.apply_date_range(BlogView.objects.all(), start_date, end_date, 'viewed_at')
+    rollups = AnalyticsQueryBuilder.apply_date_range(DailyBlogViewRollup.objects.all(), start_date, end_date, 'day')
+
+    grouped = (
+        views.annotate(day=TruncDate('viewed_at'))
+        .values('blog_id', 'viewer_id', 'viewer_country', 'day')
+        .annotate(views=Count('id'))
+        .order_by()
+    )
+    select_sql, params = grouped.query.sql_with_params()
+    meta = DailyBlogViewRollup._meta
+    columns = ', '.join(
+        connection.ops.quote_name(meta.get_field(name).column)
+        for name in [*grouped.query.values_select, *grouped.query.annotation_select]
+    )
+
+    with transaction.atomic():
+        last_view_id = BlogView.objects.aggregate(last=Max('id'))['last'] or 0
+        rollups.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {connection.ops.quote_name(meta.db_table)} ({columns}) {select_sql}", params)
+            inserted = cursor.rowcount
+        RollupCheckpoint.objects.update_or_create(
+            name=CHECKPOINT_NAME,
+            defaults={'last_view_id': last_view_id, 'built_at': timezone.now()},
+        )
+    return inserted
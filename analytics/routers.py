@@ -0,0 +1,174 @@
+import itertools
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import DatabaseError, connections
+from analytics.utils import parse_bool
+
+# Bookkeeping tables that are written in one request and read back in a later
+# one (ranking snapshots behind cursors, checkpoints, counter snapshots).
+# A lagging replica would not have them yet, so they always use the primary.
+PRIMARY_MODELS = {
+    'analytics.rollupcheckpoint',
+    'analytics.toprankingsnapshot',
+    'analytics.toprankingentry',
+    'analytics.heavyhittersnapshot',
+}
+
+# Set on responses to writes, and accepted from clients, to read from the
+# primary for a while (read-your-writes).
+PIN_COOKIE = 'analytics_read_primary'
+PIN_HEADER = 'HTTP_X_ANALYTICS_READ_PRIMARY'
+
+# Lag in seconds of a replica: 0 while it has replayed everything it received.
+POSTGRESQL_LAG = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class ReadScope:
+    """Where the reads of one request go; ``alias`` is chosen on the first read and kept"""
+    __slots__ = ('pinned', 'alias')
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.alias = None
+
+
+_scope = ContextVar('analytics_read_scope', default=None)
+
+
+def get_replicas():
+    return list(getattr(settings, 'ANALYTICS_READ_REPLICAS', []))
+
+
+def replica_lag(alias):
+    """Replication lag of a database alias in seconds, or None when it cannot be read
+
+    SQLite stand-ins share the primary's file and never lag.
+    """
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(POSTGRESQL_LAG)
+                return float(cursor.fetchone()[0] or 0)
+            if connection.vendor == 'mysql':
+                cursor.execute("SHOW REPLICA STATUS")
+                row = cursor.fetchone()
+                if row is None:
+                    return 0.0
+                status = dict(zip([column[0] for column in cursor.description], row))
+                lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+                return None if lag is None else float(lag)
+    except DatabaseError:
+        return None
+    return 0.0
+
+
+class ReplicaHealth:
+    """Picks a replica round-robin among those whose last measured lag is acceptable
+
+    Lag is measured at most every ``interval`` seconds per process; a replica
+    that cannot be reached counts as lagging until the next measurement.
+    """
+
+    def __init__(self, interval, max_lag):
+        self.interval = interval
+        self.max_lag = max_lag
+        self._lags = {}
+        self._checked_at = None
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def healthy(self, replicas):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.interval:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= self.interval:
+                    self._lags = {alias: replica_lag(alias) for alias in replicas}
+                    self._checked_at = time.monotonic()
+        return [alias for alias in replicas
+                if self._lags.get(alias) is not None and self._lags[alias] <= self.max_lag]
+
+    def choose(self, replicas):
+        """A replica alias, or 'default' when none is caught up"""
+        healthy = self.healthy(replicas)
+        if not healthy:
+            return 'default'
+        return healthy[next(self._turn) % len(healthy)]
+
+
+_health = None
+_health_lock = threading.Lock()
+
+
+def get_health():
+    global _health
+    if _health is None:
+        with _health_lock:
+            if _health is None:
+                _health = ReplicaHealth(getattr(settings, 'ANALYTICS_REPLICA_CHECK_INTERVAL', 5.0),
+                                        getattr(settings, 'ANALYTICS_REPLICA_MAX_LAG', 5.0))
+    return _health
+
+
+class ReplicaRouter:
+    """Send the reads of analytics endpoints to a read replica; everything else uses the primary
+
+    Reads only leave the primary inside ``read_replica``. A write in the same
+    request pins its remaining reads to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        scope = _scope.get()
+        if scope is None or scope.pinned or model._meta.label_lower in PRIMARY_MODELS:
+            return None
+        if scope.alias is None:
+            replicas = get_replicas()
+            scope.alias = get_health().choose(replicas) if replicas else 'default'
+        return scope.alias
+
+    def db_for_write(self, model, **hints):
+        scope = _scope.get()
+        if scope is not None:
+            scope.pinned = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
+
+
+def reads_own_writes(request):
+    return PIN_COOKIE in request.COOKIES or parse_bool(request.META.get(PIN_HEADER))
+
+
+def read_replica(get):
+    """Let an APIView.get read from a replica, unless the client is reading its own writes"""
+    @wraps(get)
+    def wrapper(self, request, *args, **kwargs):
+        token = _scope.set(ReadScope(pinned=reads_own_writes(request)))
+        try:
+            return get(self, request, *args, **kwargs)
+        finally:
+            _scope.reset(token)
+    return wrapper
+
+
+def pin_to_primary(response):
+    """Make the client read from the primary for ANALYTICS_READ_YOUR_WRITES_SECONDS"""
+    seconds = getattr(settings, 'ANALYTICS_READ_YOUR_WRITES_SECONDS', 10)
+    if seconds and get_replicas():
+        response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+    return response
@@ -0,0 +1,19 @@
+import atexit
+from . import heavy_hitters
+from .buffer import shutdown_buffer
+
+_hook_installed = False
+
+
+def shutdown():
+    # Flush buffered views first so they are counted in the final snapshot.
+    shutdown_buffer()
+    heavy_hitters.save_loaded_snapshot()
+
+
+def install_shutdown_hook():
+    """Flush buffered views and persist in-memory counters when the server process exits"""
+    global _hook_installed
+    if not _hook_installed:
+        atexit.register(shutdown)
+        _hook_installed = True
@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from . import counters, countries, heavy_hitters, rollups, sketches
+from .cache import get_response_cache
+from .conditional import bump_data_version_on_commit
+from .models import Blog, BlogView, Country
+
+# Sent once per batch of newly stored views with ``views=[BlogView, ...]``.
+# Every write path funnels into this so derived structures stay in sync.
+views_ingested = Signal()
+
+
+@receiver(post_save, sender=BlogView)
+def forward_saved_view(sender, instance, created, **kwargs):
+    if created:
+        views_ingested.send(sender=BlogView, views=[instance])
+
+
+@receiver(views_ingested)
+def update_rollups(sender, views, **kwargs):
+    rollups.apply_views(views)
+
+
+@receiver(views_ingested)
+def update_viewer_sketches(sender, views, **kwargs):
+    sketches.apply_views(views)
+
+
+@receiver(views_ingested)
+def update_view_counters(sender, views, **kwargs):
+    counters.apply_views(views)
+
+
+@receiver(views_ingested)
+def count_heavy_hitters(sender, views, **kwargs):
+    transaction.on_commit(lambda: heavy_hitters.record_views(views))
+
+
+@receiver(views_ingested)
+def invalidate_cached_responses(sender, views, **kwargs):
+    days = [rollups.view_day(view.viewed_at) for view in views]
+    if days:
+        first_day, last_day = min(days), max(days)
+        transaction.on_commit(lambda: get_response_cache().invalidate_days(first_day, last_day))
+
+
+@receiver([post_save, post_delete], sender=Blog)
+def clear_cached_responses(sender, **kwargs):
+    # Blog edits change titles and creation counts across arbitrary periods.
+    transaction.on_commit(get_response_cache().clear)
+
+
+@receiver(post_delete, sender=Blog)
+@receiver(post_delete, sender=BlogView)
+def bump_data_version(sender, using, **kwargs):
+    # Deletes leave the largest view id and blog change where they were.
+    bump_data_version_on_commit(using)
+
+
+@receiver([post_save, post_delete], sender=Country)
+def clear_cached_countries(sender, created=False, **kwargs):
+    # New countries are looked up on demand; only renames and deletes invalidate.
+    if not created:
+        transaction.on_commit(countries.clear_cache)
@@ -0,0 +1,123 @@
+from collections import defaultdict
+from itertools import groupby
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from analytics import archive
+from analytics.hll import HyperLogLog
+from analytics.rollups import view_day
+from analytics.utils import AnalyticsQueryBuilder
+from .models import BlogView, DailyViewerSketch, RollupCheckpoint
+
+CHECKPOINT_NAME = 'daily_viewer_sketches'
+
+# Sketches have no viewer dimension, so only blog and country filters apply.
+SKETCH_FILTER_FIELDS = {'blog', 'blog_id', 'viewer_country'}
+
+_ready = False
+
+
+def sketches_ready():
+    """True once the sketch table has been backfilled by rebuild_rollups"""
+    global _ready
+    if not _ready:
+        _ready = RollupCheckpoint.objects.filter(name=CHECKPOINT_NAME).exists()
+    return _ready
+
+
+def can_answer(plan):
+    """Check whether approximate distinct counts can be served for a compiled BlogView filter plan"""
+    if not sketches_ready():
+        return False
+    return plan.roots <= SKETCH_FILTER_FIELDS
+
+
+def get_sketches(plan, start_date=None, end_date=None):
+    qs = DailyViewerSketch.objects.filter(plan.for_model(DailyViewerSketch).q)
+    return AnalyticsQueryBuilder.apply_date_range(qs, start_date, end_date, 'day')
+
+
+def merge_sketches(pairs):
+    """Approximate distinct viewers per group from (group, serialized sketch) pairs"""
+    groups = defaultdict(HyperLogLog)
+    for group, data in pairs:
+        groups[group].merge_bytes(data)
+    return {group: sketch.count() for group, sketch in groups.items()}
+
+
+def apply_views(views, batch_size=500):
+    """Add newly stored views to the per day x blog x country viewer sketches"""
+    groups = defaultdict(set)
+    for view in views:
+        viewers = groups[(view_day(view.viewed_at), view.blog_id, view.viewer_country_id)]
+        if view.viewer_id is not None:
+            viewers.add(view.viewer_id)
+
+    keys = list(groups)
+    with transaction.atomic():
+        for start in range(0, len(keys), batch_size):
+            _apply_groups({key: groups[key] for key in keys[start:start + batch_size]}, batch_size)
+
+
+def _apply_groups(groups, batch_size):
+    candidates = DailyViewerSketch.objects.select_for_update().filter(
+        day__in={key[0] for key in groups}, blog_id__in={key[1] for key in groups}
+    )
+    existing = {}
+    for row in candidates:
+        existing.setdefault((row.day, row.blog_id, row.viewer_country_id), row)
+
+    to_update = []
+    to_create = []
+    for key, viewers in groups.items():
+        row = existing.get(key)
+        if row is None:
+            day, blog_id, country = key
+            sketch = HyperLogLog().update(viewers)
+            to_create.append(DailyViewerSketch(day=day, blog_id=blog_id, viewer_country_id=country,
+                                               sketch=sketch.to_bytes()))
+        elif viewers:
+            sketch = HyperLogLog.from_bytes(row.sketch).update(viewers)
+            row.sketch = sketch.to_bytes()
+            to_update.append(row)
+
+    if to_update:
+        DailyViewerSketch.objects.bulk_update(to_update, ['sketch'], batch_size=batch_size)
+    if to_create:
+        DailyViewerSketch.objects.bulk_create(to_create, batch_size=batch_size)
+
+
+def rebuild(start_date=None, end_date=None, batch_size=1000):
+    """Recompute viewer sketches for a day range (everything by default) from the raw table, skipping archived months"""
+    hot = archive.hot_range(start_date, end_date)
+    if hot is None:
+        return 0
+    start_date, end_date = hot
+    views = AnalyticsQueryBuilder.apply_date_range(BlogView.objects.all(), start_date, end_date, 'viewed_at')
+    sketches = AnalyticsQueryBuilder.apply_date_range(DailyViewerSketch.objects.all(), start_date, end_date, 'day')
+
+    rows = (
+        views.annotate(day=TruncDate('viewed_at'))
+        .values_list('day', 'blog_id', 'viewer_country', 'viewer_id')
+        .order_by('day', 'blog_id', 'viewer_country')
+        .iterator(chunk_size=10000)
+    )
+
+    created = 0
+    with transaction.atomic():
+        last_view_id = BlogView.objects.aggregate(last=Max('id'))['last'] or 0
+        sketches.delete()
+        batch = []
+        for (day, blog_id, country), group in groupby(rows, key=lambda row: row[:3]):
+            sketch = HyperLogLog().update({row[3] for row in group if row[3] is not None})
+            batch.append(DailyViewerSketch(day=day, blog_id=blog_id, viewer_country_id=country, sketch=sketch.to_bytes()))
+            if len(batch) >= batch_size:
+                created += len(DailyViewerSketch.objects.bulk_create(batch))
+                batch = []
+        created += len(DailyViewerSketch.objects.bulk_create(batch))
+        RollupCheckpoint.objects.update_or_create(
+            name=CHECKPOINT_NAME,
+            defaults={'last_view_id': last_view_id, 'built_at': timezone.now()},
+        )
+    return created
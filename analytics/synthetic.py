@@ -0,0 +1,145 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import accumulate
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+from . import countries
+from .models import Blog, BlogView
+
+User = get_user_model()
+
+COUNTRIES = [
+    'USA', 'India', 'UK', 'Germany', 'Canada', 'Brazil', 'France', 'Japan', 'Australia', 'China',
+    'Spain', 'Italy', 'Mexico', 'Netherlands', 'Indonesia', 'Nigeria', 'Poland', 'Sweden', 'Turkey', 'Kenya',
+    'Argentina', 'South Korea', 'Pakistan', 'Egypt', 'Vietnam', 'Philippines', 'Norway', 'Ireland', 'Chile', 'Portugal',
+]
+
+# Relative traffic per UTC hour, busiest in the working day.
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 3, 5, 7, 8, 9, 9, 9, 9, 9, 8, 8, 7, 6, 5, 4, 3, 2, 1]
+
+VIEW_COLUMNS = ('blog_id', 'viewer_id', 'viewer_country_id', 'viewed_at')
+
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative weights giving rank k a share proportional to 1 / k ** exponent (0 is uniform)"""
+    return list(accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def create_users(count, prefix='synthetic_user_'):
+    """Ensure ``count`` synthetic users exist and return their ids"""
+    password = make_password(None)
+    usernames = [f"{prefix}{i}" for i in range(count)]
+    User.objects.bulk_create(
+        [User(username=name, email=f"{name}@example.com", password=password) for name in usernames],
+        batch_size=1000, ignore_conflicts=True,
+    )
+    ids = dict(User.objects.filter(username__startswith=prefix).values_list('username', 'id'))
+    return [ids[name] for name in usernames]
+
+
+def create_blogs(count, author_ids, rng, country_weights):
+    country_ids = countries.get_ids(COUNTRIES, create=True)
+    created = Blog.objects.bulk_create(
+        [
+            Blog(title=f"Synthetic blog #{i + 1}", content="Generated content",
+                 author_id=rng.choice(author_ids),
+                 country_id=country_ids[rng.choices(COUNTRIES, cum_weights=country_weights)[0]])
+            for i in range(count)
+        ],
+        batch_size=1000,
+    )
+    if created and created[0].pk is None:
+        # Backends that cannot return ids from bulk inserts.
+        return list(Blog.objects.order_by('-id').values_list('id', flat=True)[:count])[::-1]
+    return [blog.pk for blog in created]
+
+
+def generate_views(count, blog_ids, user_ids, rng, start, days, blog_skew=1.1, country_skew=1.0,
+                   anonymous_ratio=0.2, batch_size=50000):
+    """Yield lists of (blog_id, viewer_id, viewer_country_id, viewed_at) rows
+
+    Blog popularity and countries follow Zipf distributions; blog_ids[0] and
+    COUNTRIES[0] are the most popular. Viewed-at times are spread uniformly
+    over ``days`` days from ``start``, weighted by HOUR_WEIGHTS within a day.
+    Rows come out in viewed_at order, as real traffic arrives, which keeps
+    index inserts near the right-hand edge of the B-trees.
+    """
+    blog_weights = zipf_cum_weights(len(blog_ids), blog_skew)
+    country_weights = zipf_cum_weights(len(COUNTRIES), country_skew)
+    hour_weights = list(accumulate(HOUR_WEIGHTS))
+    hours = range(24)
+    start_ts = start.timestamp()
+    viewers = user_ids or [None]
+    country_ids = countries.get_ids(COUNTRIES, create=True)
+    country_keys = [country_ids[name] for name in COUNTRIES]
+
+    produced = 0
+    while produced < count:
+        n = min(batch_size, count - produced)
+        blogs = rng.choices(blog_ids, cum_weights=blog_weights, k=n)
+        chosen_countries = rng.choices(country_keys, cum_weights=country_weights, k=n)
+        chosen_hours = rng.choices(hours, cum_weights=hour_weights, k=n)
+        # Each batch covers its share of the day span, so batches follow each other in time.
+        first_day = days * produced // count
+        day_span = max(1, days * (produced + n) // count - first_day)
+        randrange, rand = rng.randrange, rng.random
+        stamps = sorted(
+            start_ts + (first_day + randrange(day_span)) * 86400 + hour * 3600 + randrange(3600)
+            for hour in chosen_hours
+        )
+        rows = []
+        for i in range(n):
+            viewer = None if rand() < anonymous_ratio else viewers[randrange(len(viewers))]
+            rows.append((blogs[i], viewer, chosen_countries[i], datetime.fromtimestamp(stamps[i], dt_timezone.utc)))
+        produced += n
+        yield rows
+
+
+def insert_views(rows):
+    """Write rows with multi-row INSERT statements sized to the backend's parameter limit"""
+    table = connection.ops.quote_name(BlogView._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(column) for column in VIEW_COLUMNS)
+    max_params = connection.features.max_query_params or 4000
+    per_statement = max(1, min(1000, max_params // len(VIEW_COLUMNS)))
+    adapt = connection.ops.adapt_datetimefield_value
+    placeholder = '(' + ', '.join(['%s'] * len(VIEW_COLUMNS)) + ')'
+
+    with connection.cursor() as cursor:
+        for offset in range(0, len(rows), per_statement):
+            chunk = rows[offset:offset + per_statement]
+            params = []
+            for blog_id, viewer_id, country, viewed_at in chunk:
+                params.extend((blog_id, viewer_id, country, adapt(viewed_at)))
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join([placeholder] * len(chunk))}", params
+            )
+
+
+def generate(users=1000, blogs=200, views=100000, days=365, end=None, blog_skew=1.1, country_skew=1.0,
+             anonymous_ratio=0.2, seed=0, batch_size=50000, progress=None):
+    """Create synthetic users, blogs and views; returns the number of views written
+
+    The same seed and arguments always produce the same rows. Views are
+    inserted directly, bypassing ``views_ingested``, so rollups and sketches
+    must be rebuilt afterwards.
+    """
+    rng = random.Random(seed)
+    end = end or timezone.now()
+    start = (end - timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+
+    user_ids = create_users(users)
+    blog_ids = create_blogs(blogs, user_ids, rng, zipf_cum_weights(len(COUNTRIES), country_skew))
+
+    written = 0
+    started = time.monotonic()
+    for rows in generate_views(views, blog_ids, user_ids, rng, start, days, blog_skew, country_skew,
+                               anonymous_ratio, batch_size):
+        with transaction.atomic():
+            insert_views(rows)
+        written += len(rows)
+        if progress:
+            progress(written, time.monotonic() - started)
+    return written
@@ -1,3 +1,706 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from analytics import (archive, batch, benchmark, columnar, concurrency, counters, countries, dedup, encoding, export,
+                       heavy_hitters, ingestion, metrics, performance, rollups, routers, sketches, synthetic)
+from analytics.buffer import IngestionBuffer
+from analytics.cache import get_ttl
+from analytics.heavy_hitters import HeavyHitterTracker
+from analytics.hll import HyperLogLog
+from analytics.performance import next_period, orm_performance_rows, performance_rows
+from analytics.trending import TrendingTracker
+from analytics.models import Blog, BlogView, BlogViewCounter, Country, HeavyHitterSnapshot
+from analytics.utils import AnalyticsCalculator, AnalyticsQueryBuilder
 
-# Create your tests here.
+
+class IngestionBufferTests(SimpleTestCase):
+    def make_buffer(self, **kwargs):
+        buffer = IngestionBuffer(**kwargs)
+        self.addCleanup(buffer.shutdown, 1)
+        return buffer
+
+    def wait_for(self, condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_flushes_after_interval_below_flush_size(self):
+        batches = []
+        with mock.patch.object(ingestion, 'store_parsed_events',
+                               side_effect=lambda parsed: batches.append(parsed) or ingestion.IngestReport()):
+            buffer = self.make_buffer(flush_size=100, flush_interval=0.1)
+            buffer.put({'blog_id': 1})
+            self.assertTrue(self.wait_for(lambda: batches))
+            # A second event after the queue drained starts a new interval.
+            buffer.put({'blog_id': 2})
+            self.assertTrue(self.wait_for(lambda: len(batches) == 2))
+        self.assertEqual([[fields for _, fields in batch] for batch in batches], [[{'blog_id': 1}], [{'blog_id': 2}]])
+        self.assertEqual(len(buffer), 0)
+
+    def test_flushes_at_flush_size_before_interval(self):
+        batches = []
+        with mock.patch.object(ingestion, 'store_parsed_events',
+                               side_effect=lambda parsed: batches.append(parsed) or ingestion.IngestReport()):
+            buffer = self.make_buffer(flush_size=3, flush_interval=60)
+            for blog_id in range(3):
+                buffer.put({'blog_id': blog_id})
+            self.assertTrue(self.wait_for(lambda: batches))
+        self.assertEqual(len(batches[0]), 3)
+
+
+class CacheTTLTests(SimpleTestCase):
+    @override_settings(ANALYTICS_CACHE_CLOSED_TTL=120, ANALYTICS_CACHE_TTLS={'top': 60})
+    def test_closed_periods_expire(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        self.assertEqual(get_ttl('top', {}, yesterday), 120)
+        self.assertEqual(get_ttl('top', {}, None), 60)
+
+
+class CountryCacheTests(TestCase):
+    def test_rename_clears_cached_names(self):
+        country_id = countries.get_id('Atlantis', create=True)
+        self.assertEqual(countries.get_names([country_id]), {country_id: 'Atlantis'})
+        with self.captureOnCommitCallbacks(execute=True):
+            Country(id=country_id, name='Lemuria').save()
+        self.assertEqual(countries.get_names([country_id]), {country_id: 'Lemuria'})
+        self.assertIsNone(countries.get_id('Atlantis'))
+
+    def test_rename_drops_compiled_plans(self):
+        country_id = countries.get_id('Atlantis', create=True)
+        filters = json.dumps([{'field': 'viewer_country', 'operator': 'eq', 'value': 'Atlantis'}])
+        predicate, = AnalyticsQueryBuilder.compile_filters(BlogView, filters).predicates
+        self.assertEqual((predicate.field, predicate.value), ('viewer_country', country_id))
+        with self.captureOnCommitCallbacks(execute=True):
+            Country(id=country_id, name='Lemuria').save()
+        predicate, = AnalyticsQueryBuilder.compile_filters(BlogView, filters).predicates
+        self.assertEqual((predicate.field, predicate.value), ('viewer_country__name', 'Atlantis'))
+
+
+class HeavyHitterSnapshotTests(TestCase):
+    def save_from(self, tracker):
+        heavy_hitters._tracker = tracker
+        self.addCleanup(setattr, heavy_hitters, '_tracker', None)
+        heavy_hitters.save_snapshot()
+
+    def test_snapshots_merge_across_processes(self):
+        first, second = HeavyHitterTracker(capacity=10), HeavyHitterTracker(capacity=10)
+        first.update([BlogView(blog_id=1) for _ in range(3)])
+        self.save_from(first)
+        second.update([BlogView(blog_id=2) for _ in range(2)])
+        self.save_from(second)
+        first.update([BlogView(blog_id=2)])
+        self.save_from(first)
+
+        expected = [(2, 3, 0), (1, 3, 0)]
+        stored = HeavyHitterTracker(capacity=10)
+        stored.load_payload(HeavyHitterSnapshot.objects.get(name=heavy_hitters.SNAPSHOT_NAME).payload)
+        self.assertCountEqual(stored.top('blog'), expected)
+        self.assertCountEqual(stored.top('blog', rolling=True), expected)
+        self.assertCountEqual(first.top('blog'), expected)
+        # The second process picks up the first one's views on its next save.
+        self.assertCountEqual(second.top('blog'), [(1, 3, 0), (2, 2, 0)])
+        self.save_from(second)
+        self.assertCountEqual(second.top('blog'), expected)
+
+
+class ViewCounterTests(TestCase):
+    def test_counter_created_by_a_concurrent_batch_keeps_its_views(self):
+        author, reader = (get_user_model().objects.create(username=name) for name in ('author', 'reader'))
+        blog = Blog.objects.create(title='Post', content='', author=author)
+        now = timezone.now()
+        locked_counters = counters._locked_counters
+
+        def insert_concurrently(blog_ids):
+            rows = locked_counters(blog_ids)
+            if not BlogViewCounter.objects.exists():
+                # Another batch stores the blog's first counter after this one found none.
+                BlogViewCounter.objects.create(blog=blog, total_views=5, unique_viewers=1, last_viewed_at=now,
+                                               viewer_sketch=HyperLogLog().update([author.id]).to_bytes())
+            return rows
+
+        with mock.patch.object(counters, '_locked_counters', side_effect=insert_concurrently):
+            counters.apply_views([BlogView(blog=blog, viewer=reader, viewed_at=now) for _ in range(2)])
+        counter = BlogViewCounter.objects.get(blog=blog)
+        self.assertEqual((counter.total_views, counter.unique_viewers), (7, 2))
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class ViewIngestionTests(TestCase):
+    def setUp(self):
+        dedup._deduplicator = dedup.LRUDeduplicator(window=30, max_keys=100)
+        self.addCleanup(setattr, dedup, '_deduplicator', None)
+        self.addCleanup(countries.clear_cache)
+        author = get_user_model().objects.create(username='author')
+        self.blog = Blog.objects.create(title='Post', content='', author=author)
+
+    def post_batch(self, events, content_type='application/json'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/analytics/views/batch/', events, content_type=content_type)
+
+    def events(self):
+        """Two valid events and three invalid ones, at indexes 1, 3 and 4"""
+        return [
+            {'blog_id': self.blog.id, 'ip_address': '10.0.0.1'},
+            {'blog_id': self.blog.id + 1000},
+            {'blog_id': str(self.blog.id), 'viewed_at': '2025-01-01T12:00:00Z', 'ip_address': '10.0.0.2'},
+            {'blog_id': self.blog.id, 'viewed_at': 'yesterday'},
+            {'viewer_id': 1},
+        ]
+
+    def assertReport(self, response, accepted, rejected_indexes):
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report['accepted'], report['rejected']), (accepted, len(rejected_indexes)))
+        self.assertEqual([error['index'] for error in report['errors']], rejected_indexes)
+        self.assertEqual(BlogView.objects.count(), accepted)
+
+    def test_json_batch_reports_accepted_and_rejected_events(self):
+        self.assertReport(self.post_batch(self.events()), 2, [1, 3, 4])
+
+    def test_json_object_batch_reports_accepted_and_rejected_events(self):
+        self.assertReport(self.post_batch({'events': self.events()}), 2, [1, 3, 4])
+
+    def test_ndjson_batch_reports_accepted_and_rejected_events(self):
+        lines = [json.dumps(event) for event in self.events()]
+        lines.insert(2, '{"blog_id": ')
+        body = '\n'.join(lines) + '\n\n'
+        self.assertReport(self.post_batch(body, 'application/x-ndjson'), 2, [1, 2, 4, 5])
+
+    def test_body_that_is_not_a_list_is_rejected(self):
+        response = self.post_batch({'blog_id': self.blog.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(BlogView.objects.exists())
+
+    def test_unknown_countries_are_stored_without_creating_rows(self):
+        usa = countries.get_id('USA', create=True)
+        response = self.post_batch([
+            {'blog_id': self.blog.id, 'viewer_country': 'USA', 'ip_address': '10.0.0.1'},
+            {'blog_id': self.blog.id, 'viewer_country': 'Narnia', 'ip_address': '10.0.0.2'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['accepted'], response.json()['unknown_countries']), (2, 1))
+        self.assertCountEqual(BlogView.objects.values_list('viewer_country', flat=True), [usa, None])
+        self.assertFalse(Country.objects.filter(name='Narnia').exists())
+
+
+class TrendingTests(TestCase):
+    def test_rising_keys_rank_by_rate_above_their_baseline(self):
+        author = get_user_model().objects.create(username='author')
+        steady, burst, fading = (Blog.objects.create(title=title, content='', author=author)
+                                 for title in ('steady', 'burst', 'fading'))
+        now = time.time() // 60 * 60 + 30
+
+        def store(blog, minutes_ago, per_minute):
+            BlogView.objects.bulk_create(
+                BlogView(blog=blog, viewed_at=datetime.fromtimestamp(now - 60 * minutes, tz=dt_timezone.utc))
+                for minutes in minutes_ago for _ in range(per_minute)
+            )
+
+        store(steady, range(1, 61), 2)
+        store(fading, range(40, 61), 5)
+        store(burst, range(1, 4), 10)
+        tracker = TrendingTracker(windows=(5,), capacity=100)
+        tracker.catch_up(now)
+        self.assertEqual([key for key, _, _ in tracker.trending('blog', 5, now=now)], [burst.id, steady.id])
+
+        # Views stored by another process are counted on the next catch-up.
+        store(fading, [1], 60)
+        tracker.catch_up(now)
+        self.assertEqual([key for key, _, _ in tracker.trending('blog', 5, now=now)], [fading.id, burst.id, steady.id])
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], ANALYTICS_READ_REPLICAS=['replica1', 'replica2', 'replica3'])
+class ReplicaRoutingTests(TestCase):
+    def read_alias(self, model, **headers):
+        """Alias the router picks for a read of ``model`` inside read_replica"""
+        class View:
+            @routers.read_replica
+            def get(self, request):
+                return routers.ReplicaRouter().db_for_read(model)
+
+        return View().get(RequestFactory().get('/analytics/top/', **headers))
+
+    def test_lagging_and_unreachable_replicas_are_skipped(self):
+        health = routers.ReplicaHealth(interval=60, max_lag=5)
+        lags = {'replica1': 1.0, 'replica2': 30.0, 'replica3': None}
+        with mock.patch.object(routers, 'replica_lag', side_effect=lags.get):
+            self.assertEqual({health.choose(list(lags)) for _ in range(4)}, {'replica1'})
+        health = routers.ReplicaHealth(interval=60, max_lag=5)
+        with mock.patch.object(routers, 'replica_lag', return_value=None):
+            self.assertEqual(health.choose(list(lags)), 'default')
+
+    def test_reads_go_to_a_healthy_replica_unless_pinned(self):
+        with mock.patch.object(routers, 'replica_lag', return_value=0.0), \
+                mock.patch.object(routers, '_health', routers.ReplicaHealth(interval=60, max_lag=5)):
+            self.assertIn(self.read_alias(BlogView), routers.get_replicas())
+            self.assertIsNone(self.read_alias(HeavyHitterSnapshot))
+            self.assertIsNone(self.read_alias(BlogView, HTTP_X_ANALYTICS_READ_PRIMARY='1'))
+            self.assertIsNone(self.read_alias(BlogView, HTTP_COOKIE=f'{routers.PIN_COOKIE}=1'))
+        self.assertIsNone(routers.ReplicaRouter().db_for_read(BlogView))
+
+    def test_ingesting_pins_the_client_to_the_primary(self):
+        author = get_user_model().objects.create(username='author')
+        blog = Blog.objects.create(title='Post', content='', author=author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/analytics/views/batch/', [{'blog_id': blog.id}],
+                                        content_type='application/json')
+        cookie = response.cookies[routers.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 10)
+        self.assertTrue(cookie['httponly'])
+        with override_settings(ANALYTICS_READ_REPLICAS=[]):
+            response = self.client.post('/analytics/views/batch/', [], content_type='application/json')
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_a_write_pins_the_rest_of_the_request(self):
+        class View:
+            @routers.read_replica
+            def get(self, request):
+                router = routers.ReplicaRouter()
+                before = router.db_for_read(BlogView)
+                router.db_for_write(BlogView)
+                return before, router.db_for_read(BlogView)
+
+        with mock.patch.object(routers, 'replica_lag', return_value=0.0), \
+                mock.patch.object(routers, '_health', routers.ReplicaHealth(interval=60, max_lag=5)):
+            before, after = View().get(RequestFactory().get('/analytics/top/'))
+        self.assertIn(before, routers.get_replicas())
+        self.assertIsNone(after)
+
+
+class DeduplicationTests(TestCase):
+    def setUp(self):
+        dedup._deduplicator = dedup.LRUDeduplicator(window=30, max_keys=100)
+        self.addCleanup(setattr, dedup, '_deduplicator', None)
+        author = get_user_model().objects.create(username='author')
+        self.blog = Blog.objects.create(title='Post', content='', author=author)
+        self.now = timezone.now()
+
+    def ingest(self, *seconds):
+        parsed = [(i, {'blog_id': self.blog.id, 'viewer_id': None, 'viewer_country': None,
+                       'viewed_at': self.now + timedelta(seconds=second), 'ip_address': '10.0.0.1'})
+                  for i, second in enumerate(seconds)]
+        with self.captureOnCommitCallbacks(execute=True):
+            return ingestion.store_parsed_events(parsed)
+
+    def test_repeats_inside_the_window_are_dropped(self):
+        report = self.ingest(0, 10, 40)
+        self.assertEqual((report.accepted, report.duplicates), (2, 1))
+        report = self.ingest(45, 80)
+        self.assertEqual((report.accepted, report.duplicates), (1, 1))
+        self.assertEqual(BlogView.objects.count(), 3)
+
+    def test_failed_insert_does_not_mark_views_as_seen(self):
+        with mock.patch.object(ingestion, 'store_views', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.ingest(0)
+        report = self.ingest(0)
+        self.assertEqual((report.accepted, report.duplicates), (1, 0))
+
+
+def reset_process_state():
+    """Forget per-process caches that would outlive a test class's data"""
+    countries.clear_cache()
+    rollups._ready = sketches._ready = counters._ready = False
+    columnar._store = None
+
+
+class AnalyticsDataTestCase(TestCase):
+    """Synthetic views with rollups, sketches and counters built, served uncached and with nothing archived"""
+
+    @classmethod
+    def setUpClass(cls):
+        archive_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(archive_dir.cleanup)
+        overrides = override_settings(ALLOWED_HOSTS=['testserver'], ANALYTICS_CACHE_ENABLED=False,
+                                      ANALYTICS_ARCHIVE_DIR=archive_dir.name)
+        overrides.enable()
+        cls.addClassCleanup(overrides.disable)
+        reset_process_state()
+        cls.addClassCleanup(reset_process_state)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        synthetic.generate(users=20, blogs=10, views=3000, seed=1)
+        rollups.rebuild()
+        sketches.rebuild()
+        counters.repair()
+        cls.context = {'author_id': Blog.objects.order_by('id').values_list('author_id', flat=True).first()}
+
+    def assertSameRows(self, actual, expected):
+        """assertEqual for large payloads: report the first differing row instead of diffing the whole list"""
+        if actual == expected:
+            return
+        if isinstance(actual, list) and isinstance(expected, list):
+            for i, (got, want) in enumerate(zip(actual, expected)):
+                if got != want:
+                    self.fail(f"row {i}: {got!r} != {want!r}")
+            self.fail(f"{len(actual)} rows != {len(expected)} rows")
+        self.fail(f"{actual!r:.500} != {expected!r:.500}")
+
+    def exact_cases(self):
+        """(case id, path, params) of the benchmark catalogue, leaving out approx=true"""
+        for case_id, path, params, variant in benchmark.build_cases():
+            if 'approx' not in params:
+                yield case_id, path, benchmark.resolve_params(params, variant, self.context)
+
+
+class EquivalenceTests(AnalyticsDataTestCase):
+    def test_rollups_match_raw_views(self):
+        for case_id, path, params in self.exact_cases():
+            with self.subTest(case_id):
+                with override_settings(ANALYTICS_USE_ROLLUPS=False):
+                    raw = self.client.get(path, params)
+                response = self.client.get(path, params)
+                self.assertEqual(response.status_code, 200)
+                self.assertSameRows(response.json(), raw.json())
+
+    @override_settings(ANALYTICS_COLUMNAR_ENABLED=True)
+    def test_columnar_engine_matches_orm(self):
+        for case_id, path, params in self.exact_cases():
+            with self.subTest(case_id):
+                response = self.client.get(path, {**params, 'engine': 'columnar'})
+                self.assertEqual(response.status_code, 200)
+                self.assertSameRows(response.json(), self.client.get(path, params).json())
+
+    def test_batch_matches_individual_requests(self):
+        start_date = (timezone.localdate() - timedelta(days=60)).isoformat()
+        usa = [{'field': 'viewer_country', 'operator': 'eq', 'value': 'USA'}]
+        specs = [
+            {'endpoint': 'blog-views', 'object_type': 'country', 'range': 'week', 'start_date': start_date},
+            {'endpoint': 'blog-views', 'object_type': 'user', 'range': 'month', 'start_date': start_date},
+            {'endpoint': 'top', 'top': 'blog', 'start_date': start_date},
+            {'endpoint': 'top', 'top': 'user', 'start_date': start_date},
+            {'endpoint': 'top', 'top': 'country', 'start_date': start_date},
+            {'endpoint': 'blog-views', 'object_type': 'user', 'range': 'day', 'filters': usa},
+            {'endpoint': 'top', 'top': 'user', 'filters': usa},
+            {'endpoint': 'top', 'top': 'blog', 'approx': True},
+            {'endpoint': 'performance', 'compare': 'week'},
+            {'endpoint': 'top', 'top': 'nothing'},
+        ]
+        expected = [self.client.get(f"/analytics/{spec['endpoint']}/", batch.query_params(spec)) for spec in specs]
+        # The second run is over the shared scan's row cap, so every spec runs on its own.
+        for max_rows in (200000, 10):
+            with self.subTest(max_rows=max_rows), override_settings(ANALYTICS_BATCH_SCAN_MAX_ROWS=max_rows):
+                response = self.client.post('/analytics/query/', json.dumps({'queries': specs}),
+                                            content_type='application/json')
+                self.assertEqual(response.status_code, 200)
+                results = response.json()['results']
+                self.assertEqual([result['status'] for result in results], [r.status_code for r in expected])
+                for result, individual in zip(results, expected):
+                    self.assertSameRows(result['data'], individual.json())
+
+
+class TopPaginationTests(AnalyticsDataTestCase):
+    def pages(self, params, limit):
+        rows, cursor = [], None
+        while True:
+            page = self.client.get('/analytics/top/', {**params, 'limit': limit, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(page.status_code, 200)
+            rows += page.json()['results']
+            cursor = page.json()['next_cursor']
+            if cursor is None:
+                return rows
+
+    def test_keyset_pages_continue_the_ranking(self):
+        for top_type in ('blog', 'user', 'country'):
+            with self.subTest(top_type):
+                params = {'top': top_type}
+                top = self.client.get('/analytics/top/', params).json()
+                rows = self.pages(params, 3)
+                self.assertEqual(rows[:len(top)], top)
+                self.assertEqual([row['rank'] for row in rows], list(range(1, len(rows) + 1)))
+                self.assertEqual(rows, self.pages(params, 7))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/analytics/top/', {'top': 'blog', 'limit': 3, 'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ColumnsFormatTests(AnalyticsDataTestCase):
+    endpoints = [
+        ('/analytics/blog-views/', {'object_type': 'country', 'range': 'month'}, ('x', 'y', 'z')),
+        ('/analytics/top/', {'top': 'user'}, ('rank', 'x', 'y', 'z')),
+        ('/analytics/performance/', {'compare': 'week'}, ('period', 'x', 'y', 'z')),
+    ]
+
+    def test_columns_hold_the_same_rows(self):
+        for path, params, columns in self.endpoints:
+            with self.subTest(path):
+                rows = self.client.get(path, params).json()
+                response = self.client.get(path, {**params, 'format': 'columns'})
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(rows)
+                self.assertEqual(response.json(), {column: [row[column] for row in rows] for column in columns})
+
+    def test_empty_results_keep_their_columns(self):
+        future = (timezone.localdate() + timedelta(days=3650)).isoformat()
+        for path, params, columns in self.endpoints[:2]:
+            with self.subTest(path):
+                response = self.client.get(path, {**params, 'start_date': future, 'format': 'columns'})
+                self.assertEqual(response.json(), {column: [] for column in columns})
+
+    def test_pages_keep_their_cursor(self):
+        params = {'top': 'blog', 'limit': 3}
+        rows = self.client.get('/analytics/top/', {'top': 'blog', 'limit': 6}).json()['results']
+        first = self.client.get('/analytics/top/', {**params, 'format': 'columns'}).json()
+        second = self.client.get('/analytics/top/', {**params, 'cursor': first['next_cursor'], 'format': 'columns'}).json()
+        self.assertEqual(first['results'], encoding.as_columns(rows[:3]))
+        self.assertEqual(second['results'], encoding.as_columns(rows[3:]))
+
+    def test_errors_are_unchanged(self):
+        response = self.client.get('/analytics/blog-views/', {'range': 'decade', 'format': 'columns'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+
+class ArchiveTests(AnalyticsDataTestCase):
+    def test_archiving_a_month_does_not_change_any_answer(self):
+        before = {}
+        for case_id, path, params in self.exact_cases():
+            for use_rollups in (True, False):
+                with override_settings(ANALYTICS_USE_ROLLUPS=use_rollups):
+                    before[case_id, use_rollups] = self.client.get(path, params).json()
+
+        hot_views = BlogView.objects.count()
+        call_command('archive_views', '--retention-days', '120', stdout=StringIO())
+        self.assertTrue(archive.archived_months())
+        self.assertLess(BlogView.objects.count(), hot_views)
+
+        for case_id, path, params in self.exact_cases():
+            for use_rollups in (True, False):
+                with self.subTest(case_id, use_rollups=use_rollups):
+                    with override_settings(ANALYTICS_USE_ROLLUPS=use_rollups):
+                        response = self.client.get(path, params)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertSameRows(response.json(), before[case_id, use_rollups])
+
+
+class PerformanceSeriesTests(AnalyticsDataTestCase):
+    def ranges(self):
+        today = timezone.localdate()
+        # The last range runs into the future, where every period is empty.
+        return [(None, None), (today - timedelta(days=90), today), (today - timedelta(days=20), today + timedelta(days=40))]
+
+    def test_series_fills_empty_periods_and_matches_the_orm(self):
+        blogs = Blog.objects.filter(author_id=self.context['author_id'])
+        for compare_type in ('day', 'week', 'month', 'year'):
+            for start_date, end_date in self.ranges():
+                with self.subTest(compare_type, start_date=start_date, end_date=end_date):
+                    rows = performance_rows(blogs, compare_type, start_date, end_date)
+                    self.assertSameRows(rows, orm_performance_rows(blogs, compare_type, start_date, end_date))
+                    periods = [period for period, _, _, _ in rows]
+                    self.assertEqual(periods[1:], [next_period(period, compare_type) for period in periods[:-1]])
+                    self.assertIsNone(rows[0][3])
+                    for (_, _, previous, _), (_, _, views, growth) in zip(rows, rows[1:]):
+                        self.assertEqual(growth, AnalyticsCalculator.calculate_growth(views, previous))
+                    if periods[-1] > timezone.localdate():
+                        self.assertEqual(rows[-1][1:3], (0, 0))
+
+    def test_other_backends_fall_back_to_the_orm(self):
+        blogs = Blog.objects.all()
+        with mock.patch.dict(performance.PERIOD_STEPS, clear=True):
+            self.assertSameRows(performance_rows(blogs, 'week'), orm_performance_rows(blogs, 'week'))
+
+
+class ViewExportTests(AnalyticsDataTestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create(username='staff', is_staff=True))
+
+    def export(self, **params):
+        response = self.client.get('/analytics/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def expected_ids(self, after_id=0):
+        return list(BlogView.objects.filter(id__gt=after_id).order_by('id').values_list('id', flat=True))
+
+    def test_csv_has_a_header_and_every_view_in_id_order(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        header, *rows = csv.reader(io.StringIO(body.decode()))
+        self.assertEqual(header, export.COLUMNS)
+        self.assertEqual([int(row[0]) for row in rows], self.expected_ids())
+        view = BlogView.objects.select_related('viewer_country').order_by('id').first()
+        self.assertEqual(rows[0], [str(view.id), str(view.blog_id), str(view.viewer_id or ''),
+                                   view.viewer_country.name if view.viewer_country else '',
+                                   view.viewed_at.isoformat(), view.ip_address or ''])
+
+    def test_ndjson_has_one_object_per_view(self):
+        response, body = self.export(output='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([record['id'] for record in records], self.expected_ids())
+        self.assertEqual(list(records[0]), export.COLUMNS)
+
+    def test_gzip_wraps_the_same_body(self):
+        for output in ('csv', 'ndjson'):
+            with self.subTest(output):
+                response, compressed = self.export(output=output, gzip='true')
+                self.assertEqual(response['Content-Type'], 'application/gzip')
+                self.assertIn(f'blog-views.{output}.gz', response['Content-Disposition'])
+                self.assertEqual(gzip.decompress(compressed), self.export(output=output)[1])
+
+    def test_after_id_resumes_after_the_last_view_received(self):
+        ids = self.expected_ids()
+        after_id = ids[len(ids) // 2]
+        _, body = self.export(output='ndjson', after_id=after_id)
+        self.assertEqual([json.loads(line)['id'] for line in body.decode().splitlines()], self.expected_ids(after_id))
+
+    def test_export_is_staff_only(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/analytics/export/').status_code, 403)
+
+
+class MetricsTests(AnalyticsDataTestCase):
+    def setUp(self):
+        metrics.get_registry().reset()
+
+    def exposition(self):
+        """{(metric name, labels): value} from /analytics/metrics/"""
+        response = self.client.get('/analytics/metrics/')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith('#'):
+                match = re.fullmatch(r'(\w+)\{(.*)\} (\S+)', line)
+                self.assertIsNotNone(match, line)
+                samples[match.group(1), match.group(2)] = float(match.group(3))
+        return samples
+
+    def test_requests_are_exported_as_prometheus_histograms_and_counters(self):
+        for _ in range(2):
+            self.client.get('/analytics/top/', {'top': 'blog'})
+        self.client.get('/analytics/blog-views/', {'range': 'decade'})
+        samples = self.exposition()
+
+        top = 'endpoint="top-analytics",params="top=blog",status="200"'
+        self.assertEqual(samples['analytics_request_duration_seconds_count', top], 2)
+        self.assertEqual(samples['analytics_request_duration_seconds_bucket', f'{top},le="+Inf"'], 2)
+        buckets = [samples['analytics_request_duration_seconds_bucket', f'{top},le="{bound!r}"']
+                   for bound in metrics.get_buckets()]
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertGreater(samples['analytics_db_queries_total', top], 0)
+        self.assertEqual(samples['analytics_result_rows_total', top], 20)
+        self.assertGreater(samples['analytics_response_bytes_total', top], 0)
+
+        rejected = 'endpoint="blog-views-analytics",params="range=other",status="400"'
+        self.assertEqual(samples['analytics_request_duration_seconds_count', rejected], 1)
+        self.assertEqual(samples['analytics_result_rows_total', rejected], 0)
+
+    def test_server_timing_reports_database_and_application_time(self):
+        response = self.client.get('/analytics/top/', {'top': 'blog'})
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="[1-9]\d* queries", app;dur=[\d.]+, total;dur=[\d.]+$')
+
+
+class ConditionalRequestTests(AnalyticsDataTestCase):
+    def test_if_none_match_is_answered_with_304_until_a_view_is_stored(self):
+        params = {'object_type': 'country', 'range': 'month'}
+        etag = self.client.get('/analytics/blog-views/', params)['ETag']
+        response = self.client.get('/analytics/blog-views/', params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        BlogView.objects.create(blog=Blog.objects.first(), viewed_at=timezone.now())
+        response = self.client.get('/analytics/blog-views/', params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def assertChangesETag(self, change):
+        params = {'top': 'blog'}
+        etag = self.client.get('/analytics/top/', params)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get('/analytics/top/', params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_deleting_views_changes_the_etag(self):
+        self.assertChangesETag(lambda: BlogView.objects.filter(id__in=BlogView.objects.order_by('id')[:5]).delete())
+
+    def test_deleting_a_blog_changes_the_etag(self):
+        # A blog that holds neither maximum, so only the data version can move the watermark.
+        blog = Blog.objects.exclude(id=BlogView.objects.latest('id').blog_id).order_by('updated_at').first()
+        self.assertChangesETag(blog.delete)
+
+    def test_rebuilding_rollups_changes_the_etag(self):
+        self.assertChangesETag(lambda: call_command('rebuild_rollups', stdout=StringIO()))
+
+    def test_etag_ignores_parameter_order_and_defaults(self):
+        first = self.client.get('/analytics/top/', {'top': 'blog', 'logic': 'and'})
+        second = self.client.get('/analytics/top/', {'logic': 'AND'})
+        self.assertEqual(first['ETag'], second['ETag'])
+
+
+class FilterAllowlistTests(AnalyticsDataTestCase):
+    def test_filters_outside_the_allowlist_are_rejected(self):
+        rejected = {
+            'unknown field': {'field': 'viewer__password', 'operator': 'eq', 'value': 'x'},
+            'unindexed field': {'field': 'ip_address', 'operator': 'eq', 'value': '10.0.0.1'},
+            'substring match': {'field': 'viewer__username', 'operator': 'icontains', 'value': 'user'},
+            'range on a key': {'field': 'viewer_country', 'operator': 'gt', 'value': 'USA'},
+        }
+        for name, filter_item in rejected.items():
+            for path in ('/analytics/blog-views/', '/analytics/top/', '/analytics/performance/'):
+                with self.subTest(name, path=path):
+                    response = self.client.get(path, {'filters': json.dumps([filter_item])})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('error', response.json())
+
+
+class AsyncViewTests(TransactionTestCase):
+    """The async routes on committed data, which the threads of their pools can read"""
+
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        overrides = override_settings(ALLOWED_HOSTS=['testserver'], ANALYTICS_CACHE_ENABLED=False,
+                                      ANALYTICS_ARCHIVE_DIR=archive_dir.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_process_state()
+        self.addCleanup(reset_process_state)
+        synthetic.generate(users=10, blogs=5, views=500, seed=2)
+        rollups.rebuild()
+        counters.repair()
+
+    async def test_async_routes_match_the_sync_views(self):
+        cases = [
+            ('blog-views', {'object_type': 'country', 'range': 'month'}),
+            ('top', {'top': 'blog'}),
+            ('top', {'top': 'user'}),
+            ('performance', {'compare': 'month'}),
+        ]
+        for name, params in cases:
+            with self.subTest(name, **params):
+                response = await self.async_client.get(f'/analytics/async/{name}/', params)
+                self.assertEqual(response.status_code, 200)
+                expected = await sync_to_async(self.client.get)(f'/analytics/{name}/', params)
+                self.assertEqual(response.json(), expected.json())
+
+    def test_gather_runs_reads_on_the_query_pool_outside_transactions(self):
+        def thread_name():
+            return threading.current_thread().name
+
+        here = thread_name()
+        first, second = concurrency.gather(thread_name, thread_name)
+        self.assertEqual(first, here)
+        self.assertTrue(second.startswith('analytics-queries'))
+        with transaction.atomic():
+            self.assertEqual(concurrency.gather(thread_name, thread_name), [here, here])
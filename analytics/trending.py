@@ -0,0 +1,172 @@
+import heapq
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Max
+from django.db.models.functions import TruncMinute
+from . import countries
+from .models import Blog, BlogView
+
+DIMENSION_FIELDS = {'blog': 'blog_id', 'country': 'viewer_country', 'author': 'blog__author_id'}
+
+# The baseline a window's rate is compared with decays this many times slower.
+BASELINE_FACTOR = 4
+
+# Scores below this in every window are forgotten.
+MIN_SCORE = 0.01
+
+
+def decay(half_life, minutes):
+    return 0.5 ** (minutes / half_life)
+
+
+class TrendingTracker:
+    """Exponentially decayed per-minute view counts of blogs, countries and authors
+
+    Views of the current minute are counted in a bucket. When the minute
+    closes, the bucket is folded into two scores per key and window: a fast
+    one with a half-life of ``window`` minutes and a baseline one decaying
+    BASELINE_FACTOR times slower. Each score times (1 - decay per minute) is
+    a rate in views per minute, and trending keys are those whose fast rate
+    is furthest above their baseline. Memory is at most ``capacity`` keys per
+    dimension, and a query reads each key once.
+
+    Counts come from the BlogView table through ``catch_up``, so every
+    process sees the views stored by all of them.
+    """
+
+    def __init__(self, windows=(5, 15, 60, 240), capacity=10000):
+        self.windows = list(windows)
+        self.capacity = capacity
+        self.half_lives = [h for window in self.windows for h in (window, window * BASELINE_FACTOR)]
+        self.scores = {name: {} for name in DIMENSION_FIELDS}
+        self.pending = {name: Counter() for name in DIMENSION_FIELDS}
+        self.minute = int(time.time() // 60)
+        self.seeded_through = 0
+        self.caught_up_at = None
+        self.lock = threading.Lock()
+        self.catch_up_lock = threading.Lock()
+
+    def _advance(self, minute):
+        """Fold the pending bucket and decay every score so that ``minute`` becomes the current one"""
+        elapsed = minute - self.minute
+        if elapsed <= 0:
+            return
+        keep = [decay(h, elapsed) for h in self.half_lives]
+        last = [decay(h, elapsed - 1) for h in self.half_lives]
+        for name, scores in self.scores.items():
+            pending = self.pending[name]
+            for key, values in scores.items():
+                count = pending.pop(key, 0)
+                scores[key] = [v * k + count * w for v, k, w in zip(values, keep, last)]
+            for key, count in pending.items():
+                scores[key] = [count * w for w in last]
+            pending.clear()
+            self._prune(name)
+        self.minute = minute
+
+    def _prune(self, name):
+        scores = self.scores[name]
+        for key in [key for key, values in scores.items() if max(values) < MIN_SCORE]:
+            del scores[key]
+        if len(scores) > self.capacity:
+            kept = heapq.nlargest(self.capacity, scores.items(), key=lambda item: max(item[1]))
+            self.scores[name] = dict(kept)
+
+    def _add(self, name, key, minute, count):
+        if minute >= self.minute:
+            self.pending[name][key] += count
+            return
+        # A late view of a closed minute goes straight into the decayed scores.
+        weights = [decay(h, self.minute - 1 - minute) for h in self.half_lives]
+        values = self.scores[name].get(key)
+        if values is None:
+            self.scores[name][key] = [count * w for w in weights]
+        else:
+            self.scores[name][key] = [v + count * w for v, w in zip(values, weights)]
+
+    def trending(self, name, window, n=10, now=None):
+        """[(key, recent views per minute, rise over the baseline)] for the fastest-rising keys
+
+        Only closed minutes count, so results move once a minute.
+        """
+        now = time.time() if now is None else now
+        index = 2 * self.windows.index(window)
+        fast_scale = 1 - decay(self.half_lives[index], 1)
+        slow_scale = 1 - decay(self.half_lives[index + 1], 1)
+        with self.lock:
+            self._advance(int(now // 60))
+            rates = [
+                (key, values[index] * fast_scale, values[index] * fast_scale - values[index + 1] * slow_scale)
+                for key, values in self.scores[name].items()
+            ]
+        rising = [rate for rate in rates if rate[2] > 0]
+        return heapq.nsmallest(n, rising, key=lambda rate: (-rate[2], rate[0]))
+
+    def catch_up(self, now=None):
+        """Count the views stored since the last catch-up, by any process
+
+        Views above ``seeded_through`` are aggregated per key and minute in
+        the database, skipping those too old to matter for the slowest
+        baseline. The first call seeds the tracker.
+        """
+        now = time.time() if now is None else now
+        since = datetime.fromtimestamp(now - 60 * 3 * max(self.half_lives), tz=dt_timezone.utc)
+        with self.catch_up_lock:
+            last = BlogView.objects.aggregate(last=Max('id'))['last'] or 0
+            counts = []
+            for name, field in DIMENSION_FIELDS.items():
+                rows = (
+                    BlogView.objects.filter(id__gt=self.seeded_through, id__lte=last, viewed_at__gte=since)
+                    .exclude(**{f"{field}__isnull": True})
+                    .annotate(minute=TruncMinute('viewed_at'))
+                    .values_list(field, 'minute').annotate(views=Count('id')).order_by()
+                )
+                counts += [(name, key, int(minute.timestamp() // 60), views) for key, minute, views in rows]
+            with self.lock:
+                self._advance(int(now // 60))
+                for name, key, minute, views in counts:
+                    self._add(name, key, minute, views)
+                for name in DIMENSION_FIELDS:
+                    self._prune(name)
+            self.seeded_through = last
+            self.caught_up_at = now
+
+def labels(name, keys):
+    if name == 'blog':
+        titles = dict(Blog.objects.filter(id__in=keys).values_list('id', 'title'))
+        return {key: titles.get(key) or f"Blog {key}" for key in keys}
+    if name == 'author':
+        usernames = dict(get_user_model().objects.filter(id__in=keys).values_list('id', 'username'))
+        return {key: usernames.get(key) or f"User {key}" for key in keys}
+    names = countries.get_names(keys)
+    return {key: names[key] or "Unknown" for key in keys}
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_windows():
+    return list(getattr(settings, 'ANALYTICS_TRENDING_WINDOWS', [5, 15, 60, 240]))
+
+
+def get_tracker():
+    """Process-wide tracker, caught up with the views stored since its last catch-up
+
+    A catch-up runs at most every ANALYTICS_TRENDING_CATCH_UP_INTERVAL
+    seconds; the first one seeds the tracker.
+    """
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = TrendingTracker(get_windows(), getattr(settings, 'ANALYTICS_TRENDING_CAPACITY', 10000))
+    tracker = _tracker
+    interval = getattr(settings, 'ANALYTICS_TRENDING_CATCH_UP_INTERVAL', 15)
+    if tracker.caught_up_at is None or time.time() - tracker.caught_up_at >= interval:
+        tracker.catch_up()
+    return tracker
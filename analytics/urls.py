@@ -1,8 +1,19 @@
 from django.urls import path
 from . import views
+from .concurrency import async_view
 
 urlpatterns = [
     path('blog-views/', views.BlogViewsAnalyticsAPI.as_view(), name='blog-views-analytics'),
     path('top/', views.TopAnalyticsAPI.as_view(), name='top-analytics'),
     path('performance/', views.PerformanceAnalyticsAPI.as_view(), name='performance-analytics'),
+    path('async/blog-views/', async_view(views.BlogViewsAnalyticsAPI.as_view()), name='async-blog-views-analytics'),
+    path('async/top/', async_view(views.TopAnalyticsAPI.as_view()), name='async-top-analytics'),
+    path('async/performance/', async_view(views.PerformanceAnalyticsAPI.as_view()), name='async-performance-analytics'),
+    path('trending/', views.TrendingAnalyticsAPI.as_view(), name='trending-analytics'),
+    path('query/', views.BatchQueryAPI.as_view(), name='batch-query'),
+    path('export/', views.ViewExportAPI.as_view(), name='view-export'),
+    path('cache/', views.CacheStatsAPI.as_view(), name='cache-stats'),
+    path('metrics/', views.MetricsAPI.as_view(), name='metrics'),
+    path('views/', views.ViewIngestAPI.as_view(), name='view-ingest'),
+    path('views/batch/', views.ViewBatchIngestAPI.as_view(), name='view-batch-ingest'),
 ]
\ No newline at end of file
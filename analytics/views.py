@@ -1,34 +1,200 @@
+import copy
+import importlib.util
+from collections import defaultdict
+from urllib.parse import urlencode
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Count, F, Q
+from rest_framework.parsers import JSONParser
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.http import HttpResponse, QueryDict, StreamingHttpResponse
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
 from datetime import datetime
-from analytics.utils import AnalyticsCalculator, AnalyticsQueryBuilder
-from .models import Blog, BlogView
-from .serializers import (
-    BlogViewAnalyticsSerializer,
-    TopAnalyticsSerializer,
-    PerformanceAnalyticsSerializer
-)
-
-
-def parse_date(date_str):
-    if not date_str:
-        return None
-    try:
-        return datetime.strptime(date_str, "%Y-%m-%d").date()
-    except ValueError:
-        return "invalid"
-
-
-def get_queryset_with_filters(model_cls, filters_json, logic, start_date=None, end_date=None, date_field="created_at"):
-    q = AnalyticsQueryBuilder.build_filters(filters_json, logic)
-    qs = model_cls.objects.filter(q)
+from analytics import archive, batch, concurrency, counters, countries, dedup, encoding, export, heavy_hitters, ingestion, metrics, rankings, rollups, sketches, trending
+from analytics.buffer import BufferFull, get_buffer
+from analytics.parsers import NDJSONParser
+from analytics.performance import performance_rows
+from analytics.conditional import conditional_response
+from analytics.cache import cache_key, cached_response, get_response_cache, get_ttl, normalize_query
+from analytics.profiling import explain_response
+from analytics.routers import pin_to_primary, read_replica
+from analytics.utils import AnalyticsQueryBuilder, FilterError, parse_bool, parse_date
+from .models import Blog, BlogView, BlogViewCounter, DailyBlogViewRollup
+from .serializers import TrendingAnalyticsSerializer
+
+User = get_user_model()
+
+
+def get_queryset_with_filters(plan, start_date=None, end_date=None, date_field="created_at"):
+    qs = plan.model_cls.objects.filter(plan.q)
     return AnalyticsQueryBuilder.apply_date_range(qs, start_date, end_date, date_field)
 
 
+def get_blog_view_source(plan, start_date=None, end_date=None):
+    """Return (queryset, date field, total views aggregate), reading the daily rollups when they can answer"""
+    if rollups.can_answer(plan):
+        qs = get_queryset_with_filters(plan.for_model(DailyBlogViewRollup), start_date, end_date, date_field="day")
+        return qs, "day", Sum("views")
+    qs = get_queryset_with_filters(plan, start_date, end_date, date_field="viewed_at")
+    return qs, "viewed_at", Count("id")
+
+
+def check_engine(engine):
+    """Error message for an unusable engine parameter, or None"""
+    if engine not in ["orm", "columnar"]:
+        return 'engine must be "orm" or "columnar"'
+    if engine == "columnar":
+        if not getattr(settings, "ANALYTICS_COLUMNAR_ENABLED", False):
+            return "engine=columnar is not enabled on this server"
+        if importlib.util.find_spec("numpy") is None:
+            return "engine=columnar requires numpy"
+    return None
+
+
+def route_engine(engine, start_date, plan=None):
+    """engine=orm only sees the hot table, so reads that need archived views go to the columnar engine
+
+    The columnar engine unions the archived segments with the hot rows. It
+    needs numpy, which archive_views requires, but not ANALYTICS_COLUMNAR_ENABLED.
+    Rollup reads stay on the ORM: the rollups keep aggregating archived months.
+    """
+    if engine == "orm" and archive.reaches(start_date) and not (plan is not None and rollups.can_answer(plan)):
+        return "columnar"
+    return engine
+
+
+def get_columnar_store():
+    # Imported here so that numpy is only needed when engine=columnar is used.
+    from analytics import columnar
+    return columnar.get_store()
+
+
+def get_realtime_top(top_type, rolling, n=10):
+    """Top items from the in-memory heavy-hitter counters; z is the most y can overcount by"""
+    top = heavy_hitters.get_tracker().top(top_type, n, rolling=rolling)
+    keys = [item for item, _, _ in top]
+
+    if top_type == "blog":
+        titles = dict(Blog.objects.filter(id__in=keys).values_list("id", "title"))
+        labels = {item: titles.get(item) or f"Blog {item}" for item in keys}
+    elif top_type == "user":
+        usernames = dict(User.objects.filter(id__in=keys).values_list("id", "username"))
+        labels = {item: usernames.get(item) or "Anonymous" for item in keys}
+    else:
+        names = countries.get_names(keys)
+        labels = {item: names[item] or "Unknown" for item in keys}
+
+    return [{"rank": i+1, "x": labels[item], "y": count, "z": error} for i, (item, count, error) in enumerate(top)]
+
+
+def get_counter_top_blogs(plan, approx=False, limit=10):
+    """All-time top blogs read from the per-blog counters in index order
+
+    The counters' sketches are the approx=true distinct viewers; exact ones
+    are counted for the ranked blogs only.
+    """
+    ranked = BlogViewCounter.objects.filter(total_views__gt=0).order_by("-total_views", "blog_id")[:limit]
+    ranking = ranked.values("blog_id", "blog__title", "total_views", "unique_viewers")
+    if approx:
+        data = list(ranking)
+    else:
+        blog_views, _, _ = get_blog_view_source(plan)
+
+        def count_viewers(blog_ids):
+            return dict(
+                blog_views.filter(blog_id__in=blog_ids).values("blog_id")
+                .annotate(unique_viewers=Count("viewer", distinct=True)).values_list("blog_id", "unique_viewers")
+                .order_by()
+            )
+
+        if connections[ranked.db].features.allow_sliced_subqueries_with_in:
+            # The viewer count selects the ranked blogs itself, so the two reads run concurrently.
+            data, viewers = concurrency.gather(lambda: list(ranking), lambda: count_viewers(ranked.values("blog_id")))
+        else:
+            data = list(ranking)
+            viewers = count_viewers([d["blog_id"] for d in data])
+        for d in data:
+            d["unique_viewers"] = viewers.get(d["blog_id"], 0)
+    return [{"rank": i+1, "x": d["blog__title"] or f"Blog {d['blog_id']}", "y": d["total_views"], "z": d["unique_viewers"]}
+            for i, d in enumerate(data)]
+
+
+def get_top_rows(top_type, plan, start_date=None, end_date=None, approx=False, limit=10, engine="orm"):
+    """Ranked {rank, x, y, z} rows for /analytics/top/, best first"""
+    if engine == "columnar":
+        return get_columnar_store().top_rows(top_type, plan, start_date, end_date, limit)
+    if top_type == "blog" and counters.can_answer(plan, start_date, end_date):
+        return get_counter_top_blogs(plan, approx and sketches.can_answer(plan), limit)
+
+    blog_views, _, views_agg = get_blog_view_source(plan, start_date, end_date)
+    approx = approx and top_type != "user" and sketches.can_answer(plan)
+
+    if top_type == "blog":
+        data = (
+            blog_views.values("blog__id", "blog__title", "blog__author__username")
+            .annotate(blog_title=F("blog__title"), author_name=F("blog__author__username"), total_views=views_agg)
+        )
+        if approx:
+            data = list(data.order_by("-total_views", "blog__id")[:limit])
+            viewers = sketches.merge_sketches(
+                sketches.get_sketches(plan, start_date, end_date)
+                .filter(blog_id__in=[d["blog__id"] for d in data])
+                .values_list("blog_id", "sketch")
+            )
+            for d in data:
+                d["unique_viewers"] = viewers.get(d["blog__id"], 0)
+        else:
+            data = data.annotate(unique_viewers=Count("viewer", distinct=True)).order_by("-total_views", "blog__id")[:limit]
+        return [{"rank": i+1, "x": d["blog_title"] or f"Blog {d['blog__id']}", "y": d["total_views"], "z": d["unique_viewers"]}
+                for i, d in enumerate(data)]
+
+    elif top_type == "user":
+        data = (
+            blog_views.filter(viewer__isnull=False)
+            .values("viewer__username")
+            .annotate(username=F("viewer__username"),
+                      blogs_viewed=Count("blog", distinct=True),
+                      total_views=views_agg)
+            .order_by("-total_views", "viewer__username")[:limit]
+        )
+        return [{"rank": i+1, "x": d["username"] or "Anonymous", "y": d["total_views"], "z": d["blogs_viewed"]}
+                for i, d in enumerate(data)]
+
+    else:  # country
+        data = (
+            blog_views.exclude(viewer_country__isnull=True)
+            .values("viewer_country")
+            .annotate(country=F("viewer_country"), total_views=views_agg)
+        )
+        if approx:
+            data = list(data.order_by("-total_views", "viewer_country")[:limit])
+            users = sketches.merge_sketches(
+                sketches.get_sketches(plan, start_date, end_date)
+                .filter(viewer_country__in=[d["country"] for d in data])
+                .values_list("viewer_country", "sketch")
+            )
+            for d in data:
+                d["unique_users"] = users.get(d["country"], 0)
+        else:
+            data = list(data.annotate(unique_users=Count("viewer", distinct=True)).order_by("-total_views", "viewer_country")[:limit])
+        names = countries.get_names(d["country"] for d in data)
+        return [{"rank": i+1, "x": names[d["country"]] or "Unknown", "y": d["total_views"], "z": d["unique_users"]}
+                for i, d in enumerate(data)]
+
+
 class BlogViewsAnalyticsAPI(APIView):
     """/analytics/blog-views/"""
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, encoding.ColumnsRenderer]
+    columns = ("x", "y", "z")
+
+    @read_replica
+    @conditional_response("blog-views")
+    @explain_response
+    @cached_response("blog-views")
     def get(self, request):
         object_type = request.GET.get("object_type", "country")
         range_type = request.GET.get("range", "month")
@@ -36,6 +202,7 @@ class BlogViewsAnalyticsAPI(APIView):
         end_date = parse_date(request.GET.get("end_date"))
         filters_json = request.GET.get("filters")
         logic = request.GET.get("logic", "and")
+        engine = request.GET.get("engine", "orm")
 
         if object_type not in ["country", "user"]:
             return Response({"error": 'object_type must be "country" or "user"'}, status=status.HTTP_400_BAD_REQUEST)
@@ -43,86 +210,135 @@ class BlogViewsAnalyticsAPI(APIView):
             return Response({"error": "range must be one of: day, week, month, year"}, status=status.HTTP_400_BAD_REQUEST)
         if start_date == "invalid" or end_date == "invalid":
             return Response({"error": "Dates must be in YYYY-MM-DD format"}, status=status.HTTP_400_BAD_REQUEST)
+        engine_error = check_engine(engine)
+        if engine_error:
+            return Response({"error": engine_error}, status=status.HTTP_400_BAD_REQUEST)
 
-        blog_views = get_queryset_with_filters(BlogView, filters_json, logic, start_date, end_date)
+        try:
+            plan = AnalyticsQueryBuilder.compile_filters(BlogView, filters_json, logic)
+            engine = route_engine(engine, start_date, plan)
+            if engine == "columnar":
+                rows = get_columnar_store().blog_views_rows(plan, object_type, range_type, start_date, end_date)
+        except FilterError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if engine == "columnar":
+            return Response(encoding.blog_views_rows(rows))
+
+        blog_views, date_field, views_agg = get_blog_view_source(plan, start_date, end_date)
 
         trunc_func = AnalyticsQueryBuilder.get_time_trunc_func(range_type)
         group_key = F("viewer_country") if object_type == "country" else F("viewer__username")
 
         data = (
-            blog_views.annotate(period=trunc_func("viewed_at"), grouping_key=group_key)
-            .values("period", "grouping_key")
-            .annotate(number_of_blogs=Count("blog", distinct=True), total_views=Count("id"))
+            blog_views.annotate(period=trunc_func(date_field), grouping_key=group_key)
+            .values_list("period", "grouping_key")
+            .annotate(number_of_blogs=Count("blog", distinct=True), total_views=views_agg)
             .order_by("period", "grouping_key")
         )
 
-        result = [
-            {
-                "x": f"{item['grouping_key'] or 'Unknown'} - {item['period'].strftime('%Y-%m-%d') if item['period'] else 'Unknown'}",
-                "y": item["number_of_blogs"],
-                "z": item["total_views"],
-            }
-            for item in data
-        ]
+        if object_type == "country":
+            # Grouped on the integer key; names are looked up and ordered here.
+            data = list(data)
+            names = countries.get_names(key for _, key, _, _ in data)
+            data = [(period, names[key], blogs, views) for period, key, blogs, views in data]
+            data.sort(key=lambda row: (row[0], countries.sort_key(row[1])))
 
-        return Response(BlogViewAnalyticsSerializer(result, many=True).data)
+        return Response(encoding.blog_views_rows(data))
 
 
 class TopAnalyticsAPI(APIView):
     """/analytics/top/"""
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, encoding.ColumnsRenderer]
+    columns = ("rank", "x", "y", "z")
+
+    @read_replica
+    @conditional_response("top")
+    @explain_response
+    @cached_response("top")
     def get(self, request):
         top_type = request.GET.get("top", "blog")
         start_date = parse_date(request.GET.get("start_date"))
         end_date = parse_date(request.GET.get("end_date"))
         filters_json = request.GET.get("filters")
         logic = request.GET.get("logic", "and")
+        approx = parse_bool(request.GET.get("approx"))
+        mode = request.GET.get("mode", "exact")
+        limit = request.GET.get("limit")
+        cursor = request.GET.get("cursor")
+        engine = request.GET.get("engine", "orm")
 
         if top_type not in ["user", "country", "blog"]:
             return Response({"error": 'top must be one of: "user", "country", "blog"'}, status=status.HTTP_400_BAD_REQUEST)
         if start_date == "invalid" or end_date == "invalid":
             return Response({"error": "Dates must be in YYYY-MM-DD format"}, status=status.HTTP_400_BAD_REQUEST)
-
-        blog_views = get_queryset_with_filters(BlogView, filters_json, logic, start_date, end_date)
-
-        result = []
-
-        if top_type == "blog":
-            data = (
-                blog_views.values("blog__id", "blog__title", "blog__author__username")
-                .annotate(blog_title=F("blog__title"), author_name=F("blog__author__username"),
-                          total_views=Count("id"), unique_viewers=Count("viewer", distinct=True))
-                .order_by("-total_views")[:10]
-            )
-            result = [{"rank": i+1, "x": d["blog_title"] or f"Blog {d['blog__id']}", "y": d["total_views"], "z": d["unique_viewers"]}
-                      for i, d in enumerate(data)]
-
-        elif top_type == "user":
-            data = (
-                blog_views.filter(viewer__isnull=False)
-                .values("viewer__username")
-                .annotate(username=F("viewer__username"),
-                          blogs_viewed=Count("blog", distinct=True),
-                          total_views=Count("id"))
-                .order_by("-total_views")[:10]
-            )
-            result = [{"rank": i+1, "x": d["username"] or "Anonymous", "y": d["total_views"], "z": d["blogs_viewed"]}
-                      for i, d in enumerate(data)]
-
-        else:  # country
-            data = (
-                blog_views.exclude(viewer_country__isnull=True)
-                .values("viewer_country")
-                .annotate(country=F("viewer_country"), total_views=Count("id"), unique_users=Count("viewer", distinct=True))
-                .order_by("-total_views")[:10]
-            )
-            result = [{"rank": i+1, "x": d["country"] or "Unknown", "y": d["total_views"], "z": d["unique_users"]}
-                      for i, d in enumerate(data)]
-
-        return Response(TopAnalyticsSerializer(result, many=True).data)
+        if mode not in ["exact", "realtime"]:
+            return Response({"error": 'mode must be "exact" or "realtime"'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit is not None:
+            if not limit.isdigit() or not 1 <= int(limit) <= rankings.MAX_PAGE_SIZE:
+                return Response({"error": f"limit must be between 1 and {rankings.MAX_PAGE_SIZE}"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            limit = int(limit)
+        engine_error = check_engine(engine)
+        if engine_error:
+            return Response({"error": engine_error}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            plan = AnalyticsQueryBuilder.compile_filters(BlogView, filters_json, logic)
+        except FilterError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if mode == "realtime":
+            window = request.GET.get("window", "all")
+            if window not in ["all", "rolling"]:
+                return Response({"error": 'window must be "all" or "rolling"'}, status=status.HTTP_400_BAD_REQUEST)
+            if start_date or end_date or plan:
+                return Response({"error": "mode=realtime does not support start_date, end_date or filters"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if limit is not None or cursor is not None:
+                return Response({"error": "mode=realtime does not support limit or cursor"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            return Response(get_realtime_top(top_type, window == "rolling"))
+
+        engine = route_engine(engine, start_date, plan)
+        if limit is None and cursor is None:
+            try:
+                result = get_top_rows(top_type, plan, start_date, end_date, approx, engine=engine)
+            except FilterError as exc:
+                return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(result)
+
+        if cursor is not None:
+            try:
+                snapshot, after = rankings.decode_cursor(cursor)
+            except rankings.InvalidCursor:
+                return Response({"error": "cursor is invalid or has expired"}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            params, _, _ = normalize_query("top", request.GET)
+            params.pop("limit", None)
+            query_key = cache_key("top", params, start_date, end_date)
+            snapshot = rankings.get_fresh_snapshot(query_key)
+            if snapshot is None:
+                try:
+                    rows = get_top_rows(top_type, plan, start_date, end_date, approx,
+                                        limit=rankings.get_max_rows(), engine=engine)
+                except FilterError as exc:
+                    return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+                snapshot = rankings.materialize(query_key, rows)
+            after = None
+
+        result, next_cursor = rankings.get_page(snapshot, limit or 10, after)
+        return Response({"results": result, "next_cursor": next_cursor})
 
 
 class PerformanceAnalyticsAPI(APIView):
     """/analytics/performance/"""
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, encoding.ColumnsRenderer]
+    columns = ("period", "x", "y", "z")
+
+    @read_replica
+    @conditional_response("performance")
+    @explain_response
+    @cached_response("performance")
     def get(self, request):
         compare_type = request.GET.get("compare", "month")
         user_id = request.GET.get("user_id")
@@ -130,39 +346,234 @@ class PerformanceAnalyticsAPI(APIView):
         end_date = parse_date(request.GET.get("end_date"))
         filters_json = request.GET.get("filters")
         logic = request.GET.get("logic", "and")
+        engine = request.GET.get("engine", "orm")
 
         if compare_type not in ["day", "week", "month", "year"]:
             return Response({"error": 'compare must be one of: "day", "week", "month", "year"'}, status=status.HTTP_400_BAD_REQUEST)
         if start_date == "invalid" or end_date == "invalid":
             return Response({"error": "Dates must be in YYYY-MM-DD format"}, status=status.HTTP_400_BAD_REQUEST)
+        engine_error = check_engine(engine)
+        if engine_error:
+            return Response({"error": engine_error}, status=status.HTTP_400_BAD_REQUEST)
 
-        blogs = get_queryset_with_filters(Blog, filters_json, logic, start_date, end_date, date_field="created_at")
+        try:
+            plan = AnalyticsQueryBuilder.compile_filters(Blog, filters_json, logic)
+        except FilterError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        blogs = get_queryset_with_filters(plan, start_date, end_date, date_field="created_at")
         if user_id:
             blogs = blogs.filter(author_id=user_id)
 
-        trunc_func = AnalyticsQueryBuilder.get_time_trunc_func(compare_type)
+        engine = route_engine(engine, start_date)
+        series = get_columnar_store().performance_rows if engine == "columnar" else performance_rows
+        return Response(encoding.performance_rows(series(blogs, compare_type, start_date, end_date)))
+
+
+class TrendingAnalyticsAPI(APIView):
+    """/analytics/trending/"""
+    @read_replica
+    def get(self, request):
+        object_type = request.GET.get("object_type", "blog")
+        window = request.GET.get("window", "15")
+        limit = request.GET.get("limit", "10")
+        windows = trending.get_windows()
+
+        if object_type not in trending.DIMENSION_FIELDS:
+            return Response({"error": 'object_type must be one of: "blog", "country", "author"'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not window.isdigit() or int(window) not in windows:
+            return Response({"error": f"window must be one of: {', '.join(map(str, windows))} (minutes)"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not limit.isdigit() or not 1 <= int(limit) <= 100:
+            return Response({"error": "limit must be between 1 and 100"}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = trending.get_tracker().trending(object_type, int(window), int(limit))
+        labels = trending.labels(object_type, [key for key, _, _ in rows])
+        result = [{"rank": i+1, "x": labels[key], "y": round(rate, 3), "z": round(rise, 3)}
+                  for i, (key, rate, rise) in enumerate(rows)]
+        return Response(TrendingAnalyticsSerializer(result, many=True).data)
+
+
+class BatchQueryAPI(APIView):
+    """/analytics/query/"""
+    endpoint_views = {
+        "blog-views": BlogViewsAnalyticsAPI,
+        "top": TopAnalyticsAPI,
+        "performance": PerformanceAnalyticsAPI,
+    }
+
+    @read_replica
+    def post(self, request):
+        specs = request.data
+        if isinstance(specs, dict):
+            specs = specs.get("queries")
+        if not isinstance(specs, list) or not all(isinstance(spec, dict) for spec in specs):
+            return Response({"error": 'Body must be a JSON list of query specs or {"queries": [...]}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        max_queries = getattr(settings, "ANALYTICS_BATCH_MAX_QUERIES", 20)
+        if len(specs) > max_queries:
+            return Response({"error": f"At most {max_queries} queries per request"}, status=status.HTTP_400_BAD_REQUEST)
+        for i, spec in enumerate(specs):
+            if spec.get("endpoint") not in batch.ENDPOINTS:
+                return Response({"error": f"queries[{i}].endpoint must be one of: {', '.join(batch.ENDPOINTS)}"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        queries = [(spec["endpoint"], batch.query_params(spec)) for spec in specs]
+        results = [None] * len(queries)
+        groups = defaultdict(list)
+        for i, (endpoint, params) in enumerate(queries):
+            key = batch.scan_key(endpoint, params)
+            if key is not None:
+                groups[key].append(i)
+        for indexes in groups.values():
+            if len(indexes) > 1:
+                self.run_shared(queries, indexes, results)
+
+        for i, (endpoint, params) in enumerate(queries):
+            if results[i] is None:
+                results[i] = self.run_single(request, endpoint, params)
+        return Response({"results": results})
+
+    def run_shared(self, queries, indexes, results):
+        """Answer specs with the same date range and filters from one scan, leaving the rest to run_single"""
+        params = queries[indexes[0]][1]
+        start_date = parse_date(params.get("start_date"))
+        end_date = parse_date(params.get("end_date"))
+        try:
+            plan = AnalyticsQueryBuilder.compile_filters(BlogView, params.get("filters"), params.get("logic", "and"))
+        except FilterError:
+            return
+        if route_engine("orm", start_date, plan) != "orm":
+            return
+
+        cache = get_response_cache() if getattr(settings, "ANALYTICS_CACHE_ENABLED", True) else None
+        pending = []
+        for i in indexes:
+            endpoint, params = queries[i]
+            payload = cache.get(cache_key(endpoint, *normalize_query(endpoint, params))) if cache else None
+            if payload is not None:
+                results[i] = {"endpoint": endpoint, "status": status.HTTP_200_OK, "data": payload}
+            else:
+                pending.append(i)
+        if len(pending) < 2:
+            return
+
+        generation = cache.generation if cache else None
+        scan = batch.SharedScan.load(*get_blog_view_source(plan, start_date, end_date),
+                                     max_rows=getattr(settings, "ANALYTICS_BATCH_SCAN_MAX_ROWS", 200000))
+        if scan is None:
+            return
+        for i in pending:
+            endpoint, params = queries[i]
+            if endpoint == "blog-views":
+                rows = scan.blog_views_rows(params.get("object_type", "country"), params.get("range", "month"))
+                payload = rows
+            else:
+                payload = scan.top_rows(params.get("top", "blog"))
+            if cache:
+                normalized, start_date, end_date = normalize_query(endpoint, params)
+                cache.set(cache_key(endpoint, normalized, start_date, end_date), payload,
+                          get_ttl(endpoint, normalized, end_date), start_date, end_date, generation)
+            results[i] = {"endpoint": endpoint, "status": status.HTTP_200_OK, "data": payload}
+
+    def run_single(self, request, endpoint, params):
+        """Run one spec through its endpoint, as a GET with the same user"""
+        sub_request = copy.copy(request._request)
+        sub_request.method = "GET"
+        sub_request.META = {name: value for name, value in sub_request.META.items() if name != "HTTP_IF_NONE_MATCH"}
+        sub_request.GET = QueryDict(urlencode(params))
+        response = self.endpoint_views[endpoint].as_view()(sub_request)
+        data = list(response.data) if isinstance(response.data, list) else response.data
+        return {"endpoint": endpoint, "status": response.status_code, "data": data}
+
+
+class ViewExportAPI(APIView):
+    """/analytics/export/"""
+    @read_replica
+    def get(self, request):
+        if not request.user.is_staff:
+            return Response({"error": "export is only available to staff users"}, status=status.HTTP_403_FORBIDDEN)
+        start_date = parse_date(request.GET.get("start_date"))
+        end_date = parse_date(request.GET.get("end_date"))
+        filters_json = request.GET.get("filters")
+        logic = request.GET.get("logic", "and")
+        output = request.GET.get("output", "csv")
+        compress = parse_bool(request.GET.get("gzip"))
+        after_id = request.GET.get("after_id")
+
+        if output not in export.CONTENT_TYPES:
+            return Response({"error": 'output must be "csv" or "ndjson"'}, status=status.HTTP_400_BAD_REQUEST)
+        if start_date == "invalid" or end_date == "invalid":
+            return Response({"error": "Dates must be in YYYY-MM-DD format"}, status=status.HTTP_400_BAD_REQUEST)
+        if after_id is not None and not after_id.isdigit():
+            return Response({"error": "after_id must be a view id"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            plan = AnalyticsQueryBuilder.compile_filters(BlogView, filters_json, logic)
+        except FilterError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        views = get_queryset_with_filters(plan, start_date, end_date, date_field="viewed_at")
+        # Rows are read while the response streams, after read_replica has returned.
+        views = views.using(views.db)
+        rows = export.export_rows(views, int(after_id) if after_id is not None else None,
+                                  getattr(settings, "ANALYTICS_EXPORT_CHUNK_SIZE", 2000))
+
+        filename = f"blog-views.{output}.gz" if compress else f"blog-views.{output}"
+        response = StreamingHttpResponse(export.stream(rows, output, compress),
+                                         content_type="application/gzip" if compress else export.CONTENT_TYPES[output])
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        if archive.reaches(start_date):
+            response["X-Archived-Before"] = archive.first_hot_day().isoformat()
+        return response
+
+
+class CacheStatsAPI(APIView):
+    """/analytics/cache/"""
+    def get(self, request):
+        return Response(get_response_cache().stats())
+
+
+class MetricsAPI(APIView):
+    """/analytics/metrics/"""
+    def get(self, request):
+        body = metrics.get_registry().render() + dedup.get_deduplicator().render()
+        return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class ViewBatchIngestAPI(APIView):
+    """/analytics/views/batch/"""
+    parser_classes = [JSONParser, NDJSONParser]
 
-        blog_agg = blogs.annotate(period=trunc_func("created_at")).values("period").annotate(blogs_created=Count("id")).order_by("period")
-        blog_ids = blogs.values_list("id", flat=True)
+    def post(self, request):
+        events = request.data
+        if isinstance(events, dict):
+            events = events.get("events")
+        if not isinstance(events, list):
+            return Response({"error": 'Body must be a JSON list of view events, {"events": [...]}, or NDJSON'},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        blog_views = get_queryset_with_filters(BlogView, filters_json, logic, start_date, end_date)
-        blog_views = blog_views.filter(blog_id__in=blog_ids)
-        views_agg = blog_views.annotate(period=trunc_func("viewed_at")).values("period").annotate(total_views=Count("id")).order_by("period")
+        max_batch = getattr(settings, "ANALYTICS_INGEST_MAX_BATCH", 50000)
+        if len(events) > max_batch:
+            return Response({"error": f"At most {max_batch} events per batch"},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
 
-        blog_data = {b["period"]: b["blogs_created"] for b in blog_agg if b["period"]}
-        views_data = {v["period"]: v["total_views"] for v in views_agg if v["period"]}
+        return pin_to_primary(Response(ingestion.ingest_view_events(events)))
 
-        all_periods = sorted(set(blog_data.keys()) | set(views_data.keys()))
-        result = []
-        prev_views = 0
 
-        for i, period in enumerate(all_periods):
-            blogs_in_period = blog_data.get(period, 0)
-            views_in_period = views_data.get(period, 0)
-            growth = None if i == 0 else AnalyticsCalculator.calculate_growth(views_in_period, prev_views)
-            period_str = period.strftime("%Y-%m-%d") if period else "Unknown"
+class ViewIngestAPI(APIView):
+    """/analytics/views/"""
+    def post(self, request):
+        try:
+            fields = ingestion.parse_event(request.data, timezone.now())
+        except ingestion.InvalidEvent as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-            result.append({"period": period_str, "x": f"{period_str} - {blogs_in_period} blogs", "y": views_in_period, "z": growth})
-            prev_views = views_in_period
+        try:
+            get_buffer().put(fields)
+        except BufferFull:
+            return Response({"error": "Ingestion buffer is full, retry later"},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "1"})
 
-        return Response(PerformanceAnalyticsSerializer(result, many=True).data)
+        return pin_to_primary(Response(status=status.HTTP_202_ACCEPTED))
@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ideeza_analytics.settings')
 
 application = get_asgi_application()
+
+from analytics.shutdown import install_shutdown_hook  # noqa: E402
+
+install_shutdown_hook()
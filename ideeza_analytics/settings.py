@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'analytics.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,9 +81,25 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Local read-replica stand-ins: ANALYTICS_SQLITE_REPLICAS=N adds N read-only
+# connections to the same SQLite file, which the analytics endpoints read from
+# like real replicas. Tests mirror them onto the test database.
+for replica in range(1, int(os.environ.get('ANALYTICS_SQLITE_REPLICAS', 0)) + 1):
+    DATABASES[f'replica{replica}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['analytics.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -123,3 +141,107 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Analytics
+
+# Answer blog-views/top aggregations from the daily rollup tables once they
+# have been backfilled with `manage.py rebuild_rollups`.
+ANALYTICS_USE_ROLLUPS = True
+
+# Bulk view ingestion: rows per INSERT and the largest accepted batch.
+ANALYTICS_INGEST_CHUNK_SIZE = 1000
+ANALYTICS_INGEST_MAX_BATCH = 50000
+
+# Write-behind buffer behind POST /analytics/views/: capacity, flush thresholds
+# (events / seconds) and how long a request waits for room before a 503.
+ANALYTICS_BUFFER_MAX_EVENTS = 100000
+ANALYTICS_BUFFER_FLUSH_EVENTS = 5000
+ANALYTICS_BUFFER_FLUSH_INTERVAL = 1.0
+ANALYTICS_BUFFER_PUT_TIMEOUT = 0.05
+
+# Ingest-time deduplication: views of a blog by the same viewer (or IP address)
+# less than ANALYTICS_DEDUP_WINDOW seconds apart are dropped. Policy is "lru"
+# (exact, ANALYTICS_DEDUP_MAX_KEYS most recent keys), "bloom" (fixed memory,
+# ANALYTICS_DEDUP_BLOOM_ERROR false positives) or "off".
+ANALYTICS_DEDUP_POLICY = 'lru'
+ANALYTICS_DEDUP_WINDOW = 30
+ANALYTICS_DEDUP_MAX_KEYS = 100000
+ANALYTICS_DEDUP_BLOOM_ERROR = 0.001
+
+# Response cache for the blog-views/top/performance endpoints. TTLs are in
+# seconds, per endpoint and optionally per range; requests whose end_date is
+# before today use ANALYTICS_CACHE_CLOSED_TTL, since writes by other processes
+# and management commands do not invalidate this process's cache.
+ANALYTICS_CACHE_ENABLED = True
+ANALYTICS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+ANALYTICS_CACHE_CLOSED_TTL = 3600
+ANALYTICS_CACHE_TTLS = {
+    'blog-views': {'day': 30, 'week': 60, 'month': 300, 'year': 900},
+    'top': 60,
+    'performance': {'day': 30, 'week': 60, 'month': 300, 'year': 900},
+}
+
+# ETags on the blog-views/top/performance endpoints: If-None-Match is answered
+# with 304 while the last view id and last blog change are unchanged.
+ANALYTICS_ETAGS_ENABLED = True
+
+# Streaming top-K counters behind /analytics/top/?mode=realtime: counters kept
+# per dimension, rolling window length and snapshot interval (seconds).
+ANALYTICS_HEAVY_HITTERS_CAPACITY = 1000
+ANALYTICS_HEAVY_HITTERS_WINDOW = 3600
+ANALYTICS_HEAVY_HITTERS_SNAPSHOT_INTERVAL = 60
+
+# Decayed per-minute counters behind /analytics/trending/: the windows (half-lives
+# in minutes) a client may ask for, the keys kept per dimension, and how often
+# (seconds) a process reads the views stored since it last looked.
+ANALYTICS_TRENDING_WINDOWS = [5, 15, 60, 240]
+ANALYTICS_TRENDING_CAPACITY = 10000
+ANALYTICS_TRENDING_CATCH_UP_INTERVAL = 15
+
+# Materialized rankings behind /analytics/top/?limit=&cursor=: rows ranked per
+# snapshot, reuse window and how long cursors stay valid (seconds).
+ANALYTICS_TOP_SNAPSHOT_MAX_ROWS = 10000
+ANALYTICS_TOP_SNAPSHOT_TTL = 300
+ANALYTICS_TOP_SNAPSHOT_RETENTION = 3600
+
+# In-memory NumPy engine behind engine=columnar on the analytics endpoints
+# (needs numpy). Rows are loaded from BlogView in chunks of this size. Reads
+# that reach archived views use the engine even when it is not enabled here.
+ANALYTICS_COLUMNAR_ENABLED = False
+ANALYTICS_COLUMNAR_CHUNK_SIZE = 100000
+
+# Hot/cold tiering: manage.py archive_views moves views older than the
+# retention (rounded down to whole months) into one segment file per month
+# in this directory.
+ANALYTICS_ARCHIVE_DIR = BASE_DIR / 'archive'
+ANALYTICS_ARCHIVE_RETENTION_DAYS = 365
+
+# Request metrics at /analytics/metrics/: upper bounds (seconds) of the
+# latency histogram buckets.
+ANALYTICS_METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Thread pools behind /analytics/async/: requests served at once by the async
+# views, and independent sub-queries run at once within a request.
+ANALYTICS_ASYNC_VIEWS_WORKERS = 16
+ANALYTICS_ASYNC_QUERIES_WORKERS = 8
+
+# POST /analytics/query/: most query specs accepted in one request, and most
+# day x blog x country x viewer rows read into memory for a shared scan; above
+# that the specs run one query each.
+ANALYTICS_BATCH_MAX_QUERIES = 20
+ANALYTICS_BATCH_SCAN_MAX_ROWS = 200000
+
+# GET /analytics/export/: rows fetched from the database per round trip while
+# streaming (the size of a server-side cursor fetch on PostgreSQL).
+ANALYTICS_EXPORT_CHUNK_SIZE = 2000
+
+# Read replicas for the blog-views/top/performance/query endpoints (aliases in
+# DATABASES). A replica lagging more than ANALYTICS_REPLICA_MAX_LAG seconds is
+# skipped; lag is measured every ANALYTICS_REPLICA_CHECK_INTERVAL seconds.
+# Clients that ingested views read from the primary for
+# ANALYTICS_READ_YOUR_WRITES_SECONDS.
+ANALYTICS_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+ANALYTICS_REPLICA_MAX_LAG = 5.0
+ANALYTICS_REPLICA_CHECK_INTERVAL = 5.0
+ANALYTICS_READ_YOUR_WRITES_SECONDS = 10
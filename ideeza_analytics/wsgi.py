@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ideeza_analytics.settings')
 
 application = get_wsgi_application()
+
+from analytics.shutdown import install_shutdown_hook  # noqa: E402
+
+install_shutdown_hook()
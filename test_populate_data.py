@@ -10,6 +10,8 @@ django.setup()
 
 from django.contrib.auth.models import User
 from analytics.models import Blog, BlogView
+from analytics.countries import get_ids
+from analytics.ingestion import store_views
 
 usernames = ['alice', 'bob', 'charlie', 'diana', 'eve', 'frank', 'grace', 'henry']
 blog_templates = [
@@ -54,6 +56,7 @@ def create_test_users():
 
 def create_test_blogs(users):
     blogs = []
+    country_ids = get_ids(countries, create=True)
     for i, template in enumerate(blog_templates):
         author = random.choice(users)
         country = random.choice(countries)
@@ -66,7 +69,7 @@ def create_test_blogs(users):
             title=f"{template['title']} #{i+1}",
             content=template['content'],
             author=author,
-            country=country,
+            country_id=country_ids.get(country),
             created_at=created_time
         )
         blogs.append(blog)
@@ -75,7 +78,9 @@ def create_test_blogs(users):
 
 def create_test_views(blogs, users):
     view_countries = ['USA', 'Canada', 'UK', 'Germany', 'France', 'Japan', 'Australia', 'India', 'Brazil', 'China']
+    country_ids = get_ids(view_countries, create=True)
     total_views = 0
+    views = []
     
     for blog in blogs:
         num_views = random.randint(50, 500)
@@ -114,16 +119,17 @@ def create_test_views(blogs, users):
             except:
                 view_time_tz = view_time
             
-            BlogView.objects.create(
+            views.append(BlogView(
                 blog=blog,
                 viewer=viewer,
-                viewer_country=country,
+                viewer_country_id=country_ids[country],
                 viewed_at=view_time_tz
-            )
+            ))
         
         print(f"{num_views} views for: {blog.title}")
         total_views += num_views
     
+    store_views(views)
     print(f"Total views: {BlogView.objects.count()}")
     create_date_test_views(blogs, users)
 
@@ -137,6 +143,8 @@ def create_date_test_views(blogs, users):
         ('2024-01-06', 'Japan'),
         ('2024-01-07', 'Australia'),
     ]
+    views = []
+    country_ids = get_ids([country for _, country in test_dates], create=True)
     
     for date_str, country in test_dates:
         date_obj = datetime.strptime(date_str, '%Y-%m-%d')
@@ -144,13 +152,14 @@ def create_date_test_views(blogs, users):
         
         for blog in random.sample(blogs, 3):
             for _ in range(random.randint(5, 20)):
-                BlogView.objects.create(
+                views.append(BlogView(
                     blog=blog,
                     viewer=random.choice(users + [None]),
-                    viewer_country=country,
+                    viewer_country_id=country_ids[country],
                     viewed_at=date_obj + timedelta(hours=random.randint(9, 17))
-                )
+                ))
     
+    store_views(views)
     print("Test date views created")
 
 def check_tz_data():